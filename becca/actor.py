@@ -14,7 +14,7 @@ class Actor(object):
     current active features, goals can be chosen in order to reach
     a desired feature or to maximize reward.
     """
-    def __init__(self, n_features, brain):
+    def __init__(self, n_features, brain, sparse_voting=False):
         """
         Get the Model set up by allocating its variables.
 
@@ -22,6 +22,11 @@ class Actor(object):
         ----------
         brain : Brain
         n_features : int
+        sparse_voting : boolean
+            If True, only the features in the goal collection are
+            visited when calculating the goal votes. The votes are
+            the same either way, but when few goals are active
+            this is much faster for large numbers of features.
         """
         # n_features : int
         #     The maximum number of features.
@@ -35,6 +40,10 @@ class Actor(object):
 
         self.goal_decay_rate = .2
 
+        # sparse_voting : boolean
+        #     See the parameter above.
+        self.sparse_voting = sparse_voting
+
     def fulfill(self, feature_activities):
         """
         When a feature is active, goals associated with it are fulfilled.
@@ -80,17 +89,26 @@ class Actor(object):
         self.goal_collection *= 1 - self.goal_decay_rate
         # Choose one goal at each time step, the feature with
         # the largest vote.
-        goal_votes = nb.calculate_goal_votes(
-            conditional_curiosities,
-            conditional_predictions,
-            conditional_rewards,
-            self.goal_collection,
-        )
+        if self.sparse_voting:
+            goal_votes = nb.calculate_goal_votes_sparse(
+                np.where(self.goal_collection > 0.)[0],
+                conditional_curiosities,
+                conditional_predictions,
+                conditional_rewards,
+                self.goal_collection,
+            )
+        else:
+            goal_votes = nb.calculate_goal_votes(
+                conditional_curiosities,
+                conditional_predictions,
+                conditional_rewards,
+                self.goal_collection,
+            )
 
         # self.previous_feature_goals = self.feature_goal_activities
         goals = np.zeros(self.n_features)
         max_vote = np.max(goal_votes)
-        matches = np.where(goals == max_vote)[0]
+        matches = np.where(goal_votes == max_vote)[0]
         # If there is a tie, randomly select between them.
         i_goal = matches[np.argmax(
             np.random.random_sample(matches.size))]
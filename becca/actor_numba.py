@@ -50,3 +50,55 @@ def calculate_goal_votes(
     # still unfulfilled.
     goal_votes *= 1 - goal_collection
     return goal_votes
+
+
+@jit(nopython=True)
+def calculate_goal_votes_sparse(
+    i_active_goals,
+    conditional_curiosities,
+    conditional_predictions,
+    conditional_rewards,
+    goal_collection,
+):
+    """
+    Assign each goal a value, visiting only the features with goals.
+
+    This gives the same votes as calculate_goal_votes. Features
+    that aren't in the goal collection add nothing to the value of a goal,
+    so they are skipped. The cost grows with the number of features
+    in the goal collection, rather than with the number of features.
+
+    Parameters
+    ----------
+    i_active_goals: array of ints
+        The indices of the non-zero elements of goal_collection.
+    conditional_predictions: 2D array of floats
+    conditional_curiosities,
+    conditional_rewards,
+    goal_collection: array of floats
+
+    Returns
+    -------
+    goal_votes: array of floats
+        The votes for each feature as the next goal.
+    """
+    n_goals = conditional_predictions.shape[0]
+    goal_votes = np.zeros(n_goals)
+
+    for i_goal in range(n_goals):
+        sum_value = 0.
+        for i_feature in i_active_goals:
+            sum_value += (conditional_predictions[i_goal, i_feature] *
+                          goal_collection[i_feature])
+        feature_value = 1 - 1 / (1 + sum_value)
+
+        goal_votes[i_goal] = (
+            conditional_rewards[i_goal] +
+            conditional_curiosities[i_goal] +
+            feature_value)
+
+    # Avoid selecting goals that have been recently selected and are
+    # still unfulfilled.
+    for i_feature in i_active_goals:
+        goal_votes[i_feature] *= 1 - goal_collection[i_feature]
+    return goal_votes
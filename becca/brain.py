@@ -12,6 +12,7 @@ from becca.postprocessor import Postprocessor
 from becca.featurizer import Featurizer
 from becca.model import Model
 from becca.actor import Actor
+from becca.planner import Planner
 import becca.viz as viz
 
 
@@ -30,10 +31,16 @@ class Brain(object):
         backup_interval=int(2**20),
         brain_name='test_brain',
         debug=True,
+        dtype=np.float64,
+        hysteresis=0,
         log_directory=None,
         n_actions=4,
         n_features=64,
         n_sensors=4,
+        planning=False,
+        pressure_threshold=None,
+        reselection_interval=1,
+        sparse_voting=False,
         timestep=0,
         visualize_interval=int(2**18),
     ):
@@ -49,6 +56,14 @@ class Brain(object):
             A descriptive string identifying the brain.
         debug: boolean
             Print informative error messages?
+        dtype: numpy dtype
+            The floating point type of the model's arrays.
+            np.float32 halves the model's memory use compared to
+            the default np.float64. See Model.
+        hysteresis: int
+            The number of time steps for which a newly selected
+            feature or ziptie cable is protected from being swapped out.
+            See InputFilter.
         log_directory : str
             The full path name to a directory where information and
             backups for the world can be stored and retrieved.
@@ -63,6 +78,25 @@ class Brain(object):
             If this is smaller, Becca will run faster. If it is larger
             Becca will have more capacity to learn. It's an important
             input for determining performance.
+        planning: boolean
+            If True, goals are chosen by looking several steps ahead
+            with a Planner, rather than just one step ahead.
+            See Planner.
+        pressure_threshold: float
+            If not None, the model's features and the zipties' cables
+            are also reselected whenever a candidate's bench pressure
+            climbs above this. See InputFilter.
+        reselection_interval: int
+            How often, in time steps, candidates are considered for
+            swapping with the model's features and the zipties' cables.
+            Each swap resets everything that depends on the input
+            swapped out. Reselecting less often gathers the resets
+            into fewer, larger batches. See InputFilter.
+        sparse_voting: boolean
+            If True, the actor only visits the features with active
+            goals when voting on the next goal. The votes are the same,
+            but this is much faster for large numbers of features.
+            See Actor.
         timestep: int
             The age of the brain in discrete time steps.
         visualize_interval: int
@@ -115,7 +149,10 @@ class Brain(object):
         # features from the inputs.
         self.featurizer = Featurizer(
             debug=self.debug,
+            hysteresis=hysteresis,
             n_inputs=self.n_features,
+            pressure_threshold=pressure_threshold,
+            reselection_interval=reselection_interval,
             threshold=1e3,
         )
         # The model builds sequences of features and goals and reward
@@ -123,12 +160,27 @@ class Brain(object):
         self.model = Model(
             brain=self,
             debug=self.debug,
+            dtype=dtype,
+            hysteresis=hysteresis,
             n_features=self.n_features,
+            pressure_threshold=pressure_threshold,
+            reselection_interval=reselection_interval,
         )
 
         # The actor takes conditional predictions from the model and 
         # uses them to choose new goals.
-        self.actor = Actor(self.n_features, self)
+        self.actor = Actor(
+            self.n_features,
+            self,
+            sparse_voting=sparse_voting,
+        )
+
+        # The planner chains the model's sequences together to find
+        # the value of each goal several steps ahead.
+        if planning:
+            self.planner = Planner(self.model)
+        else:
+            self.planner = None
 
         self.timestep = timestep
         self.visualize_interval = visualize_interval
@@ -191,6 +243,37 @@ class Brain(object):
             allows the brain to learn most effectively how to interact
             with the world to obtain more reward.
         """
+        feature_activities = self.sense(sensors, reward)
+        (conditional_predictions,
+            conditional_rewards,
+            conditional_curiosities
+        ) = self.model.step(feature_activities, reward)
+        actions = self.act(
+            conditional_predictions,
+            conditional_rewards,
+            conditional_curiosities,
+        )
+        self.learn(self.model.calculate_fitness())
+        return actions
+
+    def sense(self, sensors, reward):
+        """
+        Take sensor and reward data in and find the feature activities.
+
+        This is the part of sense_act_learn that comes before
+        the model step.
+
+        Parameters
+        ----------
+        sensors : array of floats
+        reward : float
+            See sense_act_learn.
+
+        Returns
+        -------
+        feature_activities : array of floats
+            The feature candidates to pass to the model.
+        """
         self.timestep += 1
 
         # Calculate the "mood" of the agent.
@@ -201,10 +284,35 @@ class Brain(object):
             self.previous_commands, sensors)
 
         feature_activities = self.featurizer.featurize(input_activities)
-        (conditional_predictions,
-            conditional_rewards,
-            conditional_curiosities
-        ) = self.model.step(feature_activities, reward)
+        return feature_activities
+
+    def act(
+        self,
+        conditional_predictions,
+        conditional_rewards,
+        conditional_curiosities,
+    ):
+        """
+        Use the model's predictions to choose goals and actions.
+
+        This is the part of sense_act_learn that comes after
+        the model step.
+
+        Parameters
+        ----------
+        conditional_predictions : 2D array of floats
+        conditional_rewards,
+        conditional_curiosities : array of floats
+            The predictions returned by Model.step.
+
+        Returns
+        -------
+        actions : array of floats
+            See sense_act_learn.
+        """
+        if self.planner is not None:
+            conditional_rewards = self.planner.plan(
+                self.model.feature_activities)
         feature_goals, i_goal = self.actor.choose(
             conditional_predictions=conditional_predictions,
             conditional_rewards=conditional_rewards,
@@ -222,26 +330,130 @@ class Brain(object):
             self.postprocessor.convert_to_actions(
                 input_goals[:self.n_commands]))
 
+        # Create a set of random actions.
+        # This is occasionally helpful when debugging.
+        take_random_actions = False
+        if take_random_actions:
+            self.actions = self.random_actions()
+
+        return self.actions
+
+    def learn(self, candidate_fitness):
+        """
+        Update the inputs to the featurizer and the model.
+
+        This is the last part of sense_act_learn.
+
+        Parameters
+        ----------
+        candidate_fitness : array of floats
+            The fitness of the model's feature candidates,
+            as returned by Model.calculate_fitness.
+        """
         # Update the inputs in a pair of top-down/bottom-up passes.
         # Top-down
-        candidate_fitness = self.model.calculate_fitness()
         self.featurizer.calculate_fitness(candidate_fitness)
         # Bottom-up
         candidate_resets = self.featurizer.update_inputs()
         feature_resets = self.model.update_inputs(candidate_resets)
         self.actor.reset(feature_resets)
-
-        # Create a set of random actions.
-        # This is occasionally helpful when debugging.
-        take_random_actions = False
-        if take_random_actions:
-            self.actions = self.random_actions()
+        if self.planner is not None:
+            self.planner.reset(feature_resets)
 
         # Periodically back up the brain.
         if (self.timestep % self.backup_interval) == 0:
             self.backup()
 
-        return self.actions
+    def learn_from_log(self, sensors_array, rewards_array, actions_array):
+        """
+        Learn from a recorded run, replaying the actions that were taken.
+
+        Each time step goes through the same sensing and learning as
+        sense_act_learn, but instead of choosing goals and sampling
+        actions, the recorded actions are used.
+        The goals are the model features of the commands
+        that make up those actions.
+
+        Replaying is faster than running live only by the work it skips.
+        The model's predictions are only needed for choosing goals,
+        so they aren't made, and there is no goal selection, planning
+        or action sampling. The steps can't be batched across the log,
+        though. The preprocessor, featurizer and model all learn as
+        they go, and each step depends on what was learned on the one
+        before: the discretizers' categories, the zipties' bundles,
+        the filters' input selections, and the model's prefix
+        activities. Batching them would change what is learned.
+
+        Parameters
+        ----------
+        sensors_array : 2D array of floats
+            The sensor values from each time step, one time step per row.
+        rewards_array : array of floats
+            The reward from each time step.
+        actions_array : 2D array of floats
+            The actions taken on each time step, one time step per row,
+            in response to that time step's sensors and reward.
+            There should be one column per action.
+            All three arrays should have the same number of time steps.
+        """
+        actions_array = np.asarray(actions_array, dtype=float)
+        n_steps = len(sensors_array)
+        if len(rewards_array) != n_steps or actions_array.shape[0] != n_steps:
+            raise ValueError(
+                'The sensors, rewards and actions must all have '
+                'the same number of time steps.')
+        if actions_array.ndim != 2 or actions_array.shape[1] != self.n_actions:
+            raise ValueError(
+                'The actions must have one column for each of the brain\'s '
+                '{0} actions.'.format(self.n_actions))
+
+        # Convert all the actions at once, rather than one step at a time.
+        commands_array = self.postprocessor.convert_to_commands(
+            actions_array)
+        for sensors, reward, commands, actions in zip(
+                sensors_array, rewards_array, commands_array, actions_array):
+            feature_activities = self.sense(sensors, reward)
+            self.model.step(feature_activities, reward, predict=False)
+
+            feature_goals, i_goal = self.find_command_goals(commands)
+            self.model.update_goals(feature_goals, i_goal)
+            self.previous_commands = commands
+            self.actions = np.asarray(actions, dtype=float)
+
+            self.learn(self.model.calculate_fitness())
+
+    def find_command_goals(self, commands):
+        """
+        Find the model features that correspond to a set of commands.
+
+        Parameters
+        ----------
+        commands : array of floats
+            Discretized commands, as returned by the postprocessor.
+
+        Returns
+        -------
+        feature_goals : array of floats
+            The model's goals, ones for the features of the commands
+            and zeros elsewhere.
+        i_goal : int
+            The index of one of those features, the one
+            that gets credit for the upcoming reward.
+            If none of the commands is a model feature yet, this is -1.
+        """
+        feature_goals = np.zeros(self.model.n_features)
+        i_goal = -1
+        # Commands are the first of the preprocessor's inputs. Follow each
+        # through the featurizer and the model's filter to its feature.
+        # The first two model features are internal to the model.
+        for i_command in np.where(commands > 0)[0]:
+            i_candidate = self.featurizer.mapping_to_features[0][i_command]
+            i_input = self.model.filter.input_mapping[i_candidate]
+            if i_input >= 0:
+                feature_goals[i_input + 2] = 1.
+                if i_goal == -1:
+                    i_goal = i_input + 2
+        return feature_goals, i_goal
 
     def random_actions(self):
         """
@@ -3,6 +3,8 @@ The Featurizer class.
 """
 
 from __future__ import print_function
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 import becca.featurizer_viz as viz
@@ -19,7 +21,15 @@ class Featurizer(object):
     def __init__(
         self,
         debug=False,
+        hysteresis=0,
+        learning=True,
+        learning_interval=1,
+        max_n_levels=4,
         n_inputs=None,
+        n_threads=None,
+        pipelined=False,
+        pressure_threshold=None,
+        reselection_interval=1,
         threshold=None,
     ):
         """
@@ -28,9 +38,48 @@ class Featurizer(object):
         Parameters
         ---------
         debug: boolean
+        hysteresis : int
+            The number of calls to update_inputs for which a candidate
+            newly assigned to a ziptie cable is protected from being
+            swapped out. See InputFilter.
+        learning : boolean
+            If False, the zipties don't gather energy or create new bundles.
+            Their existing bundles are still used. This is handy for
+            brains that have finished learning and are only being run.
+            It can also be changed at any time through self.learning.
+        learning_interval : int
+            How often each ziptie checks whether to create new bundles,
+            in time steps. See Ziptie.learning_interval.
+        max_n_levels : int
+            The largest number of Zipties that can be stacked.
         n_inputs : int
             The number of inputs (cables) that each Ziptie will be
             equipped to handle.
+        n_threads : int
+            The number of threads that the levels are run on
+            when pipelined. If None, one per level.
+        pipelined : boolean
+            If True, each level learns from the bundle activities that
+            the level below it produced on the previous time step,
+            rather than on the current one. The levels no longer
+            depend on each other within a time step, and are run
+            in parallel on a pool of threads. Each level sees roughly
+            what it would otherwise, but one time step later than
+            the level below it. The bundle activities of level k lag
+            the inputs by k time steps. The lag isn't exact:
+            bundles and inputs that update_inputs removes between
+            steps are still present in the activities the next level
+            up consumes on the following step.
+            Call close() when done with a pipelined Featurizer
+            to release its threads.
+        pressure_threshold : float
+            If not None, each level's cables are also reselected whenever
+            a candidate's bench pressure climbs above this.
+            See InputFilter.
+        reselection_interval : int
+            How often, in calls to update_inputs, each level's filter
+            considers swapping candidates with the cables in use.
+            See InputFilter.
         threshold : float
             See Ziptie.nucleation_threshold
         """
@@ -49,33 +98,69 @@ class Featurizer(object):
         #     The maximum numbers of inputs and bundles
         #     that this level can accept.
         self.n_inputs = n_inputs
-
-        # TODO:
-        # Move input filter and ziptie creation into step,
-        # along with clustering.
-
-        # filter: InputFilter
+        # learning: boolean
+        # learning_interval: int
+        #     See the learning and learning_interval parameters above.
+        self.learning = learning
+        self.learning_interval = learning_interval
+        # max_n_levels: int
+        #     See the max_n_levels parameter above.
+        self.max_n_levels = max_n_levels
+        # threshold: float
+        #     See the threshold parameter above. It is used for
+        #     each new Ziptie as the stack grows.
+        self.threshold = threshold
+        # hysteresis: int
+        # pressure_threshold: float
+        # reselection_interval: int
+        #     See the parameters above. They are used for
+        #     each new InputFilter as the stack grows.
+        self.hysteresis = hysteresis
+        self.pressure_threshold = pressure_threshold
+        self.reselection_interval = reselection_interval
+
+        # filters: list of InputFilters
         #     Reduce the possibly large number of inputs to the number
-        #     of cables that the Ziptie can handle. Each Ziptie will
-        #     have its own InputFilter.
-        self.filter = InputFilter(
-            n_inputs = self.n_inputs,
-            name='ziptie_0',
-            debug=self.debug,
-        )
-        # ziptie: Ziptie
-        #     The ziptie is an instance of the Ziptie algorithm class,
+        #     of cables that the Ziptie can handle. Each Ziptie
+        #     has its own InputFilter.
+        # zipties: list of Zipties
+        #     Each ziptie is an instance of the Ziptie algorithm class,
         #     an incremental method for bundling inputs. Check out
         #     ziptie.py for a complete description. Zipties note which
         #     inputs tend to be co-active and creates bundles of them.
         #     This feature creation mechanism results in l0-sparse
         #     features, which sparsity helps keep Becca fast.
-        self.ziptie = Ziptie(
-            n_cables=self.n_inputs,
-            threshold=threshold,
-            debug=self.debug)
-
-        # mapping_to_features: list of lists
+        #     The zipties are stacked. The bundles of each ziptie
+        #     are the candidate cables for the one above it.
+        #     The stack starts with a single ziptie and grows
+        #     in add_level().
+        self.filters = []
+        self.zipties = []
+        self.add_level()
+
+        # cable_pools_active: list of booleans
+        #     Whether each level had any cable activity on the
+        #     previous time step. A level whose cables were inactive
+        #     then and are inactive now has nothing to learn,
+        #     and is skipped.
+        self.cable_pools_active = [False]
+
+        # pipelined: boolean
+        # n_threads: int
+        #     See the pipelined and n_threads parameters above.
+        self.pipelined = pipelined
+        self.n_threads = n_threads
+        # executor: ThreadPoolExecutor
+        #     The pool of threads that levels are run on when pipelined.
+        #     It is created on the first pipelined time step.
+        self.executor = None
+        # cable_pools: list of arrays of floats
+        #     The candidate activities for each level from the most
+        #     recent time step. When pipelined, these are the inputs
+        #     to each level above the first on the next time step.
+        self.cable_pools = []
+
+        # mapping_to_features: list of arrays of ints
         #     Tracks which feature candidate index corresponds to each
         #     ziptie input. The first level list corresponds to
         #         0: inputs to ziptie level 0
@@ -84,9 +169,11 @@ class Featurizer(object):
         #         2: inputs to ziptie level 2
         #               (also bundles from ziptie level 1)
         #         ...
-        #     The second level list index of the feature candidate that
-        #     each input maps to.
-        self.mapping_to_features = [[]]
+        #     Each array holds the index of the feature candidate that
+        #     each input maps to. They only grow when new candidates
+        #     appear, so that mapping to and from the feature pool
+        #     can be done with a single fancy-indexing operation per level.
+        self.mapping_to_features = [np.zeros(0, dtype=np.int64)]
         # mapping_from_features: list of 2-tuples,
         #     The inverse of mapping_to_features. Tracks which input
         #    corresponds which each feature candidate.
@@ -96,22 +183,78 @@ class Featurizer(object):
         # If mapping_from_features[i] = (j, k)
         # then mapping_to_features[j, k] = i
 
+    def __getstate__(self):
+        """
+        Leave out the pool of threads when pickling.
+        """
+        state = self.__dict__.copy()
+        state['executor'] = None
+        return state
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """
+        Shut down the pool of threads used when pipelined, if there is one.
+
+        It is created again if the Featurizer is used after this.
+        """
+        executor = getattr(self, 'executor', None)
+        if executor is not None:
+            executor.shutdown(wait=True)
+            self.executor = None
+
+    def add_level(self):
+        """
+        Add another ziptie, with its own input filter, to the top of the stack.
+        """
+        name = 'ziptie_{0}'.format(len(self.zipties))
+        self.filters.append(InputFilter(
+            n_inputs=self.n_inputs,
+            name=name,
+            debug=self.debug,
+            hysteresis=self.hysteresis,
+            pressure_threshold=self.pressure_threshold,
+            reselection_interval=self.reselection_interval,
+        ))
+        self.zipties.append(Ziptie(
+            learning_interval=self.learning_interval,
+            n_cables=self.n_inputs,
+            name=name,
+            threshold=self.threshold,
+            debug=self.debug,
+        ))
+        if self.debug:
+            print('    {0} added'.format(name))
+
     def calculate_fitness(self, feature_fitness):
         """
         Find the predictive fitness of each of cables in each ziptie.
 
+        Fitness is passed down from the top of the stack.
+        A candidate is as fit as the fittest of the features
+        it takes part in, whether directly or through a bundle.
+
         Parameters
         ----------
         candidate_fitness: array of floats
         """
-        # TODO: Handle a hierarchy of zipties and input filters
-        # Include upstream fitness
         all_input_fitness = self.map_from_feature_pool(feature_fitness)
 
-        cable_fitness = self.ziptie.project_bundle_activities(
-            all_input_fitness[1])
-        input_fitness = np.maximum(cable_fitness, all_input_fitness[0])
-        self.filter.update_fitness(input_fitness)
+        for i_level in range(len(self.zipties) - 1, -1, -1):
+            cable_fitness = self.zipties[i_level].project_bundle_activities(
+                all_input_fitness[i_level + 1])
+            level_filter = self.filters[i_level]
+            level_filter.update_fitness(cable_fitness)
+            # Include the fitness of the candidates as features.
+            n_candidates = min(level_filter.n_candidates,
+                               all_input_fitness[i_level].size)
+            input_fitness = np.maximum(
+                level_filter.candidate_fitness[:n_candidates],
+                all_input_fitness[i_level][:n_candidates])
+            level_filter.candidate_fitness[:n_candidates] = input_fitness
+            all_input_fitness[i_level][:n_candidates] = input_fitness
 
     def update_inputs(self):
         """
@@ -123,14 +266,17 @@ class Featurizer(object):
         resets: array of ints
             The feature candidate indices that are being reset. 
         """
-        filter_resets = self.filter.update_inputs()
-        bundle_resets = self.ziptie.update_inputs(filter_resets)
         # Leave an empty list of resets for lowest level input.
         # They are always all passed in as feature candidates.
         # They never get reset or swapped out. The model's input filter
         # deals with them.
-        # As other levels are created, append their bundle resets as well.
-        all_resets = [[], bundle_resets]
+        # Each ziptie's bundle resets are the candidate resets
+        # for the level above it.
+        all_resets = [[]]
+        for level_filter, ziptie in zip(self.filters, self.zipties):
+            filter_resets = level_filter.update_inputs(
+                upstream_resets=all_resets[-1])
+            all_resets.append(ziptie.update_inputs(filter_resets))
 
         resets = []
         for i_level, level_resets in enumerate(all_resets):
@@ -151,19 +297,13 @@ class Featurizer(object):
         Returns
         -------
         candidate_values: list of array of floats
+            One array for each level, including the bundles
+            of the top ziptie.
         """
-        candidate_values = [np.zeros(self.n_inputs)]
-        candidate_values.append(np.zeros(self.ziptie.n_bundles))
-         
-        for i_feature, (i_level, i_candidate) in enumerate(
-                self.mapping_from_features):
-            # print('cv', candidate_values,
-            #       'il',   i_level,
-            #        'ic',  i_candidate,
-            #       'fv',   feature_values,
-            #       'if',   i_feature,
-            #         )
-            candidate_values[i_level][i_candidate] = feature_values[i_feature]
+        candidate_values = [feature_values[level_mapping]
+                            for level_mapping in self.mapping_to_features]
+        for _ in range(len(candidate_values), len(self.zipties) + 1):
+            candidate_values.append(np.zeros(0))
         return candidate_values
 
     def map_to_feature_pool(self, candidate_values):
@@ -181,19 +321,23 @@ class Featurizer(object):
         # Check whether the number of candidates has expanded at any level
         # and adapt.
         for _ in range(len(self.mapping_to_features), len(candidate_values)):
-            self.mapping_to_features.append([])
+            self.mapping_to_features.append(np.zeros(0, dtype=np.int64))
         for i_level, ziptie_cable_pool in enumerate(candidate_values):
             # Map any unmapped candidates to features.
-            for i_new_candidate in range(len(self.mapping_to_features[i_level]),
-                                     ziptie_cable_pool.size):
-                self.mapping_to_features[i_level].append(
-                    len(self.mapping_from_features))
-                self.mapping_from_features.append((i_level, i_new_candidate))
+            n_mapped = self.mapping_to_features[i_level].size
+            if ziptie_cable_pool.size > n_mapped:
+                n_features = len(self.mapping_from_features)
+                n_new = ziptie_cable_pool.size - n_mapped
+                self.mapping_to_features[i_level] = np.concatenate((
+                    self.mapping_to_features[i_level],
+                    np.arange(n_features, n_features + n_new)))
+                self.mapping_from_features += [
+                    (i_level, i_new_candidate) for i_new_candidate
+                    in range(n_mapped, ziptie_cable_pool.size)]
 
         feature_values = np.zeros(len(self.mapping_from_features))
         for i_level, level_mapping in enumerate(self.mapping_to_features):
-            for i_candidate, i_feature in enumerate(level_mapping):
-                feature_values[i_feature] = candidate_values[i_level][i_candidate]
+            feature_values[level_mapping] = candidate_values[i_level]
 
         return feature_values
 
@@ -210,43 +354,103 @@ class Featurizer(object):
         -------
         feature_pool: array of floats
         """
-        self.ziptie_0_cable_pool = new_candidates
-        cable_activities = self.filter.update_activities(
-            candidate_activities=self.ziptie_0_cable_pool)
+        # cable_pools: list of arrays of floats
+        #     The candidate activities for each level. The bundle
+        #     activities of each ziptie are the candidates for the next.
+        cable_pools = [new_candidates]
+        if self.pipelined:
+            level_candidates = [new_candidates] + self.cable_pools[
+                1:len(self.zipties)]
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.n_threads or self.max_n_levels)
+            cable_pools += list(self.executor.map(
+                self.featurize_level,
+                range(len(self.zipties)),
+                level_candidates,
+            ))
+        else:
+            for i_level in range(len(self.zipties)):
+                cable_pools.append(
+                    self.featurize_level(i_level, cable_pools[i_level]))
+
+        # Once the top ziptie has enough bundles for them to be
+        # bundled in turn, start another level.
+        if (len(self.zipties) < self.max_n_levels and
+                self.zipties[-1].n_bundles > 1):
+            self.add_level()
+            self.cable_pools_active.append(False)
+
+        self.cable_pools = cable_pools
+        self.feature_pool = self.map_to_feature_pool(cable_pools)
 
-        # Incrementally update the bundles in the ziptie.
-        self.ziptie.create_new_bundles()
-        self.ziptie.grow_bundles()
+        return self.feature_pool
 
-        # Run the inputs through the ziptie to find bundle activities
-        # and to learn how to bundle them.
-        ziptie_1_cable_pool = self.ziptie.update_bundles(cable_activities)
+    def featurize_level(self, i_level, candidates):
+        """
+        Learn bundles and calculate bundle activities for a single level.
+
+        Parameters
+        ----------
+        i_level : int
+            The index of the level in the stack.
+        candidates : array of floats
+            The candidate activities for the level.
 
-        all_ziptie_cable_pool = [
-            self.ziptie_0_cable_pool,
-            ziptie_1_cable_pool,
-        ]
+        Returns
+        -------
+        bundle_activities: array of floats
+        """
+        ziptie = self.zipties[i_level]
+        cable_activities = self.filters[i_level].update_activities(
+            candidate_activities=candidates)
+        is_active = np.any(cable_activities > 0.)
+
+        # A ziptie whose cables have been quiet for two time steps
+        # running, and that has no bundle ready to be created,
+        # has nothing to gather or learn. Its bundles are all inactive.
+        # Skipping it keeps deep stacks cheap.
+        is_idle = (
+            not is_active and
+            not self.cable_pools_active[i_level] and
+            ziptie.max_nucleation_energy[0] <=
+            ziptie.nucleation_threshold and
+            ziptie.max_agglomeration_energy[0] <=
+            ziptie.agglomeration_threshold)
+        self.cable_pools_active[i_level] = is_active
+        if is_idle:
+            ziptie.timestep += 1
+            return np.zeros(ziptie.n_bundles)
 
-        self.feature_pool = self.map_to_feature_pool(all_ziptie_cable_pool)
+        # Incrementally update the bundles in the ziptie.
+        if self.learning:
+            ziptie.create_new_bundles()
+            ziptie.grow_bundles()
 
-        return self.feature_pool
+        # Run the inputs through the ziptie to find bundle activities
+        # and to learn how to bundle them.
+        return ziptie.update_bundles(cable_activities)
 
     def defeaturize(self, feature_pool):
         """
         Take a set of feature activities and represent them in candidates.
+
+        Goals are passed down from the top of the stack.
+        Each candidate takes on the larger of its own goal and
+        the goals of the bundles it takes part in.
         """
-        ziptie_0_cable_pool, ziptie_1_cable_pool = (
-            self.map_from_feature_pool(feature_pool))
-        # TODO: iterate over multiple zipties
-        ziptie_0_cables = self.ziptie.project_bundle_activities(
-            ziptie_1_cable_pool)
-        ziptie_0_cable_pool_upstream = self.filter.project_activities(
-            ziptie_0_cables)
-        n_candidates_0 = ziptie_0_cable_pool_upstream.size
-        ziptie_0_cable_pool = np.maximum(
-            ziptie_0_cable_pool[:n_candidates_0],
-            ziptie_0_cable_pool_upstream)
-        return ziptie_0_cable_pool
+        candidate_goals = self.map_from_feature_pool(feature_pool)
+        for i_level in range(len(self.zipties) - 1, -1, -1):
+            cable_goals = self.zipties[i_level].project_bundle_activities(
+                candidate_goals[i_level + 1])
+            upstream_goals = self.filters[i_level].project_activities(
+                cable_goals)
+            n_candidates = min(upstream_goals.size,
+                               candidate_goals[i_level].size)
+            candidate_goals[i_level][:n_candidates] = np.maximum(
+                candidate_goals[i_level][:n_candidates],
+                upstream_goals[:n_candidates])
+        return candidate_goals[0]
 
     def visualize(self, brain, world=None):
         """
@@ -84,4 +84,5 @@ def visualize(featurizer, brain, world):
 
     except:
         print('Featurizer failed to render features.')
-        featurizer.ziptie.visualize()
+        for ziptie in featurizer.zipties:
+            ziptie.visualize()
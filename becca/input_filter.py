@@ -17,15 +17,37 @@ class InputFilter(object):
     much activity they have shown.
     Each ziptie will have one, as will the model.
     """
-    def __init__(self, debug=False, n_inputs=None, name='filter'):
+    def __init__(
+        self,
+        debug=False,
+        hysteresis=0,
+        n_inputs=None,
+        name='filter',
+        pressure_threshold=None,
+        reselection_interval=1,
+    ):
         """
         Parameters
         ----------
         debug: boolean
+        hysteresis: int
+            The number of calls to update_inputs for which a newly
+            assigned candidate is protected from being swapped out.
         n_inputs: int
             The number of inputs that the filter is expected to maintain.
         name: string
             A string that helps to identify this input filter uniquely.
+        pressure_threshold: float
+            If not None, inputs are also reselected whenever a benched
+            candidate's bench pressure climbs above this.
+        reselection_interval: int
+            How often, in calls to update_inputs, candidates are
+            considered for swapping with the inputs in use.
+            Each swap resets an input, and everything downstream
+            that depends on it. Reselecting less often gathers the swaps
+            into fewer, larger batches of resets, which are cheaper
+            to handle in a single pass. Empty inputs are filled and
+            upstream resets are handled on every call regardless.
         """
         self.name = name
         # Check for valid arguments.
@@ -47,6 +69,16 @@ class InputFilter(object):
         #     assigned to. An index of -1 means that\
         #     candidate is unassigned.
         self.input_mapping = -np.ones(self.n_inputs * 2, dtype='int')
+        # i_in_use: array of ints
+        #     The indices of the candidates that are assigned to inputs.
+        # i_inputs_in_use: array of ints
+        #     The input index that each of them is assigned to.
+        # i_benched: array of ints
+        #     The indices of the candidates that are not assigned.
+        #     These are gather and scatter indices for routing
+        #     between candidates and inputs. They are kept in sync with
+        #     input_mapping by update_index_arrays().
+        self.update_index_arrays()
 
         # candidate_fitness: array of floats
         #     The most recently observed predictive fitness
@@ -69,6 +101,28 @@ class InputFilter(object):
         #     the input pool.
         self.pressure_time = 1e5
 
+        # score_barrier: float
+        #     The margin by which a benched candidate's score has to beat
+        #     that of a candidate in use before they are swapped.
+        #     This keeps inputs from being swapped back and forth
+        #     over small differences in score.
+        self.score_barrier = 1e-2
+
+        # hysteresis: int
+        # pressure_threshold: float
+        # reselection_interval: int
+        #     See the parameters above.
+        self.hysteresis = hysteresis
+        self.pressure_threshold = pressure_threshold
+        self.reselection_interval = reselection_interval
+        # n_updates: int
+        #     The number of times update_inputs has been called.
+        self.n_updates = 0
+        # time_assigned: array of ints
+        #     The value of n_updates when each candidate
+        #     was last assigned to an input.
+        self.time_assigned = np.zeros(self.n_inputs * 2, dtype='int')
+
     def update_activities(self, candidate_activities):
         """
         Generate a new set of input activities.
@@ -102,20 +156,17 @@ class InputFilter(object):
             new_bench_pressure[:capacity] = self.bench_pressure
             self.bench_pressure = new_bench_pressure
 
+            new_time_assigned = np.zeros(self.n_candidates * 2, dtype='int')
+            new_time_assigned[:capacity] = self.time_assigned
+            self.time_assigned = new_time_assigned
 
+        self.update_index_arrays()
         input_activities = np.zeros(self.n_inputs)
-        # This for loop is slow, but it's clear. It doesn't cost much.
-        for i, loc in enumerate(self.input_mapping):
-            if loc >= 0:
-                input_activities[loc] = candidate_activities[i]        
+        input_activities[self.i_inputs_in_use] = (
+            candidate_activities[self.i_in_use])
 
         self.cumulative_activities[:self.n_candidates] += candidate_activities
 
-        
-        self.i_in_use = np.where(self.input_mapping >= 0)[0]
-        i_unassigned = np.where(self.input_mapping == -1)[0]
-        self.i_benched = i_unassigned[np.where(
-            i_unassigned < self.n_candidates)]
         self.bench_pressure[self.i_benched] += (
             candidate_activities[self.i_benched] / (tools.epsilon + 
             self.cumulative_activities[self.i_benched] * self.pressure_time))
@@ -135,9 +186,8 @@ class InputFilter(object):
         candidate_activities: array of floats
         """
         candidate_activities = np.zeros(self.n_candidates)
-        for i, loc in enumerate(self.input_mapping):
-            if loc >= 0:
-                candidate_activities[i] = input_activities[loc]
+        candidate_activities[self.i_in_use] = (
+            input_activities[self.i_inputs_in_use])
         return candidate_activities
 
     def update_fitness(self, feature_fitness):
@@ -155,10 +205,8 @@ class InputFilter(object):
         candidate_fitness: array of floats
             The most recently observed predictive fitness of each candidate.
         """
-        # This for loop is slow, but it's clear. It doesn't cost much.
-        for i, loc in enumerate(self.input_mapping):
-            if i >= 0:
-                self.candidate_fitness[i] = feature_fitness[loc]        
+        self.candidate_fitness[self.i_in_use] = (
+            feature_fitness[self.i_inputs_in_use])
         return self.candidate_fitness
 
     def update_inputs(self, upstream_resets=[]):
@@ -179,50 +227,97 @@ class InputFilter(object):
         resets: array of ints
             The indices of the inputs which need to be reset.
         """
-        # Before doing anything else, handle upstream resets.
-        for i_reset in upstream_resets:
-            self.candidate_fitness[i_reset] = 0.
-            self.bench_pressure[i_reset] = 0.
-            self.cumulative_activities[i_reset] = 0.
+        self.n_updates += 1
 
-        resets = []
+        # Before doing anything else, handle upstream resets.
+        upstream_resets = np.asarray(upstream_resets, dtype='int')
+        self.candidate_fitness[upstream_resets] = 0.
+        self.bench_pressure[upstream_resets] = 0.
+        self.cumulative_activities[upstream_resets] = 0.
+        # A reset candidate that is in use keeps its input,
+        # but the input starts over.
+        i_reset_inputs = self.input_mapping[upstream_resets]
+        resets = list(i_reset_inputs[np.where(i_reset_inputs >= 0)])
+
+        # Typically no more than a few candidates are swapped in a
+        # time step. Rather than sorting all the candidates by score,
+        # only the few needed are selected, with argpartition, argmin and
+        # argmax. The scores of candidates that have been moved are
+        # replaced with infinities so that they won't be selected again.
         candidate_score = self.candidate_fitness + self.bench_pressure
-        # Find lowest scoring candidates in use.
-        i_lowest_scoring_in_use = np.argsort(
-            candidate_score[self.i_in_use])[::-1]
-        # Find highest scoring benched candidates.
-        i_highest_scoring_benched = np.argsort(
-            candidate_score[self.i_benched])
-
-        # First fill out any unused inputs with candidates.
-        n_inputs_used = np.max(self.input_mapping) + 1
-        n_inputs_unassigned = self.n_inputs - n_inputs_used
-        i_fill = 0
-        while(n_inputs_unassigned > 0 and
-              i_highest_scoring_benched.size > i_fill):
-            i_in = self.i_benched[i_highest_scoring_benched[i_fill]]
-            self.input_mapping[i_in] = self.n_inputs - n_inputs_unassigned
+        in_use_score = candidate_score[self.i_in_use]
+        benched_score = candidate_score[self.i_benched]
+
+        # First fill out any unused inputs with the highest scoring
+        # benched candidates. Inputs are always assigned in order,
+        # so the number in use is also the next one to assign.
+        n_inputs_used = self.i_in_use.size
+        n_fill = min(self.n_inputs - n_inputs_used, benched_score.size)
+        if n_fill > 0:
+            i_fill = np.argpartition(-benched_score, n_fill - 1)[:n_fill]
+            i_fill = i_fill[np.argsort(-benched_score[i_fill], kind='stable')]
+            self.input_mapping[self.i_benched[i_fill]] = np.arange(
+                n_inputs_used, n_inputs_used + n_fill)
+            self.time_assigned[self.i_benched[i_fill]] = self.n_updates
             # No need to specify resets.
             # There's no previous activity to clear.
-            n_inputs_unassigned -= 1
-            i_fill += 1
+            benched_score[i_fill] = -np.inf
+
+        if not self.is_reselection_step():
+            self.update_index_arrays()
+            return resets
 
-        i_highest_scoring_benched = i_highest_scoring_benched[i_fill:]
+        # Inputs that were assigned recently are left in place.
+        is_protected = (self.n_updates - self.time_assigned[self.i_in_use] <
+                        self.hysteresis)
+        in_use_score[is_protected] = np.inf
 
-        # Then swap out inputs and append to resets as long as 
+        # Then swap out inputs and append to resets as long as
         # the difference is greater than a threshold.
-        i_swap = 0
-        while (i_lowest_scoring_in_use.size > i_swap and
-                i_highest_scoring_benched.size > i_swap):
-            i_out = self.i_in_use[i_lowest_scoring_in_use[i_swap]]
-            i_in = self.i_benched[i_highest_scoring_benched[i_swap]]
-            if (candidate_score[i_in] >
-                    candidate_score[i_out] + self.score_barrier):
+        while in_use_score.size > 0 and benched_score.size > 0:
+            j_out = np.argmin(in_use_score)
+            j_in = np.argmax(benched_score)
+            if benched_score[j_in] > in_use_score[j_out] + self.score_barrier:
+                i_out = self.i_in_use[j_out]
+                i_in = self.i_benched[j_in]
                 self.input_mapping[i_in] = self.input_mapping[i_out]
                 self.input_mapping[i_out] = -1
-                resets.append(self.mapping[i_in])
+                self.time_assigned[i_in] = self.n_updates
+                resets.append(self.input_mapping[i_in])
+                in_use_score[j_out] = np.inf
+                benched_score[j_in] = -np.inf
             else:
                 break
-            i_swap += 1
 
+        self.update_index_arrays()
         return resets
+
+    def is_reselection_step(self):
+        """
+        Decide whether to consider swapping inputs on this call.
+
+        Returns
+        -------
+        is_reselection_step: boolean
+        """
+        if self.n_updates % self.reselection_interval == 0:
+            return True
+        if self.pressure_threshold is not None and self.i_benched.size > 0:
+            return (np.max(self.bench_pressure[self.i_benched]) >
+                    self.pressure_threshold)
+        return False
+
+    def update_index_arrays(self):
+        """
+        Bring the routing index arrays up to date with input_mapping.
+
+        Returns
+        -------
+        None, but updates class members
+        i_in_use, i_inputs_in_use, i_benched: arrays of ints
+        """
+        self.i_in_use = np.where(self.input_mapping >= 0)[0]
+        self.i_inputs_in_use = self.input_mapping[self.i_in_use]
+        i_unassigned = np.where(self.input_mapping == -1)[0]
+        self.i_benched = i_unassigned[np.where(
+            i_unassigned < self.n_candidates)]
@@ -4,11 +4,15 @@ The Model class.
 
 from __future__ import print_function
 
+import numba
 import numpy as np
 
 from becca.input_filter import InputFilter
 import becca.model_numba as nb
+import becca.model_numba_parallel as nb_parallel
 import becca.model_viz as viz
+from becca.prediction_index import PredictionIndex
+from becca.sparse_sequences import SparseSequences
 
 
 class Model(object):
@@ -36,7 +40,7 @@ class Model(object):
     current active features, goals can be chosen in order to reach
     a desired feature or to maximize reward.
 
-    Planning. (yet to be implemented)
+    Planning. (performed by the Planner)
     Feature-goal-feature tuples can
     be chained together to formulate multi-step plans while maximizing
     reward and probability of successfully reaching the goal.
@@ -45,7 +49,16 @@ class Model(object):
         self,
         brain=None,
         debug=False,
+        dtype=np.float64,
+        fused=False,
+        hysteresis=0,
+        incremental_fitness=True,
+        incremental_predictions=False,
         n_features=0,
+        n_threads=None,
+        pressure_threshold=None,
+        reselection_interval=1,
+        storage='dense',
     ):
         """
         Get the Model set up by allocating its variables.
@@ -55,10 +68,87 @@ class Model(object):
         brain : Brain
             The Brain to which this model belongs. Some of the brain's
             parameters are useful in initializing the model.
+        dtype : numpy dtype
+            The floating point type of the model's arrays. Using
+            np.float32 rather than the default np.float64 halves the
+            memory the model takes, and speeds up the kernels.
+            Occurrences are fractional, so they stay floating point.
+        fused : boolean
+            If True, update the prefixes and make the conditional
+            predictions in a single pass through the prefix arrays,
+            rather than in seven separate passes. The results are
+            identical either way. This isn't a general speed-up.
+            The fused pass only saves time once the prefix arrays
+            are too large to stay in cache, from about 512 features,
+            and even then the prefix updates are a small part of
+            each step. See benchmarks/model_numba_benchmark.py.
+        hysteresis : int
+            The number of calls to update_inputs for which a newly
+            assigned feature is protected from being swapped out.
+            See InputFilter.
+        incremental_fitness : boolean
+            If True, keep a running maximum of the sequence counts
+            following each prefix, updating it as sequences are observed.
+            If False, find the maximum by scanning all the sequences
+            each time fitness is calculated.
+        incremental_predictions : boolean
+            If True, keep an index of the sequences that are able to
+            make predictions, and only visit those when predicting
+            features. Prediction cost then follows the number of active
+            features, rather than growing with n_features**3.
         n_features : int
             The total number of features allowed in this model.
+        n_threads : int, optional
+            If given, use multi-threaded versions of the kernels
+            with this many threads. See model_numba_parallel.py.
+            The sparse storage, indexed prediction and fused kernels
+            are single-threaded regardless. If None (default),
+            all the kernels run single-threaded.
+        pressure_threshold : float, optional
+            If given, the features are also reselected whenever
+            a candidate's bench pressure climbs above this.
+            See InputFilter.
+        reselection_interval : int
+            How often, in calls to update_inputs, candidates are
+            considered for swapping with the model's features.
+            Each swap resets a feature, clearing its slabs of the
+            sequence arrays. Reselecting less often gathers the resets
+            into fewer, larger batches. See InputFilter.
+        storage : str
+            How to store sequence occurrences, either 'dense' or 'sparse'.
+            Dense storage is a 3D array that takes memory proportional
+            to n_features**3. Sparse storage is a hash table that takes
+            memory proportional to the number of distinct sequences
+            observed. Sparse storage is the better choice for large models.
         """
         self.debug = debug
+        # dtype : numpy dtype
+        #     See the dtype parameter above.
+        self.dtype = np.dtype(dtype)
+        if storage not in ('dense', 'sparse'):
+            raise ValueError(
+                'storage must be "dense" or "sparse", not "{0}"'.format(
+                    storage))
+        # storage : str
+        #     See the storage parameter above.
+        self.storage = storage
+        # fused : boolean
+        #     See the fused parameter above.
+        self.fused = fused
+        # n_threads : int
+        #     See the n_threads parameter above. It can't be more than
+        #     the number of threads numba was started with.
+        if n_threads is None:
+            self.n_threads = None
+        else:
+            self.n_threads = max(
+                1, min(n_threads, numba.config.NUMBA_NUM_THREADS))
+        # incremental_fitness : boolean
+        #     See the incremental_fitness parameter above.
+        self.incremental_fitness = incremental_fitness
+        # incremental_predictions : boolean
+        #     See the incremental_predictions parameter above.
+        self.incremental_predictions = incremental_predictions
 
         # n_features : int
         #     The maximum number of features that the model can expect
@@ -73,22 +163,26 @@ class Model(object):
         #     Features are characterized by their
         #     activity, that is, their level of activation at each time step.
         #     Activity can vary between zero and one.
-        self.previous_feature_activities = np.zeros(self.n_features)
-        self.feature_activities = np.zeros(self.n_features)
+        self.previous_feature_activities = np.zeros(
+            self.n_features, dtype=self.dtype)
+        self.feature_activities = np.zeros(self.n_features, dtype=self.dtype)
         # feature_fitness : array of floats
         #     The predictive fitness of each feature is regularly updated.
         #     This helps determine which features to keep and which to
         #     swap out for new candidates.
-        self.feature_fitness = np.zeros(self.n_features)
+        self.feature_fitness = np.zeros(self.n_features, dtype=self.dtype)
 
         # filter: InputFilter
         #     Reduce the possibly large number of inputs to the number
         #     of cables that the Ziptie can handle. Each Ziptie will
         #     have its own InputFilter.
         self.filter = InputFilter(
-            n_inputs = self.n_features,
+            n_inputs=n_features,
             name='model',
             debug=self.debug,
+            hysteresis=hysteresis,
+            pressure_threshold=pressure_threshold,
+            reselection_interval=reselection_interval,
         )
 
         # feature_goals,
@@ -98,7 +192,7 @@ class Model(object):
         #     They are temporary incentives, used for planning and
         #     goal selection. These can vary between zero and one.
         #     Votes are used to help choose a new goal each time step.
-        self.goal_activities = np.zeros(self.n_features)
+        self.goal_activities = np.zeros(self.n_features, dtype=self.dtype)
         # self.previous_feature_goals = np.zeros(self.n_features)
         # self.feature_goal_votes = np.zeros(self.n_features)
 
@@ -117,20 +211,39 @@ class Model(object):
         #         index 2 : feature_2 (future)
         #     The prefix arrays can be 2D because they lack
         #     information about the resulting feature.
+        #     With sparse storage, sequence_occurrences is a
+        #     SparseSequences instead of a 3D array.
         _2D_size = (self.n_features, self.n_features)
         _3D_size = (self.n_features, self.n_features, self.n_features)
         # Making believe that everything has occurred once in the past
         # makes it easy to believe that it might happen again in the future.
-        self.conditional_rewards = np.zeros(self.n_features)
-        self.conditional_curiosities = np.zeros(self.n_features)
-        self.conditional_predictions = np.zeros(_2D_size)
-        self.prefix_activities = np.zeros(_2D_size)
-        self.prefix_credit = np.zeros(_2D_size)
-        self.prefix_occurrences = np.ones(_2D_size)
-        self.prefix_curiosities = np.zeros(_2D_size)
-        self.prefix_rewards = np.zeros(_2D_size)
-        self.prefix_uncertainties = np.zeros(_2D_size)
-        self.sequence_occurrences = np.ones(_3D_size)
+        self.conditional_rewards = np.zeros(self.n_features, dtype=self.dtype)
+        self.conditional_curiosities = np.zeros(
+            self.n_features, dtype=self.dtype)
+        self.conditional_predictions = np.zeros(_2D_size, dtype=self.dtype)
+        self.prefix_activities = np.zeros(_2D_size, dtype=self.dtype)
+        self.prefix_credit = np.zeros(_2D_size, dtype=self.dtype)
+        self.prefix_occurrences = np.ones(_2D_size, dtype=self.dtype)
+        self.prefix_curiosities = np.zeros(_2D_size, dtype=self.dtype)
+        self.prefix_rewards = np.zeros(_2D_size, dtype=self.dtype)
+        self.prefix_uncertainties = np.zeros(_2D_size, dtype=self.dtype)
+        if self.storage == 'sparse':
+            self.sequence_occurrences = SparseSequences(
+                self.n_features, dtype=self.dtype)
+        else:
+            self.sequence_occurrences = np.ones(_3D_size, dtype=self.dtype)
+        # max_sequence_occurrences : 2D array of floats
+        #     The largest number of occurrences of any sequence beginning
+        #     with each prefix. This is used in calculating fitness.
+        #     Like the sequences, it starts out at one.
+        self.max_sequence_occurrences = np.ones(_2D_size, dtype=self.dtype)
+        # prediction_index : PredictionIndex
+        #     The sequences that are able to make predictions.
+        #     See prediction_index.py.
+        if self.incremental_predictions:
+            self.prediction_index = PredictionIndex(self.n_features)
+        else:
+            self.prediction_index = None
 
         # prefix_decay_rate : float
         #     The rate at which prefix activity decays between time steps
@@ -150,6 +263,23 @@ class Model(object):
         #     a prefix increases its curiosity.
         self.curiosity_update_rate = 3e-3
 
+    def select_kernels(self):
+        """
+        Choose between the single-threaded and multi-threaded kernels.
+
+        Returns
+        -------
+        kernels: module
+            Either model_numba or model_numba_parallel.
+        """
+        if self.n_threads is None:
+            return nb
+        # The number of threads is set for the calling thread only,
+        # so set it each time, in case the model is stepped from
+        # a different thread.
+        numba.set_num_threads(self.n_threads)
+        return nb_parallel
+
     def calculate_fitness(self):
         """
         Calculate the predictive fitness of all the feature candidates.
@@ -160,18 +290,48 @@ class Model(object):
             The fitness of each of the feature candidate inputs to
             the model.
         """
+        kernels = self.select_kernels()
+        # With incremental fitness, max_sequence_occurrences is
+        # already up to date.
+        if not self.incremental_fitness:
+            self.find_max_sequence_occurrences()
 
-        nb.update_fitness(
+        kernels.update_fitness(
             self.feature_fitness,
             self.prefix_occurrences,
             self.prefix_rewards,
             self.prefix_uncertainties,
-            self.sequence_occurrences)
+            self.max_sequence_occurrences)
 
-        candidate_fitness = self.filter.update_fitness(self.feature_fitness)
+        # Trim off the first two elements. The are internal to the model only.
+        candidate_fitness = self.filter.update_fitness(
+            self.feature_fitness[2:])
 
         return candidate_fitness
 
+    def find_max_sequence_occurrences(self):
+        """
+        Scan all the sequences to find the largest count following each prefix.
+
+        Returns
+        -------
+        None, but updates class member
+        max_sequence_occurrences: 2D array of floats
+        """
+        kernels = self.select_kernels()
+        if self.storage == 'sparse':
+            kernels.max_sequences_sparse(
+                self.sequence_occurrences.keys,
+                self.sequence_occurrences.counts,
+                self.sequence_occurrences.feature_baseline,
+                self.max_sequence_occurrences,
+            )
+        else:
+            kernels.max_sequences(
+                self.sequence_occurrences,
+                self.max_sequence_occurrences,
+            )
+
     def update_activities(self, candidate_activities):
         """
         Apply new activities, 
@@ -193,9 +353,10 @@ class Model(object):
         # Augment the feature_activities with the two internal features,
         # the "always on" (index of 0) and
         # the "null" or "nothing else is on" (index of 1).
-        self.previous_feature_activities = self.feature_activities
-        self.feature_activities = np.concatenate((
-            np.zeros(2), feature_activities))
+        # The arrays are written in place, rather than replaced,
+        # in case they are views into a ModelBatch's arrays.
+        self.previous_feature_activities[:] = self.feature_activities
+        self.feature_activities[2:] = feature_activities
         self.feature_activities[0] = 1.
         total_activity = np.sum(self.feature_activities[2:])
         inactivity = max(1. - total_activity, 0.)
@@ -216,34 +377,50 @@ class Model(object):
         resets: array of ints
             Indices of the features that were reset.
         """
-        resets = self.filter.update_inputs(upstream_resets=upstream_resets)
+        input_resets = self.filter.update_inputs(
+            upstream_resets=upstream_resets)
+        # The filter's inputs are offset by the two internal features.
+        resets = np.asarray(input_resets, dtype=int) + 2
+        if resets.size == 0:
+            return resets
 
         # Reset features throughout the model.
         # It's like they never existed.
-        for i in resets:
-            self.previous_feature_activities[i] = 0.
-            self.feature_activities[i] = 0.
-            self.feature_fitness[i] = 0.
-            self.goal_activities[i] = 0.
-            self.prefix_activities[i, :] = 0.
-            self.prefix_activities[:, i] = 0.
-            self.prefix_credit[i, :] = 0.
-            self.prefix_credit[:, i] = 0.
-            self.prefix_occurrences[i, :] = 0.
-            self.prefix_occurrences[:, i] = 0.
-            self.prefix_curiosities[i, :] = 0.
-            self.prefix_curiosities[:, i] = 0.
-            self.prefix_rewards[i, :] = 0.
-            self.prefix_rewards[:, i] = 0.
-            self.prefix_uncertainties[i, :] = 0.
-            self.prefix_uncertainties[:, i] = 0.
-            self.sequence_occurrences[i, :, :] = 0.
-            self.sequence_occurrences[:, i, :] = 0.
-            self.sequence_occurrences[:, :, i] = 0.
+        # All the resets are handled together, so that each array
+        # is visited once, no matter how many features are reset.
+        for feature_array in (
+            self.previous_feature_activities,
+            self.feature_activities,
+            self.feature_fitness,
+            self.goal_activities,
+        ):
+            feature_array[resets] = 0.
+        for prefix_array in (
+            self.prefix_activities,
+            self.prefix_credit,
+            self.prefix_occurrences,
+            self.prefix_curiosities,
+            self.prefix_rewards,
+            self.prefix_uncertainties,
+        ):
+            prefix_array[resets, :] = 0.
+            prefix_array[:, resets] = 0.
+        if self.storage == 'sparse':
+            self.sequence_occurrences.reset(resets)
+        else:
+            self.sequence_occurrences[resets, :, :] = 0.
+            self.sequence_occurrences[:, resets, :] = 0.
+            self.sequence_occurrences[:, :, resets] = 0.
+        if self.incremental_predictions:
+            self.prediction_index.reset(resets)
+        # Clearing sequences can lower the running maximum,
+        # so it has to be found again from scratch.
+        if self.incremental_fitness:
+            self.find_max_sequence_occurrences()
 
         return resets
 
-    def step(self, candidate_activities, reward):
+    def step(self, candidate_activities, reward, predict=True):
         """
         Update the model and choose a new goal.
 
@@ -253,64 +430,290 @@ class Model(object):
             The current activity levels of each of the feature candidates.
         reward : float
             The reward reported by the world during the most recent time step.
+        predict : boolean
+            If False, the model learns from the time step, but the
+            conditional predictions, rewards and curiosities are
+            left as they were. They are only needed for choosing goals.
+            Feature prediction is usually the largest part of a step,
+            so this is much faster when goals are chosen some other way,
+            as when replaying a log.
         """
+        kernels = self.select_kernels()
         # Update feature_activities and previous_feature_activities
         self.update_activities(candidate_activities)
 
+        # Gather the active features and prefixes once, so that
+        # sequences can be updated and predicted by visiting
+        # only the active ones.
+        i_active_features = kernels.find_active_features(
+            self.feature_activities)
+        i_prefix_features, i_prefix_goals = kernels.find_active_prefixes(
+            self.prefix_activities)
+
         # Update sequences before prefixes.
-        nb.update_sequences(
-            self.feature_activities,
-            self.prefix_activities,
-            self.sequence_occurrences,
-        )
+        self.update_sequences(
+            i_active_features, i_prefix_features, i_prefix_goals)
+
+        if self.fused and predict:
+            self.update_and_predict(reward, i_active_features)
+        else:
+            kernels.update_prefixes(
+                self.prefix_decay_rate,
+                self.previous_feature_activities,
+                self.goal_activities,
+                self.prefix_activities,
+                self.prefix_occurrences,
+                self.prefix_uncertainties,
+            )
+
+            kernels.update_rewards(
+                self.reward_update_rate,
+                reward,
+                self.prefix_credit,
+                self.prefix_rewards,
+            )
+
+            kernels.update_curiosities(
+                self.curiosity_update_rate,
+                self.prefix_occurrences,
+                self.prefix_curiosities,
+                self.previous_feature_activities,
+                self.feature_activities,
+                self.goal_activities,
+                self.prefix_uncertainties,
+            )
+
+            if predict:
+                self.predict_features(i_active_features)
+                kernels.predict_rewards(
+                    self.feature_activities,
+                    self.prefix_rewards,
+                    self.conditional_rewards,
+                )
+                kernels.predict_curiosities(
+                    self.feature_activities,
+                    self.prefix_curiosities,
+                    self.conditional_curiosities,
+                )
+
+        return (
+            self.conditional_predictions,
+            self.conditional_rewards,
+            self.conditional_curiosities)
+
+    def update_and_predict(self, reward, i_active_features):
+        """
+        Update prefixes, rewards and curiosities and make predictions
+        in a single pass over the prefixes.
 
-        nb.update_prefixes(
+        Parameters
+        ----------
+        reward : float
+            The reward reported by the world during the most recent time step.
+        i_active_features: array of ints
+            Indices of the currently active features.
+
+        Returns
+        -------
+        None, but updates the prefix arrays and
+        conditional_predictions: 2D array of floats
+        conditional_rewards,
+        conditional_curiosities: array of floats
+        """
+        kernels = self.select_kernels()
+        # Feature predictions can be folded in when sequences are dense.
+        # Otherwise they are made in their own pass.
+        fold_in_features = (
+            self.storage == 'dense' and not self.incremental_predictions)
+        if fold_in_features:
+            sequence_occurrences = self.sequence_occurrences
+        else:
+            sequence_occurrences = None
+
+        kernels.update_and_predict(
             self.prefix_decay_rate,
+            self.reward_update_rate,
+            reward,
+            self.curiosity_update_rate,
             self.previous_feature_activities,
+            self.feature_activities,
             self.goal_activities,
             self.prefix_activities,
             self.prefix_occurrences,
             self.prefix_uncertainties,
-        )
-
-        nb.update_rewards(
-            self.reward_update_rate,
-            reward,
             self.prefix_credit,
             self.prefix_rewards,
-        )
-
-        nb.update_curiosities(
-            self.curiosity_update_rate,
-            self.prefix_occurrences,
             self.prefix_curiosities,
-            self.previous_feature_activities,
-            self.feature_activities,
-            self.goal_activities,
-            self.prefix_uncertainties,
-        )
-        
-        nb.predict_features(
-            self.feature_activities,
-            self.prefix_occurrences,
-            self.sequence_occurrences,
+            sequence_occurrences,
             self.conditional_predictions,
-        )
-        nb.predict_rewards(
-            self.feature_activities,
-            self.prefix_rewards,
             self.conditional_rewards,
-        )
-        nb.predict_curiosities(
-            self.feature_activities,
-            self.prefix_curiosities,
             self.conditional_curiosities,
         )
+        if not fold_in_features:
+            self.predict_features(i_active_features)
 
-        return (
-            self.conditional_predictions,
-            self.conditional_rewards,
-            self.conditional_curiosities)
+    def update_sequences(
+        self,
+        i_active_features,
+        i_prefix_features,
+        i_prefix_goals,
+    ):
+        """
+        Count the sequences formed by active prefixes and active features.
+
+        Parameters
+        ----------
+        i_active_features: array of ints
+            Indices of the currently active features.
+        i_prefix_features,
+        i_prefix_goals: array of ints
+            The feature and goal indices of the prefixes that were
+            active on the previous time step.
+
+        Returns
+        -------
+        None, but updates class members
+        sequence_occurrences
+        max_sequence_occurrences: 2D array of floats
+        prediction_index: PredictionIndex
+        """
+        kernels = self.select_kernels()
+        # Each active prefix can start a new sequence with
+        # each active feature. Make room for all of them.
+        n_new_max = i_prefix_features.size * i_active_features.size
+
+        if self.storage == 'sparse':
+            sequences = self.sequence_occurrences
+            if self.incremental_predictions:
+                self.prediction_index.reserve(n_new_max)
+                self.prediction_index.n_entries = (
+                    kernels.index_new_predictions_sparse(
+                        i_active_features,
+                        i_prefix_features,
+                        i_prefix_goals,
+                        self.feature_activities,
+                        self.prefix_activities,
+                        sequences.keys,
+                        sequences.counts,
+                        sequences.feature_baseline,
+                        self.prediction_index.heads,
+                        self.prediction_index.next,
+                        self.prediction_index.cells,
+                        self.prediction_index.n_entries,
+                    ))
+            sequences.reserve(n_new_max)
+            sequences.n_entries += kernels.update_sequences_sparse(
+                i_active_features,
+                i_prefix_features,
+                i_prefix_goals,
+                self.feature_activities,
+                self.prefix_activities,
+                sequences.keys,
+                sequences.counts,
+                sequences.feature_baseline,
+            )
+            if self.incremental_fitness:
+                kernels.update_max_sequences_sparse(
+                    i_active_features,
+                    i_prefix_features,
+                    i_prefix_goals,
+                    sequences.keys,
+                    sequences.counts,
+                    self.max_sequence_occurrences,
+                )
+        else:
+            if self.incremental_predictions:
+                self.prediction_index.reserve(n_new_max)
+                self.prediction_index.n_entries = (
+                    kernels.index_new_predictions(
+                        i_active_features,
+                        i_prefix_features,
+                        i_prefix_goals,
+                        self.feature_activities,
+                        self.prefix_activities,
+                        self.sequence_occurrences,
+                        self.prediction_index.heads,
+                        self.prediction_index.next,
+                        self.prediction_index.cells,
+                        self.prediction_index.n_entries,
+                    ))
+            kernels.update_sequences_active(
+                i_active_features,
+                i_prefix_features,
+                i_prefix_goals,
+                self.feature_activities,
+                self.prefix_activities,
+                self.sequence_occurrences,
+            )
+            if self.incremental_fitness:
+                kernels.update_max_sequences(
+                    i_active_features,
+                    i_prefix_features,
+                    i_prefix_goals,
+                    self.sequence_occurrences,
+                    self.max_sequence_occurrences,
+                )
+
+    def predict_features(self, i_active_features):
+        """
+        Predict which features will be active, given each goal.
+
+        Parameters
+        ----------
+        i_active_features: array of ints
+            Indices of the currently active features.
+
+        Returns
+        -------
+        None, but updates class member
+        conditional_predictions: 2D array of floats
+        """
+        kernels = self.select_kernels()
+        if self.incremental_predictions:
+            index = self.prediction_index
+            if self.storage == 'sparse':
+                index.n_touched = kernels.predict_features_indexed_sparse(
+                    i_active_features,
+                    self.feature_activities,
+                    self.prefix_occurrences,
+                    self.sequence_occurrences.keys,
+                    self.sequence_occurrences.counts,
+                    index.heads,
+                    index.next,
+                    index.cells,
+                    index.touched_cells,
+                    index.n_touched,
+                    self.conditional_predictions,
+                )
+            else:
+                index.n_touched = kernels.predict_features_indexed(
+                    i_active_features,
+                    self.feature_activities,
+                    self.prefix_occurrences,
+                    self.sequence_occurrences,
+                    index.heads,
+                    index.next,
+                    index.cells,
+                    index.touched_cells,
+                    index.n_touched,
+                    self.conditional_predictions,
+                )
+        elif self.storage == 'sparse':
+            kernels.predict_features_sparse(
+                self.feature_activities,
+                self.prefix_occurrences,
+                self.sequence_occurrences.keys,
+                self.sequence_occurrences.counts,
+                self.conditional_predictions,
+            )
+        else:
+            kernels.predict_features_active(
+                i_active_features,
+                self.feature_activities,
+                self.prefix_occurrences,
+                self.sequence_occurrences,
+                self.conditional_predictions,
+            )
 
     def update_goals(self, goals, i_new_goal):
         """
@@ -327,8 +730,9 @@ class Model(object):
         -------
         feature_pool_goals: array of floats
         """
-        self.goal_activities = goals
-        nb.update_reward_credit(
+        kernels = self.select_kernels()
+        self.goal_activities[:] = goals
+        kernels.update_reward_credit(
             i_new_goal,
             self.feature_activities,
             self.credit_decay_rate,
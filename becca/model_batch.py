@@ -0,0 +1,185 @@
+"""
+The ModelBatch class.
+"""
+
+from __future__ import print_function
+
+import numba
+import numpy as np
+
+import becca.model_numba as nb
+import becca.model_numba_parallel as nb_parallel
+
+
+class ModelBatch(object):
+    """
+    Step a collection of same-sized Models together.
+
+    Each of the Models' arrays is stacked into a single array
+    with an extra leading axis, one element per model.
+    The Models' own arrays are then replaced with views into the stacked
+    ones, so that the Models and the batch always agree.
+    All the models can then be stepped with a single call to
+    the batch functions in model_numba.py, rather than with a chain of
+    Python calls per model. Each model's input filter is still
+    updated with its own Python calls, before and after the batch step.
+
+    The Models can still be used individually between batch steps,
+    for instance to update their goals and inputs.
+    """
+    # The arrays that are stacked, all of which have one row per feature.
+    array_names = (
+        'previous_feature_activities',
+        'feature_activities',
+        'feature_fitness',
+        'goal_activities',
+        'conditional_rewards',
+        'conditional_curiosities',
+        'conditional_predictions',
+        'prefix_activities',
+        'prefix_credit',
+        'prefix_occurrences',
+        'prefix_curiosities',
+        'prefix_rewards',
+        'prefix_uncertainties',
+        'sequence_occurrences',
+        'max_sequence_occurrences',
+    )
+
+    def __init__(self, models, n_threads=None):
+        """
+        Parameters
+        ----------
+        models: list of Models
+            All must have the same number of features and dtype
+            and use dense sequence storage without a prediction index.
+        n_threads: int
+            If None, the models are stepped one after another.
+            Otherwise, they are split across this many threads.
+            See Model.
+        """
+        self.models = list(models)
+        if len(self.models) == 0:
+            raise ValueError('A ModelBatch needs at least one model.')
+        first = self.models[0]
+        for model in self.models:
+            if model.storage != 'dense' or model.incremental_predictions:
+                raise ValueError(
+                    'Models in a batch must use dense storage '
+                    'and no prediction index.')
+            if (model.n_features != first.n_features or
+                    model.dtype != first.dtype or
+                    model.incremental_fitness != first.incremental_fitness):
+                raise ValueError(
+                    'Models in a batch must all have the same '
+                    'n_features, dtype and incremental_fitness.')
+
+        # n_models : int
+        #     The number of models in the batch.
+        self.n_models = len(self.models)
+        # n_threads : int
+        #     See the n_threads parameter above.
+        if n_threads is None:
+            self.n_threads = None
+        else:
+            self.n_threads = max(
+                1, min(n_threads, numba.config.NUMBA_NUM_THREADS))
+        # incremental_fitness : boolean
+        #     See Model.
+        self.incremental_fitness = first.incremental_fitness
+
+        for name in self.array_names:
+            stacked = np.stack([getattr(model, name) for model in self.models])
+            setattr(self, name, stacked)
+            for i_model, model in enumerate(self.models):
+                setattr(model, name, stacked[i_model])
+
+    def select_kernels(self):
+        """
+        Choose between the single-threaded and multi-threaded kernels.
+
+        Returns
+        -------
+        kernels: module
+            Either model_numba or model_numba_parallel.
+        """
+        if self.n_threads is None:
+            return nb
+        numba.set_num_threads(self.n_threads)
+        return nb_parallel
+
+    def step(self, candidate_activities, rewards):
+        """
+        Update all the models.
+
+        Parameters
+        ----------
+        candidate_activities : list of arrays of floats
+            The current activity levels of each model's feature candidates.
+        rewards : array of floats
+            The reward for each model.
+
+        Returns
+        -------
+        conditional_predictions: 3D array of floats
+        conditional_rewards,
+        conditional_curiosities: 2D array of floats
+            The predictions of each model. See Model.step.
+        """
+        kernels = self.select_kernels()
+        # Each model's input filter is its own, so its activities
+        # are updated one model at a time.
+        for model, activities in zip(self.models, candidate_activities):
+            model.update_activities(activities)
+
+        first = self.models[0]
+        kernels.step_batch(
+            first.prefix_decay_rate,
+            first.reward_update_rate,
+            np.asarray(rewards, dtype=np.float64),
+            first.curiosity_update_rate,
+            self.incremental_fitness,
+            self.previous_feature_activities,
+            self.feature_activities,
+            self.goal_activities,
+            self.prefix_activities,
+            self.prefix_occurrences,
+            self.prefix_uncertainties,
+            self.prefix_credit,
+            self.prefix_rewards,
+            self.prefix_curiosities,
+            self.sequence_occurrences,
+            self.max_sequence_occurrences,
+            self.conditional_predictions,
+            self.conditional_rewards,
+            self.conditional_curiosities,
+        )
+        return (
+            self.conditional_predictions,
+            self.conditional_rewards,
+            self.conditional_curiosities)
+
+    def calculate_fitness(self):
+        """
+        Calculate the predictive fitness of all the models' feature candidates.
+
+        Returns
+        -------
+        candidate_fitness: list of arrays of floats
+            The fitness of each model's feature candidates.
+            See Model.calculate_fitness.
+        """
+        kernels = self.select_kernels()
+        if not self.incremental_fitness:
+            for model in self.models:
+                model.find_max_sequence_occurrences()
+
+        kernels.update_fitness_batch(
+            self.feature_fitness,
+            self.prefix_occurrences,
+            self.prefix_rewards,
+            self.prefix_uncertainties,
+            self.max_sequence_occurrences,
+        )
+        return [model.filter.update_fitness(model.feature_fitness[2:])
+                for model in self.models]
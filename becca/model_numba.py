@@ -1,9 +1,15 @@
 """
 Numba functions that support model.py
+
+Where a function's outer loop can safely be split across threads,
+it is written with prange. Compiled here, with the usual
+@jit(nopython=True), prange behaves just like range.
+model_numba_parallel.py compiles the same functions with parallel=True,
+spreading those loops across threads.
 """
 
 from __future__ import print_function
-from numba import jit
+from numba import jit, prange
 import numpy as np
 
 import becca.tools as tools
@@ -41,6 +47,94 @@ def update_sequences(
     return
 
 
+@jit(nopython=True)
+def find_active_features(feature_activities):
+    """
+    Gather the indices of the features with non-zero activity.
+
+    Parameters
+    ----------
+    feature_activities: array of floats
+
+    Returns
+    -------
+    i_active_features: array of ints
+    """
+    i_active_features = np.zeros(feature_activities.size, dtype=np.int64)
+    n_active = 0
+    for i_feature in range(feature_activities.size):
+        if feature_activities[i_feature] > tools.epsilon:
+            i_active_features[n_active] = i_feature
+            n_active += 1
+    return i_active_features[:n_active]
+
+
+@jit(nopython=True)
+def find_active_prefixes(prefix_activities):
+    """
+    Gather the indices of the prefixes with non-zero activity.
+
+    Parameters
+    ----------
+    prefix_activities: 2D array of floats
+
+    Returns
+    -------
+    i_prefix_features, i_prefix_goals: array of ints
+        The feature and goal index of each active prefix.
+    """
+    n_features, n_goals = prefix_activities.shape
+    i_prefix_features = np.zeros(n_features * n_goals, dtype=np.int64)
+    i_prefix_goals = np.zeros(n_features * n_goals, dtype=np.int64)
+    n_active = 0
+    for i_feature in range(n_features):
+        for i_goal in range(n_goals):
+            if prefix_activities[i_feature, i_goal] > tools.epsilon:
+                i_prefix_features[n_active] = i_feature
+                i_prefix_goals[n_active] = i_goal
+                n_active += 1
+    return i_prefix_features[:n_active], i_prefix_goals[:n_active]
+
+
+@jit(nopython=True)
+def update_sequences_active(
+    i_active_features,
+    i_prefix_features,
+    i_prefix_goals,
+    feature_activities,
+    prefix_activities,
+    sequence_occurrences,
+):
+    """
+    Update the number of occurrences of each sequence, visiting only
+    the active ones.
+
+    This gives the same result as update_sequences, but rather than
+    checking every sequence, it only visits the sequences formed
+    by active prefixes and active features. When only a few features
+    are active, this is much faster.
+
+    Parameters
+    ----------
+    i_active_features: array of ints
+        The output of find_active_features(feature_activities).
+    i_prefix_features,
+    i_prefix_goals: array of ints
+        The output of find_active_prefixes(prefix_activities).
+    feature_activities: array of floats
+    prefix_activities: 2D array of floats
+    sequence_occurrences: 3D array of floats
+    """
+    for i_prefix in prange(i_prefix_features.size):
+        i_feature = i_prefix_features[i_prefix]
+        i_goal = i_prefix_goals[i_prefix]
+        prefix_activity = prefix_activities[i_feature, i_goal]
+        for j_feature in i_active_features:
+            sequence_occurrences[i_feature, i_goal, j_feature] += (
+                prefix_activity * feature_activities[j_feature])
+    return
+
+
 @jit(nopython=True)
 def update_prefixes(
     prefix_decay_rate,
@@ -61,7 +155,7 @@ def update_prefixes(
     p, the prefix activity, is a decayed version of n.
     """
     n_features, n_goals = prefix_activities.shape
-    for i_feature in range(n_features):
+    for i_feature in prange(n_features):
         for i_goal in range(n_goals):
             prefix_activities[i_feature, i_goal] *= 1 - prefix_decay_rate
 
@@ -102,7 +196,7 @@ def update_rewards(
     or the sequence activity is very small, there is no change.
     """
     n_features, n_goals = prefix_rewards.shape
-    for i_feature in range(n_features):
+    for i_feature in prange(n_features):
         for i_goal in range(n_goals):
             # credit: How much responsibility for this reward is assigned to
             # this prefix?
@@ -134,7 +228,7 @@ def update_curiosities(
     Use a collection of factors to increment the curiosity for each prefix.
     """
     n_features, n_goals = prefix_curiosities.shape
-    for i_feature in range(n_features):
+    for i_feature in prange(n_features):
         for i_goal in range(n_goals):
 
             # Fulfill curiosity on the previous time step's goals.
@@ -194,7 +288,7 @@ def predict_features(
         This is updated to represent the new predictions for this time step.
     """
     n_features, n_goals = prefix_occurrences.shape
-    conditional_predictions = np.zeros((n_goals, n_features))
+    conditional_predictions[:, :] = 0.
     for i_feature in range(n_features):
         if feature_activities[i_feature] > tools.epsilon:
             for i_goal in range(n_goals):
@@ -210,6 +304,229 @@ def predict_features(
     return
 
 
+@jit(nopython=True)
+def predict_features_active(
+    i_active_features,
+    feature_activities,
+    prefix_occurrences,
+    sequence_occurrences,
+    conditional_predictions,
+):
+    """
+    Make conditional feature predictions, visiting only active features.
+
+    This is the active-set counterpart to predict_features.
+    Only the sequences that start with an active feature are visited.
+
+    Parameters
+    ----------
+    i_active_features: array of ints
+        The output of find_active_features(feature_activities).
+    feature_activities: array of floats
+    prefix_occurrences: 2D array of floats
+    sequence_occurrences: 3D array of floats
+    conditional_predictions: 2D array of floats
+        This is updated to represent the new predictions for this time step.
+    """
+    n_features, n_goals = prefix_occurrences.shape
+    # Each goal's row of conditional_predictions is handled
+    # independently, so that goals can be spread across threads.
+    for i_goal in prange(n_goals):
+        for j_feature in range(n_features):
+            conditional_predictions[i_goal, j_feature] = 0.
+        for i_feature in i_active_features:
+            activity = feature_activities[i_feature]
+            denominator = prefix_occurrences[i_feature, i_goal] + 1
+            for j_feature in range(n_features):
+                p_sequence = activity * (
+                    (sequence_occurrences[i_feature, i_goal, j_feature] - 1) /
+                    denominator)
+                if p_sequence > conditional_predictions[i_goal, j_feature]:
+                    conditional_predictions[i_goal, j_feature] = p_sequence
+    return
+
+
+@jit(nopython=True)
+def index_new_predictions(
+    i_active_features,
+    i_prefix_features,
+    i_prefix_goals,
+    feature_activities,
+    prefix_activities,
+    sequence_occurrences,
+    index_heads,
+    index_next,
+    index_cells,
+    n_index_entries,
+):
+    """
+    Add the sequences that are about to become predictive to the index.
+
+    A sequence only contributes to conditional_predictions once its count
+    exceeds one. This finds the sequences that will cross that line
+    during this time step's update_sequences_active and adds them
+    to the prediction index. It has to be called before the sequences
+    are updated.
+
+    See prediction_index.py for a description of the index.
+
+    Parameters
+    ----------
+    i_active_features,
+    i_prefix_features,
+    i_prefix_goals: array of ints
+        The same active indices passed to update_sequences_active.
+    feature_activities: array of floats
+    prefix_activities: 2D array of floats
+    sequence_occurrences: 3D array of floats
+    index_heads,
+    index_next,
+    index_cells: array of ints
+    n_index_entries: int
+
+    Returns
+    -------
+    n_index_entries: int
+        The number of entries in the index after the additions.
+    """
+    n_features, n_goals = prefix_activities.shape
+    # Round the updated count to the precision it will be stored at,
+    # so that the test matches what update_sequences_active will store.
+    updated = np.empty(1, dtype=sequence_occurrences.dtype)
+    for i_prefix in range(i_prefix_features.size):
+        i_feature = i_prefix_features[i_prefix]
+        i_goal = i_prefix_goals[i_prefix]
+        prefix_activity = prefix_activities[i_feature, i_goal]
+        for j_feature in i_active_features:
+            occurrences = sequence_occurrences[i_feature, i_goal, j_feature]
+            updated[0] = occurrences + (
+                prefix_activity * feature_activities[j_feature])
+            if occurrences <= 1 and updated[0] > 1:
+                index_cells[n_index_entries] = i_goal * n_features + j_feature
+                index_next[n_index_entries] = index_heads[i_feature]
+                index_heads[i_feature] = n_index_entries
+                n_index_entries += 1
+    return n_index_entries
+
+
+@jit(nopython=True)
+def predict_features_indexed(
+    i_active_features,
+    feature_activities,
+    prefix_occurrences,
+    sequence_occurrences,
+    index_heads,
+    index_next,
+    index_cells,
+    touched_cells,
+    n_touched,
+    conditional_predictions,
+):
+    """
+    Make conditional feature predictions using the prediction index.
+
+    This gives the same result as predict_features_active, but
+    only visits the sequences that can make a prediction, those
+    in the index that start with an active feature. Rather than
+    clearing all of conditional_predictions, it only clears the cells
+    that were written during the previous time step.
+
+    Parameters
+    ----------
+    i_active_features: array of ints
+        The output of find_active_features(feature_activities).
+    feature_activities: array of floats
+    prefix_occurrences: 2D array of floats
+    sequence_occurrences: 3D array of floats
+    index_heads,
+    index_next,
+    index_cells: array of ints
+    touched_cells: array of ints
+        The cells of conditional_predictions that have non-zero values.
+        This is updated to reflect the new predictions.
+    n_touched: int
+        The number of valid elements in touched_cells.
+    conditional_predictions: 2D array of floats
+        This is updated to represent the new predictions for this time step.
+
+    Returns
+    -------
+    n_touched: int
+        The number of valid elements in touched_cells after the update.
+    """
+    n_goals, n_features = conditional_predictions.shape
+    for i_touched in range(n_touched):
+        cell = touched_cells[i_touched]
+        conditional_predictions[cell // n_features, cell % n_features] = 0.
+    n_touched = 0
+
+    for i_feature in i_active_features:
+        activity = feature_activities[i_feature]
+        i_entry = index_heads[i_feature]
+        while i_entry > -1:
+            cell = index_cells[i_entry]
+            i_goal = cell // n_features
+            j_feature = cell % n_features
+            p_sequence = activity * (
+                (sequence_occurrences[i_feature, i_goal, j_feature] - 1) /
+                (prefix_occurrences[i_feature, i_goal] + 1))
+            if p_sequence > conditional_predictions[i_goal, j_feature]:
+                if conditional_predictions[i_goal, j_feature] == 0.:
+                    touched_cells[n_touched] = cell
+                    n_touched += 1
+                conditional_predictions[i_goal, j_feature] = p_sequence
+            i_entry = index_next[i_entry]
+    return n_touched
+
+
+@jit(nopython=True)
+def rebuild_prediction_index(
+    index_heads,
+    index_next,
+    index_cells,
+    new_index_heads,
+    new_index_next,
+    new_index_cells,
+    is_reset,
+):
+    """
+    Copy the prediction index, dropping entries involving reset features.
+
+    Parameters
+    ----------
+    index_heads,
+    index_next,
+    index_cells,
+    new_index_heads,
+    new_index_next,
+    new_index_cells: array of ints
+    is_reset: array of booleans
+        If is_reset[i] is True, every entry that includes
+        feature i is dropped.
+
+    Returns
+    -------
+    n_index_entries: int
+        The number of entries in the new index.
+    """
+    n_features = index_heads.size
+    n_index_entries = 0
+    for i_feature in range(n_features):
+        if is_reset[i_feature]:
+            continue
+        i_entry = index_heads[i_feature]
+        while i_entry > -1:
+            cell = index_cells[i_entry]
+            if not (is_reset[cell // n_features] or
+                    is_reset[cell % n_features]):
+                new_index_cells[n_index_entries] = cell
+                new_index_next[n_index_entries] = new_index_heads[i_feature]
+                new_index_heads[i_feature] = n_index_entries
+                n_index_entries += 1
+            i_entry = index_next[i_entry]
+    return n_index_entries
+
+
 @jit(nopython=True)
 def predict_rewards(
     feature_activities,
@@ -238,7 +555,7 @@ def predict_rewards(
         for this time step.
     """
     n_features, n_goals = prefix_rewards.shape
-    conditional_rewards = np.zeros(n_goals)
+    conditional_rewards[:] = 0.
     for i_feature in range(n_features):
         for i_goal in range(n_goals):
             expected_reward = (feature_activities[i_feature] *
@@ -276,7 +593,7 @@ def predict_curiosities(
         for this time step.
     """
     n_features, n_goals = prefix_curiosities.shape
-    conditional_curiosities = np.zeros(n_goals)
+    conditional_curiosities[:] = 0.
     for i_feature in range(n_features):
         for i_goal in range(n_goals):
             expected_curiosity = (feature_activities[i_feature] *
@@ -286,13 +603,196 @@ def predict_curiosities(
     return
 
 
-# @jit(nopython=True)
+@jit(nopython=True)
+def update_and_predict(
+    prefix_decay_rate,
+    reward_update_rate,
+    reward,
+    curiosity_update_rate,
+    previous_feature_activities,
+    feature_activities,
+    goal_activities,
+    prefix_activities,
+    prefix_occurrences,
+    prefix_uncertainties,
+    prefix_credit,
+    prefix_rewards,
+    prefix_curiosities,
+    sequence_occurrences,
+    conditional_predictions,
+    conditional_rewards,
+    conditional_curiosities,
+):
+    """
+    Update all the prefixes and make the conditional predictions
+    in a single pass.
+
+    This gives the same result as calling update_prefixes, update_rewards,
+    update_curiosities, predict_features, predict_rewards
+    and predict_curiosities in turn, but the prefix arrays are read
+    from memory only once. All the updates for one feature's row of
+    prefixes are made while the row is still in cache. Within a row,
+    each update gets its own simple loop, as in the separate functions,
+    so that the compiler can vectorize it.
+    See those functions for descriptions of the arithmetic.
+
+    This is only faster once the prefix arrays are too large to stay
+    in cache between the separate passes. See Model's fused parameter.
+
+    Parameters
+    ----------
+    sequence_occurrences: 3D array of floats, or None
+        If None, conditional_predictions is left alone, and feature
+        predictions are left to one of the other predict_features kernels.
+        This is how sparse sequences are handled.
+    All others are the same as in the separate functions.
+    """
+    n_features, n_goals = prefix_activities.shape
+    conditional_rewards[:] = 0.
+    conditional_curiosities[:] = 0.
+    if sequence_occurrences is not None:
+        conditional_predictions[:, :] = 0.
+    for i_feature in range(n_features):
+        activity = feature_activities[i_feature]
+        previous_activity = previous_feature_activities[i_feature]
+        activity_row = prefix_activities[i_feature]
+        occurrence_row = prefix_occurrences[i_feature]
+        uncertainty_row = prefix_uncertainties[i_feature]
+        credit_row = prefix_credit[i_feature]
+        reward_row = prefix_rewards[i_feature]
+        curiosity_row = prefix_curiosities[i_feature]
+
+        # update_prefixes
+        for i_goal in range(n_goals):
+            activity_row[i_goal] *= 1 - prefix_decay_rate
+            activity_row[i_goal] += previous_activity * goal_activities[i_goal]
+            activity_row[i_goal] = min(activity_row[i_goal], 1)
+            occurrence_row[i_goal] += activity_row[i_goal]
+            uncertainty_row[i_goal] = 1 / (1 + occurrence_row[i_goal])
+
+        # update_rewards
+        for i_goal in range(n_goals):
+            credit = credit_row[i_goal]
+            if credit > tools.epsilon:
+                delta = reward - reward_row[i_goal]
+                if reward > reward_row[i_goal]:
+                    update_scale = .5
+                else:
+                    update_scale = 1.
+                reward_row[i_goal] += (
+                    delta * credit * reward_update_rate * update_scale)
+
+        # update_curiosities
+        for i_goal in range(n_goals):
+            curiosity_row[i_goal] -= (
+                previous_activity * goal_activities[i_goal])
+            curiosity_row[i_goal] = max(curiosity_row[i_goal], 0)
+            curiosity_row[i_goal] += (
+                curiosity_update_rate * uncertainty_row[i_goal] * activity)
+
+        # predict_rewards, predict_curiosities
+        # Inactive features can't raise the predictions above zero.
+        if activity > 0.:
+            for i_goal in range(n_goals):
+                expected_reward = activity * reward_row[i_goal]
+                if expected_reward > conditional_rewards[i_goal]:
+                    conditional_rewards[i_goal] = expected_reward
+            for i_goal in range(n_goals):
+                expected_curiosity = activity * curiosity_row[i_goal]
+                if expected_curiosity > conditional_curiosities[i_goal]:
+                    conditional_curiosities[i_goal] = expected_curiosity
+
+        # predict_features
+        if sequence_occurrences is not None:
+            if activity > tools.epsilon:
+                for i_goal in range(n_goals):
+                    denominator = occurrence_row[i_goal] + 1
+                    for j_feature in range(n_features):
+                        p_sequence = activity * (
+                            (sequence_occurrences[
+                                i_feature, i_goal, j_feature] - 1) /
+                            denominator)
+                        if (p_sequence >
+                                conditional_predictions[i_goal, j_feature]):
+                            conditional_predictions[i_goal, j_feature] = (
+                                p_sequence)
+    return
+
+
+@jit(nopython=True)
+def max_sequences(
+    sequence_occurrences,
+    max_sequence_occurrences,
+):
+    """
+    Find the largest sequence count that follows each prefix.
+
+    This is equivalent to
+        np.max(sequence_occurrences, axis=2)
+    but it writes the result into an existing array rather than
+    allocating a new one.
+
+    Parameters
+    ----------
+    sequence_occurrences: 3D array of floats
+    max_sequence_occurrences: 2D array of floats
+        This is modified to hold the result.
+    """
+    n_pre_features, n_goals, n_post_features = sequence_occurrences.shape
+    for i_feature in prange(n_pre_features):
+        for i_goal in range(n_goals):
+            max_occurrences = sequence_occurrences[i_feature, i_goal, 0]
+            for j_feature in range(1, n_post_features):
+                if (sequence_occurrences[i_feature, i_goal, j_feature] >
+                        max_occurrences):
+                    max_occurrences = sequence_occurrences[
+                        i_feature, i_goal, j_feature]
+            max_sequence_occurrences[i_feature, i_goal] = max_occurrences
+    return
+
+
+@jit(nopython=True)
+def update_max_sequences(
+    i_active_features,
+    i_prefix_features,
+    i_prefix_goals,
+    sequence_occurrences,
+    max_sequence_occurrences,
+):
+    """
+    Keep a running maximum of the sequence counts following each prefix.
+
+    Sequence counts only grow between resets, so only the sequences
+    just updated by update_sequences_active can raise the maximum.
+
+    Parameters
+    ----------
+    i_active_features,
+    i_prefix_features,
+    i_prefix_goals: array of ints
+        The same active indices passed to update_sequences_active.
+    sequence_occurrences: 3D array of floats
+    max_sequence_occurrences: 2D array of floats
+        This is modified to hold the updated maximum.
+    """
+    for i_prefix in prange(i_prefix_features.size):
+        i_feature = i_prefix_features[i_prefix]
+        i_goal = i_prefix_goals[i_prefix]
+        for j_feature in i_active_features:
+            if (sequence_occurrences[i_feature, i_goal, j_feature] >
+                    max_sequence_occurrences[i_feature, i_goal]):
+                max_sequence_occurrences[i_feature, i_goal] = (
+                    sequence_occurrences[i_feature, i_goal, j_feature])
+    return
+
+
+@jit(nopython=True)
 def update_fitness(
     feature_fitness,
     prefix_occurrences,
     prefix_rewards,
     prefix_uncertainties,
-    sequence_occurrences,
+    max_sequence_occurrences,
 ):
     """
     Calculate the fitness of each feature 
@@ -305,26 +805,36 @@ def update_fitness(
     prefix_occurrences: 2D array of floats
     prefix_rewards: 2D array of floats
     prefix_uncertainties: 2D array of floats
-    sequence_occurrences: 3D array of floats
+    max_sequence_occurrences: 2D array of floats
+        The largest number of occurrences of any sequence
+        beginning with each prefix, the maximum of sequence_occurrences
+        along its last axis.
     """
-    # Calculate the ability of each prefix to predict the features that
-    # follow it.
-    # Base it on the single most successfully predicted sequence.
-    # TODO: debug numba type inference error in this line
-    postfeature_prediction_score = (
-        np.max(sequence_occurrences, axis=2) /
-        (prefix_occurrences + tools.epsilon))
-    # Calculate the ability of each prefix to predict reward or punishment.
-    reward_prediction_score = np.abs(prefix_rewards)
-    prefix_score = postfeature_prediction_score + reward_prediction_score
-    # Scale fitness by confidence (1 - uncertainty)
-    prefix_fitness = prefix_score * (1 - prefix_uncertainties)
-    # Find the maximum fitness for each feature across all prefixes,
-    # whether as a prefeature or as a goal.
-    prefeature_fitness = np.max(prefix_fitness, axis=1)
-    goal_fitness = np.max(prefix_fitness, axis=0)
-    feature_fitness = np.maximum(prefeature_fitness, goal_fitness)
-
+    n_features, n_goals = prefix_occurrences.shape
+    for i_feature in range(n_features):
+        feature_fitness[i_feature] = -np.inf
+    for i_feature in range(n_features):
+        for i_goal in range(n_goals):
+            # Calculate the ability of each prefix to predict the features
+            # that follow it.
+            # Base it on the single most successfully predicted sequence.
+            postfeature_prediction_score = (
+                max_sequence_occurrences[i_feature, i_goal] /
+                (prefix_occurrences[i_feature, i_goal] + tools.epsilon))
+            # Calculate the ability of each prefix to predict
+            # reward or punishment.
+            reward_prediction_score = np.abs(prefix_rewards[i_feature, i_goal])
+            prefix_score = (postfeature_prediction_score +
+                            reward_prediction_score)
+            # Scale fitness by confidence (1 - uncertainty)
+            prefix_fitness = prefix_score * (
+                1 - prefix_uncertainties[i_feature, i_goal])
+            # Find the maximum fitness for each feature across all prefixes,
+            # whether as a prefeature or as a goal.
+            if prefix_fitness > feature_fitness[i_feature]:
+                feature_fitness[i_feature] = prefix_fitness
+            if prefix_fitness > feature_fitness[i_goal]:
+                feature_fitness[i_goal] = prefix_fitness
     return
 
 
@@ -340,14 +850,14 @@ def update_reward_credit(
     """
     # Age the prefix credit.
     n_features, n_goals = prefix_credit.shape
-    for i_feature in range(n_features):
+    for i_feature in prange(n_features):
         for i_goal in range(n_goals):
             # Exponential discounting
             prefix_credit[i_feature, i_goal] *= 1 - credit_decay_rate
 
     # Update the prefix credit.
     if i_new_goal > -1:
-        for i_feature in range(n_features):
+        for i_feature in prange(n_features):
             # Accumulation strategy:
             # add new credit to existing credit, with a max of 1.
             prefix_credit[i_feature, i_new_goal] += (
@@ -355,3 +865,541 @@ def update_reward_credit(
             prefix_credit[i_feature, i_new_goal] = min(
                 prefix_credit[i_feature, i_new_goal], 1)
     return
+
+
+# The functions below step a batch of models of the same size at once.
+# Each of the arrays has an extra leading axis, one element per model.
+# The models are independent of each other, so the loop over them
+# can be split across threads.
+
+
+@jit(nopython=True)
+def step_batch(
+    prefix_decay_rate,
+    reward_update_rate,
+    rewards,
+    curiosity_update_rate,
+    update_max,
+    previous_feature_activities,
+    feature_activities,
+    goal_activities,
+    prefix_activities,
+    prefix_occurrences,
+    prefix_uncertainties,
+    prefix_credit,
+    prefix_rewards,
+    prefix_curiosities,
+    sequence_occurrences,
+    max_sequence_occurrences,
+    conditional_predictions,
+    conditional_rewards,
+    conditional_curiosities,
+):
+    """
+    Update the sequences and prefixes of each model and make predictions.
+
+    For each model, this does the same work as Model.step after
+    its activities have been updated: the active features and prefixes
+    are gathered, sequences are counted, and the prefixes are updated
+    and used to make predictions.
+
+    Parameters
+    ----------
+    rewards: array of floats
+        The reward for each model.
+    update_max: boolean
+        If True, keep the running maximum in max_sequence_occurrences
+        up to date, as with the Model's incremental_fitness.
+    All others are the same as in the single-model functions,
+    with an added leading axis.
+    """
+    n_models = feature_activities.shape[0]
+    for i_model in prange(n_models):
+        i_active_features = find_active_features(
+            feature_activities[i_model])
+        i_prefix_features, i_prefix_goals = find_active_prefixes(
+            prefix_activities[i_model])
+
+        update_sequences_active(
+            i_active_features,
+            i_prefix_features,
+            i_prefix_goals,
+            feature_activities[i_model],
+            prefix_activities[i_model],
+            sequence_occurrences[i_model],
+        )
+        if update_max:
+            update_max_sequences(
+                i_active_features,
+                i_prefix_features,
+                i_prefix_goals,
+                sequence_occurrences[i_model],
+                max_sequence_occurrences[i_model],
+            )
+
+        update_and_predict(
+            prefix_decay_rate,
+            reward_update_rate,
+            rewards[i_model],
+            curiosity_update_rate,
+            previous_feature_activities[i_model],
+            feature_activities[i_model],
+            goal_activities[i_model],
+            prefix_activities[i_model],
+            prefix_occurrences[i_model],
+            prefix_uncertainties[i_model],
+            prefix_credit[i_model],
+            prefix_rewards[i_model],
+            prefix_curiosities[i_model],
+            None,
+            conditional_predictions[i_model],
+            conditional_rewards[i_model],
+            conditional_curiosities[i_model],
+        )
+        predict_features_active(
+            i_active_features,
+            feature_activities[i_model],
+            prefix_occurrences[i_model],
+            sequence_occurrences[i_model],
+            conditional_predictions[i_model],
+        )
+    return
+
+
+@jit(nopython=True)
+def update_fitness_batch(
+    feature_fitness,
+    prefix_occurrences,
+    prefix_rewards,
+    prefix_uncertainties,
+    max_sequence_occurrences,
+):
+    """
+    Calculate the fitness of each feature in each model.
+
+    The arguments are the same as in update_fitness,
+    with an added leading axis.
+    """
+    n_models = feature_fitness.shape[0]
+    for i_model in prange(n_models):
+        update_fitness(
+            feature_fitness[i_model],
+            prefix_occurrences[i_model],
+            prefix_rewards[i_model],
+            prefix_uncertainties[i_model],
+            max_sequence_occurrences[i_model],
+        )
+    return
+
+
+# The functions below support the sparse sequence storage in
+# sparse_sequences.py. Sequence counts are kept in an open-addressing
+# hash table made of two flat arrays, keys and counts. Each
+# (feature_1, goal, feature_2) triple is flattened to a single integer key,
+#     key = (i_feature * n_features + i_goal) * n_features + j_feature
+# and an empty slot holds a key of -1. The number of slots is always
+# a power of two, so that wrapping around the table is a bit mask.
+
+
+@jit(nopython=True)
+def find_slot(keys, key):
+    """
+    Find the slot that holds a key, or the empty slot where it belongs.
+
+    Parameters
+    ----------
+    keys: array of ints
+    key: int
+
+    Returns
+    -------
+    i_slot: int
+        If keys[i_slot] == key, the key is present. Otherwise
+        keys[i_slot] == -1 and the key is absent.
+    """
+    mask = keys.size - 1
+    i_slot = (key * 2654435761) & mask
+    while keys[i_slot] != key and keys[i_slot] != -1:
+        i_slot = (i_slot + 1) & mask
+    return i_slot
+
+
+@jit(nopython=True)
+def update_sequences_sparse(
+    i_active_features,
+    i_prefix_features,
+    i_prefix_goals,
+    feature_activities,
+    prefix_activities,
+    sequence_keys,
+    sequence_counts,
+    feature_baseline,
+):
+    """
+    Update the number of occurrences of each sequence, stored sparsely.
+
+    This is the sparse counterpart to update_sequences_active.
+    A sequence that has never been observed
+    implicitly holds its baseline count,
+    the product of the feature_baseline of each of its three members.
+
+    Parameters
+    ----------
+    i_active_features: array of ints
+        The output of find_active_features(feature_activities).
+    i_prefix_features,
+    i_prefix_goals: array of ints
+        The output of find_active_prefixes(prefix_activities).
+    feature_activities: array of floats
+    prefix_activities: 2D array of floats
+    sequence_keys: array of ints
+    sequence_counts: array of floats
+    feature_baseline: array of floats
+
+    Returns
+    -------
+    n_new: int
+        The number of sequences that were observed for the first time.
+    """
+    n_features, n_goals = prefix_activities.shape
+    n_new = 0
+    for i_prefix in range(i_prefix_features.size):
+        i_feature = i_prefix_features[i_prefix]
+        i_goal = i_prefix_goals[i_prefix]
+        prefix_activity = prefix_activities[i_feature, i_goal]
+        for j_feature in i_active_features:
+            key = (i_feature * n_goals + i_goal) * n_features + j_feature
+            i_slot = find_slot(sequence_keys, key)
+            if sequence_keys[i_slot] == -1:
+                sequence_keys[i_slot] = key
+                sequence_counts[i_slot] = (
+                    feature_baseline[i_feature] *
+                    feature_baseline[i_goal] *
+                    feature_baseline[j_feature])
+                n_new += 1
+            sequence_counts[i_slot] += (
+                prefix_activity * feature_activities[j_feature])
+    return n_new
+
+
+@jit(nopython=True)
+def predict_features_sparse(
+    feature_activities,
+    prefix_occurrences,
+    sequence_keys,
+    sequence_counts,
+    conditional_predictions,
+):
+    """
+    Make conditional feature predictions from sparsely stored sequences.
+
+    This is the sparse counterpart to predict_features. Sequences that
+    have never been observed hold a count of at most one, so they
+    can never predict a feature, and only the stored sequences
+    need to be visited.
+
+    Parameters
+    ----------
+    feature_activities: array of floats
+    prefix_occurrences: 2D array of floats
+    sequence_keys: array of ints
+    sequence_counts: array of floats
+    conditional_predictions: 2D array of floats
+        This is updated to represent the new predictions for this time step.
+    """
+    n_features, n_goals = prefix_occurrences.shape
+    for i_goal in range(n_goals):
+        for j_feature in range(n_features):
+            conditional_predictions[i_goal, j_feature] = 0.
+    for i_slot in range(sequence_keys.size):
+        key = sequence_keys[i_slot]
+        if key > -1:
+            i_feature = key // (n_goals * n_features)
+            if feature_activities[i_feature] > tools.epsilon:
+                i_goal = (key // n_features) % n_goals
+                j_feature = key % n_features
+                p_sequence = feature_activities[i_feature] * (
+                    (sequence_counts[i_slot] - 1) /
+                    (prefix_occurrences[i_feature, i_goal] + 1))
+                if p_sequence > conditional_predictions[i_goal, j_feature]:
+                    conditional_predictions[i_goal, j_feature] = p_sequence
+    return
+
+
+@jit(nopython=True)
+def index_new_predictions_sparse(
+    i_active_features,
+    i_prefix_features,
+    i_prefix_goals,
+    feature_activities,
+    prefix_activities,
+    sequence_keys,
+    sequence_counts,
+    feature_baseline,
+    index_heads,
+    index_next,
+    index_cells,
+    n_index_entries,
+):
+    """
+    Add the sparsely stored sequences about to become predictive to the index.
+
+    This is the sparse counterpart to index_new_predictions.
+    It has to be called before update_sequences_sparse.
+
+    Parameters
+    ----------
+    i_active_features,
+    i_prefix_features,
+    i_prefix_goals: array of ints
+        The same active indices passed to update_sequences_sparse.
+    feature_activities: array of floats
+    prefix_activities: 2D array of floats
+    sequence_keys: array of ints
+    sequence_counts: array of floats
+    feature_baseline: array of floats
+    index_heads,
+    index_next,
+    index_cells: array of ints
+    n_index_entries: int
+
+    Returns
+    -------
+    n_index_entries: int
+        The number of entries in the index after the additions.
+    """
+    n_features, n_goals = prefix_activities.shape
+    # Round the updated count to the precision it will be stored at,
+    # so that the test matches what update_sequences_sparse will store.
+    updated = np.empty(1, dtype=sequence_counts.dtype)
+    for i_prefix in range(i_prefix_features.size):
+        i_feature = i_prefix_features[i_prefix]
+        i_goal = i_prefix_goals[i_prefix]
+        prefix_activity = prefix_activities[i_feature, i_goal]
+        for j_feature in i_active_features:
+            key = (i_feature * n_goals + i_goal) * n_features + j_feature
+            i_slot = find_slot(sequence_keys, key)
+            if sequence_keys[i_slot] == -1:
+                updated[0] = (feature_baseline[i_feature] *
+                              feature_baseline[i_goal] *
+                              feature_baseline[j_feature])
+            else:
+                updated[0] = sequence_counts[i_slot]
+            occurrences = updated[0]
+            updated[0] = occurrences + (
+                prefix_activity * feature_activities[j_feature])
+            if occurrences <= 1 and updated[0] > 1:
+                index_cells[n_index_entries] = i_goal * n_features + j_feature
+                index_next[n_index_entries] = index_heads[i_feature]
+                index_heads[i_feature] = n_index_entries
+                n_index_entries += 1
+    return n_index_entries
+
+
+@jit(nopython=True)
+def predict_features_indexed_sparse(
+    i_active_features,
+    feature_activities,
+    prefix_occurrences,
+    sequence_keys,
+    sequence_counts,
+    index_heads,
+    index_next,
+    index_cells,
+    touched_cells,
+    n_touched,
+    conditional_predictions,
+):
+    """
+    Make conditional feature predictions using the prediction index,
+    with sparsely stored sequences.
+
+    This is the sparse counterpart to predict_features_indexed.
+
+    Parameters
+    ----------
+    i_active_features: array of ints
+    feature_activities: array of floats
+    prefix_occurrences: 2D array of floats
+    sequence_keys: array of ints
+    sequence_counts: array of floats
+    index_heads,
+    index_next,
+    index_cells: array of ints
+    touched_cells: array of ints
+    n_touched: int
+    conditional_predictions: 2D array of floats
+        This is updated to represent the new predictions for this time step.
+
+    Returns
+    -------
+    n_touched: int
+        The number of valid elements in touched_cells after the update.
+    """
+    n_goals, n_features = conditional_predictions.shape
+    for i_touched in range(n_touched):
+        cell = touched_cells[i_touched]
+        conditional_predictions[cell // n_features, cell % n_features] = 0.
+    n_touched = 0
+
+    for i_feature in i_active_features:
+        activity = feature_activities[i_feature]
+        i_entry = index_heads[i_feature]
+        while i_entry > -1:
+            cell = index_cells[i_entry]
+            i_goal = cell // n_features
+            j_feature = cell % n_features
+            i_slot = find_slot(
+                sequence_keys,
+                (i_feature * n_goals + i_goal) * n_features + j_feature)
+            p_sequence = activity * (
+                (sequence_counts[i_slot] - 1) /
+                (prefix_occurrences[i_feature, i_goal] + 1))
+            if p_sequence > conditional_predictions[i_goal, j_feature]:
+                if conditional_predictions[i_goal, j_feature] == 0.:
+                    touched_cells[n_touched] = cell
+                    n_touched += 1
+                conditional_predictions[i_goal, j_feature] = p_sequence
+            i_entry = index_next[i_entry]
+    return n_touched
+
+
+@jit(nopython=True)
+def max_sequences_sparse(
+    sequence_keys,
+    sequence_counts,
+    feature_baseline,
+    max_sequence_occurrences,
+):
+    """
+    Find the largest sequence count that follows each prefix.
+
+    This is the sparse equivalent of
+        np.max(sequence_occurrences, axis=2)
+
+    Parameters
+    ----------
+    sequence_keys: array of ints
+    sequence_counts: array of floats
+    feature_baseline: array of floats
+    max_sequence_occurrences: 2D array of floats
+        This is modified to hold the result.
+    """
+    n_features, n_goals = max_sequence_occurrences.shape
+    n_live = 0
+    for j_feature in range(n_features):
+        if feature_baseline[j_feature] > 0.:
+            n_live += 1
+
+    # Count how many of each prefix's stored sequences end in a
+    # feature that has never been reset.
+    n_stored_live = np.zeros((n_features, n_goals))
+    for i_feature in range(n_features):
+        for i_goal in range(n_goals):
+            max_sequence_occurrences[i_feature, i_goal] = 0.
+    for i_slot in range(sequence_keys.size):
+        key = sequence_keys[i_slot]
+        if key > -1:
+            i_feature = key // (n_goals * n_features)
+            i_goal = (key // n_features) % n_goals
+            j_feature = key % n_features
+            if feature_baseline[j_feature] > 0.:
+                n_stored_live[i_feature, i_goal] += 1
+            if (sequence_counts[i_slot] >
+                    max_sequence_occurrences[i_feature, i_goal]):
+                max_sequence_occurrences[i_feature, i_goal] = (
+                    sequence_counts[i_slot])
+
+    # Any sequence that isn't stored still holds its baseline count.
+    for i_feature in range(n_features):
+        for i_goal in range(n_goals):
+            if n_stored_live[i_feature, i_goal] < n_live:
+                baseline = (feature_baseline[i_feature] *
+                            feature_baseline[i_goal])
+                if baseline > max_sequence_occurrences[i_feature, i_goal]:
+                    max_sequence_occurrences[i_feature, i_goal] = baseline
+    return
+
+
+@jit(nopython=True)
+def update_max_sequences_sparse(
+    i_active_features,
+    i_prefix_features,
+    i_prefix_goals,
+    sequence_keys,
+    sequence_counts,
+    max_sequence_occurrences,
+):
+    """
+    Keep a running maximum of the sparsely stored sequence counts.
+
+    This is the sparse counterpart to update_max_sequences.
+
+    Parameters
+    ----------
+    i_active_features,
+    i_prefix_features,
+    i_prefix_goals: array of ints
+        The same active indices passed to update_sequences_sparse.
+    sequence_keys: array of ints
+    sequence_counts: array of floats
+    max_sequence_occurrences: 2D array of floats
+        This is modified to hold the updated maximum.
+    """
+    n_features, n_goals = max_sequence_occurrences.shape
+    for i_prefix in range(i_prefix_features.size):
+        i_feature = i_prefix_features[i_prefix]
+        i_goal = i_prefix_goals[i_prefix]
+        for j_feature in i_active_features:
+            key = (i_feature * n_goals + i_goal) * n_features + j_feature
+            i_slot = find_slot(sequence_keys, key)
+            if (sequence_counts[i_slot] >
+                    max_sequence_occurrences[i_feature, i_goal]):
+                max_sequence_occurrences[i_feature, i_goal] = (
+                    sequence_counts[i_slot])
+    return
+
+
+@jit(nopython=True)
+def rehash_sequences(
+    sequence_keys,
+    sequence_counts,
+    new_sequence_keys,
+    new_sequence_counts,
+    n_features,
+    is_reset,
+):
+    """
+    Copy stored sequences into a fresh table, dropping any that were reset.
+
+    Parameters
+    ----------
+    sequence_keys,
+    new_sequence_keys: array of ints
+    sequence_counts,
+    new_sequence_counts: array of floats
+    n_features: int
+    is_reset: array of booleans
+        If is_reset[i] is True, every sequence that includes
+        feature i is dropped.
+
+    Returns
+    -------
+    n_entries: int
+        The number of sequences in the new table.
+    """
+    n_entries = 0
+    for i_slot in range(sequence_keys.size):
+        key = sequence_keys[i_slot]
+        if key > -1:
+            i_feature = key // (n_features * n_features)
+            i_goal = (key // n_features) % n_features
+            j_feature = key % n_features
+            if not (is_reset[i_feature] or
+                    is_reset[i_goal] or
+                    is_reset[j_feature]):
+                j_slot = find_slot(new_sequence_keys, key)
+                new_sequence_keys[j_slot] = key
+                new_sequence_counts[j_slot] = sequence_counts[i_slot]
+                n_entries += 1
+    return n_entries
@@ -0,0 +1,63 @@
+"""
+Multi-threaded versions of the numba functions in model_numba.py.
+
+The functions whose outer loop is written with prange are compiled
+again here with parallel=True, so that their outer feature, goal or
+prefix loop is split across threads. The batch functions split
+their loop over models instead. The rest can't be split without
+threads colliding on their outputs. They are the same single-threaded
+functions found in model_numba.py.
+
+This module can be used anywhere model_numba is.
+The number of threads is set with numba.set_num_threads().
+"""
+
+from __future__ import print_function
+from numba import jit
+
+import becca.model_numba as nb
+
+
+def parallelize(function):
+    """
+    Compile a jitted function again, this time with parallel=True.
+
+    Parameters
+    ----------
+    function: numba Dispatcher
+        A function from model_numba.py.
+
+    Returns
+    -------
+    parallel_function: numba Dispatcher
+    """
+    return jit(nopython=True, parallel=True)(function.py_func)
+
+
+# Split across threads.
+update_sequences_active = parallelize(nb.update_sequences_active)
+update_prefixes = parallelize(nb.update_prefixes)
+update_rewards = parallelize(nb.update_rewards)
+update_curiosities = parallelize(nb.update_curiosities)
+predict_features_active = parallelize(nb.predict_features_active)
+max_sequences = parallelize(nb.max_sequences)
+update_max_sequences = parallelize(nb.update_max_sequences)
+update_reward_credit = parallelize(nb.update_reward_credit)
+step_batch = parallelize(nb.step_batch)
+update_fitness_batch = parallelize(nb.update_fitness_batch)
+
+# Single-threaded.
+find_active_features = nb.find_active_features
+find_active_prefixes = nb.find_active_prefixes
+index_new_predictions = nb.index_new_predictions
+predict_features_indexed = nb.predict_features_indexed
+predict_rewards = nb.predict_rewards
+predict_curiosities = nb.predict_curiosities
+update_and_predict = nb.update_and_predict
+update_fitness = nb.update_fitness
+update_sequences_sparse = nb.update_sequences_sparse
+predict_features_sparse = nb.predict_features_sparse
+index_new_predictions_sparse = nb.index_new_predictions_sparse
+predict_features_indexed_sparse = nb.predict_features_indexed_sparse
+max_sequences_sparse = nb.max_sequences_sparse
+update_max_sequences_sparse = nb.update_max_sequences_sparse
@@ -0,0 +1,533 @@
+"""
+The Planner class.
+"""
+
+from __future__ import print_function
+import time
+
+import numpy as np
+
+import becca.planner_numba as nb
+
+
+def fit_chunk(time_left, rate, fraction):
+    """
+    Decide how many rows, slots or features to do next.
+
+    How long the work takes varies with how full the graph is and
+    what is already in the cache, so the rate is only a rough guide.
+    Only a fraction of the time left is planned for at once.
+    The time the chunk takes gives a fresh rate for the next one.
+
+    Parameters
+    ----------
+    time_left : float
+        The time available, in seconds.
+    rate : float
+        How long the work took per row, slot or feature last time.
+        If it's zero, it hasn't been measured yet.
+    fraction : float
+        How much of time_left to plan for.
+
+    Returns
+    -------
+    n_chunk : int
+        At least one, so that the work always makes progress.
+    """
+    if rate == 0.:
+        return 1
+    return max(1, int(fraction * time_left / rate))
+
+
+class Planner(object):
+    """
+    Chain the Model's feature-goal-feature sequences into multi-step plans.
+
+    The Model's conditional rewards only look one step ahead.
+    They are the reward expected right after choosing each goal.
+    The Planner looks further ahead. It treats each prefix,
+    a feature-goal pair, as a state-action pair and each sequence as
+    a transition to a next feature, and runs value iteration over them.
+
+    To keep this affordable, the transitions are pruned to the
+    max_branches most likely next features of each prefix, and
+    the pruned graph is only rebuilt every rebuild_interval time steps.
+    The probabilities kept for each prefix are scaled to sum to
+    no more than one, so that values stay on the scale of the rewards.
+
+    Plans are worked out max_depth steps ahead, starting from scratch,
+    one sweep of value iteration at a time. When they are complete,
+    the prefix values are replaced by them and the next round starts,
+    with the latest prefix rewards and transition graph.
+
+    Each call to plan() does only as much of this as fits in its
+    time budget. Work that doesn't fit is picked up on the next call.
+    Both rebuilds and sweeps are done a few rows, or slots,
+    at a time, in copies of the graph and the values, which replace
+    the ones in use once they are complete. Until the first plans
+    are complete, the Model's own conditional rewards are used.
+    """
+    def __init__(
+        self,
+        model,
+        discount=.8,
+        max_branches=4,
+        max_depth=8,
+        min_probability=.01,
+        rebuild_interval=16,
+        time_budget=1e-3,
+    ):
+        """
+        Parameters
+        ----------
+        model : Model
+            The Model whose sequences are planned over.
+        discount : float
+            How much less a reward one step further in the future is worth.
+        max_branches : int
+            The largest number of next features kept for each prefix.
+        max_depth : int
+            The number of steps ahead that plans look.
+        min_probability : float
+            Transitions that are this unlikely, or less, are pruned.
+        rebuild_interval : int
+            How often the transition graph is rebuilt from the
+            Model's sequences, in calls to plan().
+        time_budget : float
+            The longest that planning may take on each call, in seconds.
+            Each call always does at least a little work, so very small
+            budgets can be overrun by the time it takes to visit
+            one feature.
+        """
+        self.model = model
+        self.discount = discount
+        self.max_branches = max_branches
+        self.max_depth = max_depth
+        self.min_probability = min_probability
+        self.rebuild_interval = rebuild_interval
+        self.time_budget = time_budget
+
+        n_features = self.model.n_features
+        # next_features : 2D array of ints
+        #     The pruned transition graph. Row
+        #     i_feature * n_features + i_goal lists the most likely
+        #     next features for the prefix (i_feature, i_goal),
+        #     the most likely first. Unused entries are -1.
+        # probabilities : 2D array of floats
+        #     The probability of each transition in next_features.
+        self.next_features = -np.ones(
+            (n_features * n_features, self.max_branches), dtype=np.int64)
+        self.probabilities = np.zeros(
+            (n_features * n_features, self.max_branches))
+        # pending_next_features, pending_probabilities : 2D arrays
+        #     The graph that is being rebuilt.
+        self.pending_next_features = self.next_features.copy()
+        self.pending_probabilities = self.probabilities.copy()
+        # is_stale : array of bools
+        #     The features that have been reset since the graph in use
+        #     was built. Transitions to them are ignored until
+        #     the next graph replaces it.
+        self.is_stale = np.zeros(n_features, dtype=bool)
+        # prefix_values : 2D array of floats
+        #     The value of each feature-goal prefix, looking
+        #     max_depth steps ahead. These are the prefix rewards, plus
+        #     the discounted value of the features they lead to.
+        self.prefix_values = np.zeros((n_features, n_features))
+        # sweep_feature_values : array of floats
+        #     The value of each feature, assuming that the best goal
+        #     is chosen from it and from each feature after it,
+        #     as far ahead as the sweeps in progress look.
+        # pending_feature_values : array of floats
+        #     The feature values that the sweep in progress is finding.
+        # sweep_prefix_values : 2D array of floats
+        #     The prefix values that the sweeps in progress are working out.
+        self.sweep_feature_values = np.zeros(n_features)
+        self.pending_feature_values = np.zeros(n_features)
+        self.sweep_prefix_values = np.zeros((n_features, n_features))
+        # conditional_rewards : array of floats
+        #     The value expected from choosing each goal, given
+        #     the current feature activities.
+        self.conditional_rewards = np.zeros(n_features)
+
+        # depth : int
+        #     The number of steps ahead that sweep_prefix_values look.
+        # sweep_position : int
+        #     How far the sweep in progress has gotten, in features.
+        self.depth = 0
+        self.sweep_position = 0
+        # n_plans : int
+        #     The number of times plan() has been called.
+        self.n_plans = 0
+        # is_built : boolean
+        #     Whether a transition graph has been completed yet.
+        # is_planned : boolean
+        #     Whether a round of sweeps has been completed yet.
+        self.is_built = False
+        self.is_planned = False
+        # rebuild_stages : tuple of strings
+        #     The steps of a rebuild, in order. Dense sequences are
+        #     collected a row at a time, which clears and normalizes
+        #     each row as it goes. Sparse sequences are stored by slot
+        #     rather than by prefix, so the rows are cleared before
+        #     the slots are visited and normalized afterward.
+        # rebuild_stage : int
+        #     Which of the rebuild_stages is in progress. None when
+        #     no rebuild is in progress.
+        # rebuild_position : int
+        #     How far the current stage has gotten, in rows of
+        #     the graph, or in slots while collecting sparse sequences.
+        # rebuild_keys : array of ints
+        #     The sparse sequence keys that are being collected.
+        #     If the table grows, slots move, and the rebuild starts over.
+        if self.model.storage == 'sparse':
+            self.rebuild_stages = ('clear', 'collect', 'normalize')
+        else:
+            self.rebuild_stages = ('collect',)
+        self.rebuild_stage = None
+        self.rebuild_position = 0
+        self.rebuild_keys = None
+        # rebuild_rates : dict of floats
+        #     How long each rebuild stage takes, per row or slot.
+        # sweep_rate : float
+        #     How long sweeping takes per feature.
+        # predict_time : float
+        #     How long predicting the conditional rewards took last time.
+        #     These times, in seconds, are used to decide
+        #     how much work will fit in the time budget.
+        #     A rate of zero means it hasn't been measured yet.
+        self.rebuild_rates = dict(
+            (stage, 0.) for stage in self.rebuild_stages)
+        self.sweep_rate = 0.
+        self.predict_time = 0.
+        # min_time : float
+        #     Chunks get smaller as the time left runs out.
+        #     Below this much time, it's not worth starting another.
+        self.min_time = self.time_budget / 32.
+
+        # Compile the kernels now, by running them over no features,
+        # so that compilation isn't mistaken for the time the work takes.
+        self.run_rebuild_stage('clear', 0, 0)
+        self.run_rebuild_stage('normalize', 0, 0)
+        if self.model.storage == 'sparse':
+            self.rebuild_keys = self.model.sequence_occurrences.keys
+        self.run_rebuild_stage('collect', 0, 0)
+        self.rebuild_keys = None
+        nb.plan_sweep(
+            0, 0,
+            self.discount,
+            self.model.prefix_rewards,
+            self.next_features,
+            self.probabilities,
+            self.is_stale,
+            self.sweep_feature_values,
+            self.sweep_prefix_values,
+            self.pending_feature_values,
+        )
+        nb.predict_values(
+            self.model.feature_activities,
+            self.prefix_values,
+            self.conditional_rewards,
+        )
+
+    def plan(self, feature_activities):
+        """
+        Find the value of choosing each goal, looking several steps ahead.
+
+        Parameters
+        ----------
+        feature_activities : array of floats
+            The current activities of the Model's features.
+
+        Returns
+        -------
+        conditional_rewards : array of floats
+            The value expected from choosing each goal. This is
+            the counterpart of the Model's conditional_rewards.
+            Until the first plans are complete, it is the Model's
+            conditional_rewards.
+        """
+        start_time = time.time()
+        self.n_plans += 1
+        # Leave time at the end to turn the values into predictions.
+        deadline = start_time + self.time_budget - self.predict_time
+
+        if self.n_plans % self.rebuild_interval == 0 or not self.is_built:
+            if self.rebuild_stage is None:
+                self.start_rebuild()
+        if self.rebuild_stage is not None:
+            if self.is_built:
+                # Share the time with the sweeps, so that rebuilds
+                # can't keep the plans from being finished.
+                self.continue_rebuild((deadline - time.time()) / 2.)
+            else:
+                self.continue_rebuild(deadline - time.time())
+
+        if self.is_built:
+            # Always sweep at least a little, so that the plans keep
+            # up with the model, even when the budget is spent.
+            self.continue_sweeps(deadline - time.time())
+
+        if not self.is_planned:
+            return self.model.conditional_rewards
+
+        predict_start = time.time()
+        nb.predict_values(
+            feature_activities,
+            self.prefix_values,
+            self.conditional_rewards,
+        )
+        self.predict_time = time.time() - predict_start
+        return self.conditional_rewards
+
+    def continue_sweeps(self, time_left):
+        """
+        Sweep as many features as fit in the time.
+
+        At least one feature is swept, so that the plans always
+        make progress. When the sweeps reach max_depth steps ahead,
+        their prefix values are put into use, and the next round
+        is left for the next call.
+
+        Parameters
+        ----------
+        time_left : float
+            The time available, in seconds.
+        """
+        n_features = self.model.n_features
+        # The first chunk is kept small, in case the rate has changed.
+        fraction = .125
+        while True:
+            n_chunk = fit_chunk(time_left, self.sweep_rate, fraction)
+            fraction = .5
+            i_start = self.sweep_position
+            i_stop = min(n_features, i_start + n_chunk)
+
+            sweep_start = time.time()
+            nb.plan_sweep(
+                i_start,
+                i_stop,
+                self.discount,
+                self.model.prefix_rewards,
+                self.next_features,
+                self.probabilities,
+                self.is_stale,
+                self.sweep_feature_values,
+                self.sweep_prefix_values,
+                self.pending_feature_values,
+            )
+            sweep_time = time.time() - sweep_start
+            self.sweep_rate = sweep_time / (i_stop - i_start)
+            time_left -= sweep_time
+            self.sweep_position = i_stop
+
+            if self.sweep_position == n_features:
+                self.sweep_position = 0
+                self.depth += 1
+                (self.sweep_feature_values,
+                    self.pending_feature_values) = (
+                        self.pending_feature_values,
+                        self.sweep_feature_values)
+                if self.depth == self.max_depth:
+                    (self.prefix_values,
+                        self.sweep_prefix_values) = (
+                            self.sweep_prefix_values, self.prefix_values)
+                    self.sweep_feature_values[:] = 0.
+                    self.depth = 0
+                    self.is_planned = True
+                    break
+            if time_left <= max(self.sweep_rate, self.min_time):
+                break
+
+    def start_rebuild(self):
+        """
+        Start rebuilding the pending graph from the first stage.
+        """
+        self.rebuild_stage = 0
+        self.rebuild_position = 0
+        self.rebuild_keys = None
+
+    def run_rebuild_stage(self, stage, i_start, i_stop):
+        """
+        Do part of one stage of a rebuild.
+
+        Parameters
+        ----------
+        stage : string
+            One of 'clear', 'collect' or 'normalize'.
+        i_start, i_stop : int
+            The rows, or slots, to visit.
+        """
+        if stage == 'clear':
+            nb.clear_transitions(
+                i_start,
+                i_stop,
+                self.min_probability,
+                self.pending_next_features,
+                self.pending_probabilities,
+            )
+        elif stage == 'normalize':
+            nb.normalize_transitions(
+                i_start,
+                i_stop,
+                self.pending_next_features,
+                self.pending_probabilities,
+            )
+        elif self.model.storage == 'sparse':
+            nb.collect_transitions_sparse(
+                i_start,
+                i_stop,
+                self.model.prefix_occurrences,
+                self.rebuild_keys,
+                self.model.sequence_occurrences.counts,
+                self.pending_next_features,
+                self.pending_probabilities,
+            )
+        else:
+            nb.collect_transitions(
+                i_start,
+                i_stop,
+                self.min_probability,
+                self.model.prefix_occurrences,
+                self.model.sequence_occurrences,
+                self.pending_next_features,
+                self.pending_probabilities,
+            )
+
+    def continue_rebuild(self, time_left):
+        """
+        Rebuild as much of the pruned transition graph as fits in the time.
+
+        At least one row or slot is visited, so that the rebuild
+        always makes progress. When it is complete, the new graph
+        replaces the old one.
+
+        Parameters
+        ----------
+        time_left : float
+            The time available, in seconds.
+        """
+        # The first chunk of each stage is kept small,
+        # in case the rate has changed.
+        fraction = .125
+        while True:
+            stage = self.rebuild_stages[self.rebuild_stage]
+            if stage == 'collect' and self.model.storage == 'sparse':
+                keys = self.model.sequence_occurrences.keys
+                if self.rebuild_keys is None:
+                    self.rebuild_keys = keys
+                elif keys is not self.rebuild_keys:
+                    self.start_rebuild()
+                    continue
+                n_total = self.rebuild_keys.size
+            else:
+                n_total = self.next_features.shape[0]
+
+            n_chunk = fit_chunk(
+                time_left, self.rebuild_rates[stage], fraction)
+            fraction = .5
+            i_start = self.rebuild_position
+            i_stop = min(n_total, i_start + n_chunk)
+
+            rebuild_start = time.time()
+            self.run_rebuild_stage(stage, i_start, i_stop)
+            rebuild_time = time.time() - rebuild_start
+            self.rebuild_rates[stage] = (
+                rebuild_time / max(1, i_stop - i_start))
+            time_left -= rebuild_time
+            self.rebuild_position = i_stop
+
+            if self.rebuild_position == n_total:
+                self.rebuild_stage += 1
+                self.rebuild_position = 0
+                fraction = .125
+                if self.rebuild_stage == len(self.rebuild_stages):
+                    self.finish_rebuild()
+                    return
+            stage = self.rebuild_stages[self.rebuild_stage]
+            if time_left <= max(self.rebuild_rates[stage], self.min_time):
+                return
+
+    def finish_rebuild(self):
+        """
+        Put the rebuilt graph into use.
+        """
+        (self.next_features,
+            self.pending_next_features) = (
+                self.pending_next_features, self.next_features)
+        (self.probabilities,
+            self.pending_probabilities) = (
+                self.pending_probabilities, self.probabilities)
+        # The new graph was built after the last reset.
+        self.is_stale[:] = False
+        self.rebuild_stage = None
+        self.rebuild_position = 0
+        self.rebuild_keys = None
+        self.is_built = True
+
+    def reset(self, resets):
+        """
+        Forget everything about features that the Model has reset.
+
+        Their indices are reused for new features, so the transitions
+        from and to them, and the values built on them, no longer apply.
+        Only the parts of the arrays that involve them are visited.
+
+        Parameters
+        ----------
+        resets : array of ints
+            Indices of the features that were reset.
+        """
+        if len(resets) == 0:
+            return
+        n_features = self.model.n_features
+        prefix_next_features = self.next_features.reshape(
+            (n_features, n_features, self.max_branches))
+        prefix_probabilities = self.probabilities.reshape(
+            (n_features, n_features, self.max_branches))
+        prefix_next_features[resets, :, :] = -1
+        prefix_next_features[:, resets, :] = -1
+        prefix_probabilities[resets, :, :] = 0.
+        prefix_probabilities[:, resets, :] = 0.
+        # Finding the transitions that lead to them would mean
+        # searching the whole graph. Instead they are marked,
+        # and skipped until the next graph is built.
+        self.is_stale[resets] = True
+        # Part of a rebuild in progress may have been built
+        # from the old features. It's simplest to start it over.
+        if self.rebuild_stage is not None:
+            self.start_rebuild()
+        for prefix_values in (self.prefix_values, self.sweep_prefix_values):
+            prefix_values[resets, :] = 0.
+            prefix_values[:, resets] = 0.
+        self.sweep_feature_values[resets] = 0.
+        self.pending_feature_values[resets] = 0.
+
+    def find_plan(self, i_feature):
+        """
+        Follow the best goals and most likely next features from a feature.
+
+        This is handy for inspecting what the Planner has learned.
+
+        Parameters
+        ----------
+        i_feature : int
+            The feature to start from.
+
+        Returns
+        -------
+        steps : list of (int, int) tuples
+            Each step is (i_goal, j_feature), the goal to choose
+            and the feature it most likely leads to. The plan ends after
+            max_depth steps, or when no next feature is likely enough.
+        """
+        n_goals = self.prefix_values.shape[1]
+        steps = []
+        for _ in range(self.max_depth):
+            i_goal = int(np.argmax(self.prefix_values[i_feature, :]))
+            j_feature = int(
+                self.next_features[i_feature * n_goals + i_goal, 0])
+            if j_feature < 0 or self.is_stale[j_feature]:
+                break
+            steps.append((i_goal, j_feature))
+            i_feature = j_feature
+        return steps
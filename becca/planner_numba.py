@@ -0,0 +1,327 @@
+"""
+Numba functions that support planner.py
+"""
+
+from __future__ import print_function
+from numba import jit
+
+
+@jit(nopython=True)
+def insert_transition(
+    i_prefix,
+    j_feature,
+    probability,
+    next_features,
+    probabilities,
+):
+    """
+    Add a transition to a prefix's list of its most likely next features.
+
+    Each prefix's row is kept sorted, most likely first. If the row is
+    full, the least likely transition is dropped.
+
+    Parameters
+    ----------
+    i_prefix: int
+        The row of the prefix, i_feature * n_goals + i_goal.
+    j_feature: int
+    probability: float
+    next_features: 2D array of ints
+    probabilities: 2D array of floats
+        See Planner.next_features and Planner.probabilities.
+    """
+    max_branches = next_features.shape[1]
+    if probability <= probabilities[i_prefix, max_branches - 1]:
+        return
+    i_branch = max_branches - 1
+    while (i_branch > 0 and
+           probability > probabilities[i_prefix, i_branch - 1]):
+        next_features[i_prefix, i_branch] = next_features[
+            i_prefix, i_branch - 1]
+        probabilities[i_prefix, i_branch] = probabilities[
+            i_prefix, i_branch - 1]
+        i_branch -= 1
+    next_features[i_prefix, i_branch] = j_feature
+    probabilities[i_prefix, i_branch] = probability
+
+
+@jit(nopython=True)
+def clear_transitions(
+    i_start,
+    i_stop,
+    min_probability,
+    next_features,
+    probabilities,
+):
+    """
+    Empty the rows of some prefixes, ready to be rebuilt.
+
+    Parameters
+    ----------
+    i_start, i_stop: int
+        The rows from i_start up to i_stop are cleared.
+    min_probability: float
+        The smallest probability worth keeping. Empty entries are
+        given this probability, so that only transitions more likely
+        than this take their place.
+    next_features: 2D array of ints
+    probabilities: 2D array of floats
+        See Planner.next_features and Planner.probabilities.
+    """
+    max_branches = next_features.shape[1]
+    for i_prefix in range(i_start, i_stop):
+        for i_branch in range(max_branches):
+            next_features[i_prefix, i_branch] = -1
+            probabilities[i_prefix, i_branch] = min_probability
+    return
+
+
+@jit(nopython=True)
+def normalize_transitions(
+    i_start,
+    i_stop,
+    next_features,
+    probabilities,
+):
+    """
+    Keep the total probability of each prefix's transitions below one.
+
+    The probability estimates are made for each next feature
+    separately. They don't form a distribution and can sum to more
+    than one. Scaling them back keeps each sweep of value iteration
+    from growing the values, so they stay on the scale of the rewards.
+    Empty entries are given a probability of zero.
+
+    Parameters
+    ----------
+    i_start, i_stop: int
+        The rows from i_start up to i_stop are normalized.
+    next_features: 2D array of ints
+    probabilities: 2D array of floats
+        See Planner.next_features and Planner.probabilities.
+    """
+    max_branches = next_features.shape[1]
+    for i_prefix in range(i_start, i_stop):
+        total = 0.
+        for i_branch in range(max_branches):
+            if next_features[i_prefix, i_branch] < 0:
+                probabilities[i_prefix, i_branch] = 0.
+            total += probabilities[i_prefix, i_branch]
+        if total > 1.:
+            for i_branch in range(max_branches):
+                probabilities[i_prefix, i_branch] /= total
+    return
+
+
+@jit(nopython=True)
+def collect_transitions(
+    i_start,
+    i_stop,
+    min_probability,
+    prefix_occurrences,
+    sequence_occurrences,
+    next_features,
+    probabilities,
+):
+    """
+    Build the pruned transition graph from dense sequence occurrences.
+
+    The probability of each feature-goal-feature transition is
+    estimated the same way as in model_numba.predict_features,
+
+        (s - 1) / (p + 1)
+
+    where
+
+        s: number of sequence occurrences
+        p: number of prefix occurrences
+
+    Only the most likely transitions are kept.
+    Only the rows from i_start up to i_stop are visited,
+    so that the graph can be built a piece at a time.
+    They are cleared first and normalized afterward.
+
+    Parameters
+    ----------
+    i_start, i_stop: int
+        Rows are numbered i_feature * n_goals + i_goal.
+    min_probability: float
+    prefix_occurrences: 2D array of floats
+    sequence_occurrences: 3D array of floats
+    next_features: 2D array of ints
+    probabilities: 2D array of floats
+        These are updated to represent the new transition graph.
+        See Planner.next_features and Planner.probabilities.
+    """
+    n_features, n_goals = prefix_occurrences.shape
+    clear_transitions(
+        i_start, i_stop, min_probability, next_features, probabilities)
+    for i_prefix in range(i_start, i_stop):
+        i_feature = i_prefix // n_goals
+        i_goal = i_prefix % n_goals
+        denominator = prefix_occurrences[i_feature, i_goal] + 1
+        # The "always on" feature, index 0, follows every prefix.
+        # It says nothing about where a plan leads, so it's skipped.
+        for j_feature in range(1, n_features):
+            probability = (
+                sequence_occurrences[i_feature, i_goal, j_feature] -
+                1) / denominator
+            insert_transition(
+                i_prefix, j_feature, probability,
+                next_features, probabilities)
+    normalize_transitions(i_start, i_stop, next_features, probabilities)
+    return
+
+
+@jit(nopython=True)
+def collect_transitions_sparse(
+    i_start,
+    i_stop,
+    prefix_occurrences,
+    sequence_keys,
+    sequence_counts,
+    next_features,
+    probabilities,
+):
+    """
+    Build the pruned transition graph from sparsely stored sequences.
+
+    This is the sparse counterpart to collect_transitions.
+    Sequences that have never been observed hold a count of at most one,
+    so they are never likely enough to be kept, and only the stored
+    sequences need to be visited. Only the slots from i_start up to
+    i_stop are visited. The slots aren't grouped by prefix, so the rows
+    have to be cleared with clear_transitions before any of the slots
+    are visited, and normalized with normalize_transitions after
+    all of them have been.
+
+    Parameters
+    ----------
+    i_start, i_stop: int
+    prefix_occurrences: 2D array of floats
+    sequence_keys: array of ints
+    sequence_counts: array of floats
+    next_features: 2D array of ints
+    probabilities: 2D array of floats
+        These are updated to represent the new transition graph.
+    """
+    n_features, n_goals = prefix_occurrences.shape
+    for i_slot in range(i_start, i_stop):
+        key = sequence_keys[i_slot]
+        if key > -1:
+            i_feature = key // (n_goals * n_features)
+            i_goal = (key // n_features) % n_goals
+            j_feature = key % n_features
+            # Skip the "always on" feature, as in collect_transitions.
+            if j_feature > 0:
+                probability = (sequence_counts[i_slot] - 1) / (
+                    prefix_occurrences[i_feature, i_goal] + 1)
+                insert_transition(
+                    i_feature * n_goals + i_goal, j_feature, probability,
+                    next_features, probabilities)
+    return
+
+
+@jit(nopython=True)
+def plan_sweep(
+    i_start,
+    i_stop,
+    discount,
+    prefix_rewards,
+    next_features,
+    probabilities,
+    is_stale,
+    feature_values,
+    prefix_values,
+    next_feature_values,
+):
+    """
+    Look one step further ahead, with one sweep of value iteration.
+
+    The value of each prefix is the reward expected from it, plus
+    the discounted value of the features it is expected to lead to.
+
+        q = r + discount * sum(p * v)
+
+    where
+
+        q: the value of the prefix
+        r: prefix rewards
+        p: the probability of each transition in the pruned graph
+        v: the value of the feature it leads to
+
+    The value of each feature is the value of its best prefix.
+
+    Only the prefixes of the features from i_start up to i_stop
+    are updated, so that a sweep can be spread over several calls.
+    The feature values they give are kept separate from the ones
+    being read, so that every prefix in the sweep sees the same
+    feature values.
+
+    Parameters
+    ----------
+    i_start, i_stop: int
+    discount: float
+    prefix_rewards: 2D array of floats
+    next_features: 2D array of ints
+        Unused entries, -1, are skipped.
+    probabilities: 2D array of floats
+    is_stale: array of bools
+        Transitions to these features are skipped. See Planner.is_stale.
+    feature_values: array of floats
+    prefix_values: 2D array of floats
+    next_feature_values: array of floats
+        These last two are updated in place.
+    """
+    n_goals = prefix_rewards.shape[1]
+    max_branches = next_features.shape[1]
+    for i_feature in range(i_start, i_stop):
+        best_value = 0.
+        for i_goal in range(n_goals):
+            i_prefix = i_feature * n_goals + i_goal
+            future_value = 0.
+            for i_branch in range(max_branches):
+                j_feature = next_features[i_prefix, i_branch]
+                if j_feature > -1 and not is_stale[j_feature]:
+                    future_value += (probabilities[i_prefix, i_branch] *
+                                     feature_values[j_feature])
+            value = (prefix_rewards[i_feature, i_goal] +
+                     discount * future_value)
+            prefix_values[i_feature, i_goal] = value
+            if i_goal == 0 or value > best_value:
+                best_value = value
+        next_feature_values[i_feature] = best_value
+    return
+
+
+@jit(nopython=True)
+def predict_values(
+    feature_activities,
+    prefix_values,
+    conditional_values,
+):
+    """
+    Find the value expected from choosing each goal.
+
+    This gives the same result as model_numba.predict_rewards,
+    with the prefix values in place of the prefix rewards.
+    Only the prefixes of active features can contribute,
+    so the others are skipped.
+
+    Parameters
+    ----------
+    feature_activities: array of floats
+    prefix_values: 2D array of floats
+    conditional_values: array of floats
+        This is updated to represent the new value predictions.
+    """
+    n_features, n_goals = prefix_values.shape
+    conditional_values[:] = 0.
+    for i_feature in range(n_features):
+        if feature_activities[i_feature] > 0.:
+            for i_goal in range(n_goals):
+                expected_value = (feature_activities[i_feature] *
+                                  prefix_values[i_feature, i_goal])
+                if expected_value > conditional_values[i_goal]:
+                    conditional_values[i_goal] = expected_value
+    return
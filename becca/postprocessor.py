@@ -83,3 +83,36 @@ class Postprocessor(object):
                     action_commands[i_action, :] > 0)[0][-1]] = 1
 
         return consolidated_commands, actions
+
+    def convert_to_commands(self, actions):
+        """
+        Find the commands that would produce a set of actions.
+
+        This is the inverse of convert_to_actions. Each action is
+        rounded to the nearest command magnitude. An action that
+        rounds to zero has no command.
+
+        Parameters
+        ----------
+        actions: array of floats
+            A set of actions, each between 0 and 1. This can also be
+            a 2D array, with one set of actions per row.
+
+        Returns
+        -------
+        commands: array of floats
+            The discretized commands for the actions, zeros and ones.
+            If actions is 2D, this has one set of commands per row.
+        """
+        actions = np.asarray(actions, dtype=float)
+        n_comands_per_action = self.mapping.shape[1]
+        # i_command: The index of each action's command within the
+        # commands for that action, or -1 if there is none.
+        i_command = np.minimum(
+            np.round(actions * n_comands_per_action).astype(int),
+            n_comands_per_action) - 1
+
+        commands = np.zeros(actions.shape + (n_comands_per_action,))
+        i_commanded = np.nonzero(i_command >= 0)
+        commands[i_commanded + (i_command[i_commanded],)] = 1
+        return np.reshape(commands, actions.shape[:-1] + (self.n_commands,))
@@ -0,0 +1,111 @@
+"""
+The PredictionIndex class.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+
+import becca.model_numba as nb
+
+
+class PredictionIndex(object):
+    """
+    Keep track of which sequences are able to make predictions.
+
+    A sequence only contributes to the Model's conditional_predictions
+    once it has occurred more than once. Most never do.
+    This index lists, for each feature, the (goal, feature) cells of
+    conditional_predictions that sequences starting with it can predict.
+    It lets predictions be made by visiting only the predictive sequences
+    of the active features, rather than every sequence that starts with
+    an active feature.
+
+    The index is a set of singly linked lists, one per feature,
+    stored in flat arrays so that it can be handed directly to
+    the numba functions in model_numba.py.
+    """
+    def __init__(self, n_features, capacity=1024):
+        """
+        Parameters
+        ----------
+        n_features: int
+            The number of features (and goals) in the model.
+        capacity: int
+            The initial number of entries the index has room for.
+        """
+        self.n_features = n_features
+
+        # heads: array of ints
+        #     The first entry in each feature's list, or -1 if it is empty.
+        self.heads = -np.ones(self.n_features, dtype=np.int64)
+        # next: array of ints
+        #     The entry following each entry in its list, or -1 at the end.
+        self.next = -np.ones(capacity, dtype=np.int64)
+        # cells: array of ints
+        #     The flattened (goal, feature) index of each entry's cell
+        #     in conditional_predictions, goal * n_features + feature.
+        self.cells = -np.ones(capacity, dtype=np.int64)
+        # n_entries: int
+        #     The number of entries currently in the index.
+        self.n_entries = 0
+
+        # touched_cells: array of ints
+        #     The cells of conditional_predictions that were given non-zero
+        #     values on the most recent time step. These are the only
+        #     ones that need to be cleared on the next time step.
+        # n_touched: int
+        #     The number of valid elements in touched_cells.
+        self.touched_cells = np.zeros(
+            self.n_features * self.n_features, dtype=np.int64)
+        self.n_touched = 0
+
+    def reserve(self, n_new):
+        """
+        Make sure there is room to add n_new more entries.
+
+        Parameters
+        ----------
+        n_new: int
+            The largest number of entries that may be added
+            before the next call to reserve().
+        """
+        capacity = self.cells.size
+        while self.n_entries + n_new > capacity:
+            capacity *= 2
+        if capacity > self.cells.size:
+            self.next = np.concatenate((
+                self.next,
+                -np.ones(capacity - self.next.size, dtype=np.int64)))
+            self.cells = np.concatenate((
+                self.cells,
+                -np.ones(capacity - self.cells.size, dtype=np.int64)))
+
+    def reset(self, resets):
+        """
+        Remove all entries that involve the reset features.
+
+        Parameters
+        ----------
+        resets: array of ints
+            The indices of the features to reset.
+        """
+        if len(resets) == 0:
+            return
+        is_reset = np.zeros(self.n_features, dtype=bool)
+        is_reset[resets] = True
+        new_heads = -np.ones(self.n_features, dtype=np.int64)
+        new_next = -np.ones(self.next.size, dtype=np.int64)
+        new_cells = -np.ones(self.cells.size, dtype=np.int64)
+        self.n_entries = nb.rebuild_prediction_index(
+            self.heads,
+            self.next,
+            self.cells,
+            new_heads,
+            new_next,
+            new_cells,
+            is_reset,
+        )
+        self.heads = new_heads
+        self.next = new_next
+        self.cells = new_cells
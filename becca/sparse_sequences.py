@@ -0,0 +1,147 @@
+"""
+The SparseSequences class.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+
+import becca.model_numba as nb
+
+
+class SparseSequences(object):
+    """
+    Store sequence occurrences sparsely, in a hash table.
+
+    The dense sequence_occurrences array in the Model has N**3 elements,
+    where N is the number of features. Most sequences are never observed,
+    and their count stays at its initial value. This class stores only
+    the (feature_1, goal, feature_2) sequences that have been observed,
+    so that memory grows with the number of observed sequences.
+
+    The table is a pair of flat arrays, keys and counts, that can be
+    handed directly to the numba functions in model_numba.py.
+    See model_numba.find_slot for the details of the hashing.
+    """
+    def __init__(
+        self,
+        n_features,
+        capacity=1024,
+        dtype=np.float64,
+        max_load=.5,
+    ):
+        """
+        Parameters
+        ----------
+        n_features: int
+            The number of features (and goals) in the model.
+        capacity: int
+            The initial number of slots in the table. This is rounded
+            up to a power of two.
+        dtype: numpy dtype
+            The floating point type of the counts.
+        max_load: float
+            The largest fraction of slots that are allowed to be full
+            before the table grows.
+        """
+        self.n_features = n_features
+        self.dtype = np.dtype(dtype)
+        self.max_load = max_load
+
+        # keys: array of ints
+        #     The flattened (feature_1, goal, feature_2) index of each
+        #     stored sequence. Empty slots are marked with a -1.
+        # counts: array of floats
+        #     The number of occurrences of each stored sequence.
+        capacity = int(2 ** np.ceil(np.log2(max(capacity, 2))))
+        self.keys = -np.ones(capacity, dtype=np.int64)
+        self.counts = np.zeros(capacity, dtype=self.dtype)
+        # n_entries: int
+        #     The number of sequences currently stored.
+        self.n_entries = 0
+
+        # feature_baseline: array of floats
+        #     The count that an unobserved sequence implicitly holds is
+        #     the product of the baselines of its three features.
+        #     Like the dense version, all sequences start out
+        #     having occurred once. Once a feature is reset, sequences
+        #     involving it start from zero.
+        self.feature_baseline = np.ones(self.n_features)
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used to store the sequences.
+        """
+        return (self.keys.nbytes + self.counts.nbytes +
+                self.feature_baseline.nbytes)
+
+    def reserve(self, n_new):
+        """
+        Make sure there is room to add n_new more sequences.
+
+        Parameters
+        ----------
+        n_new: int
+            The largest number of sequences that may be added
+            before the next call to reserve().
+        """
+        capacity = self.keys.size
+        while (self.n_entries + n_new) > capacity * self.max_load:
+            capacity *= 2
+        if capacity > self.keys.size:
+            self._rehash(capacity, np.zeros(self.n_features, dtype=bool))
+
+    def reset(self, resets):
+        """
+        Forget all sequences that involve the reset features.
+
+        Parameters
+        ----------
+        resets: array of ints
+            The indices of the features to reset.
+        """
+        if len(resets) == 0:
+            return
+        is_reset = np.zeros(self.n_features, dtype=bool)
+        is_reset[resets] = True
+        self.feature_baseline[is_reset] = 0.
+        self._rehash(self.keys.size, is_reset)
+
+    def to_dense(self):
+        """
+        Expand the stored sequences into a dense 3D array.
+
+        This is only practical for small models. It is handy
+        for visualization and debugging.
+
+        Returns
+        -------
+        sequence_occurrences: 3D array of floats
+        """
+        sequence_occurrences = (
+            self.feature_baseline[:, np.newaxis, np.newaxis] *
+            self.feature_baseline[np.newaxis, :, np.newaxis] *
+            self.feature_baseline[np.newaxis, np.newaxis, :]).astype(
+                self.dtype)
+        i_stored = np.where(self.keys > -1)[0]
+        sequence_occurrences.ravel()[self.keys[i_stored]] = (
+            self.counts[i_stored])
+        return sequence_occurrences
+
+    def _rehash(self, capacity, is_reset):
+        """
+        Move the stored sequences into a new table of the given size.
+        """
+        new_keys = -np.ones(capacity, dtype=np.int64)
+        new_counts = np.zeros(capacity, dtype=self.dtype)
+        self.n_entries = nb.rehash_sequences(
+            self.keys,
+            self.counts,
+            new_keys,
+            new_counts,
+            self.n_features,
+            is_reset,
+        )
+        self.keys = new_keys
+        self.counts = new_counts
@@ -344,7 +344,7 @@ def brain_activity(brain=None, dpi=300):
             color=frame_color,
             linewidth=frame_linewidth,
         )
-        ziptie = brain.featurizer.ziptie
+        ziptie = brain.featurizer.zipties[0]
         n_cables = ziptie.max_n_cables
         n_bundles = ziptie.n_bundles
         # Create circles for cables.
@@ -37,6 +37,8 @@ class Ziptie(object):
     def __init__(
             self,
             debug=False,
+            learning_interval=1,
+            max_bundles=None,
             n_cables=16,
             name=None,
             threshold=1e4,
@@ -49,6 +51,17 @@ class Ziptie(object):
         debug : boolean, optional
             Indicate whether to print informative status messages
             during execution. Default is False.
+        learning_interval : int, optional
+            Energy is gathered on every time step, but new bundles
+            are only created every learning_interval time steps, when
+            up to learning_interval bundles of each kind may be created.
+            Energy that climbs past twice the threshold triggers
+            bundle creation right away. Default is 1, every time step.
+        max_bundles : int, optional
+            The largest number of bundles the Ziptie can hold.
+            Storage for them is allocated up front. Once it is full,
+            the bundle that has been inactive the longest is evicted
+            to make room for a new one. Default is n_cables.
         n_cables : int
             The number of inputs to the Ziptie.
         name : str, optional
@@ -66,7 +79,30 @@ class Ziptie(object):
         self.n_cables = n_cables
         # n_bundles : int, optional
         #     The number of bundle outputs from the Ziptie.
+        #     This includes the slots of any bundles that have been reset
+        #     and not yet reused.
         self.n_bundles = 0
+        # max_bundles : int
+        #     See the max_bundles parameter above.
+        if max_bundles is None:
+            self.max_bundles = self.n_cables
+        else:
+            self.max_bundles = max_bundles
+        # learning_interval : int
+        #     See the learning_interval parameter above.
+        self.learning_interval = learning_interval
+        # timestep : int
+        #     The number of times update_bundles has been called.
+        self.timestep = 0
+        # bundle_last_active : array of ints
+        #     The most recent timestep on which each bundle was active,
+        #     or on which it was created. This determines which bundle
+        #     is evicted when there is no room for a new one.
+        self.bundle_last_active = np.zeros(self.max_bundles, dtype=int)
+        # evicted_bundles : list of ints
+        #     Bundles evicted since the last call to update_inputs.
+        #     They are passed upstream as resets with the next ones.
+        self.evicted_bundles = []
 
         # nucleation_threshold : float
         #     Threshold above which nucleation energy results in nucleation.
@@ -83,6 +119,10 @@ class Ziptie(object):
         # cable_activities : array of floats
         #     The current set of input actvities.
         self.cable_activities = np.zeros(self.n_cables)
+        # nonbundle_activities : array of floats
+        #     The part of the cable activities that isn't
+        #     represented in any bundle's activity.
+        self.nonbundle_activities = np.zeros(self.n_cables)
         # bundle_activities : array of floats
         #     The current set of bundle activities.
         self.bundle_activities = np.zeros(self.n_bundles)
@@ -91,13 +131,27 @@ class Ziptie(object):
         #     To get the cable indices for bundle i:
         #     [i_cables] = self.bundle_to_cable_mapping[i_bundle]
         #     An empty list shows an unused bundle.
-        self.bundle_to_cable_mapping = [[]]
+        self.bundle_to_cable_mapping = []
         # cable_to_bundle_mapping: list of lists
         #     To get the bundles that cable i contributes to:
         #     [i_bundles = self.cable_to_bundle_mapping[i_cable]
         #     An empty list shows that the cable is not a part
         #     of any bundle.
-        self.cable_to_bundle_mapping = [[]] * self.n_cables
+        self.cable_to_bundle_mapping = [[] for _ in range(self.n_cables)]
+
+        # bundle_cable_indptr, bundle_cable_indices: arrays of ints
+        #     The same information as bundle_to_cable_mapping, in
+        #     compressed sparse row (CSR) form, so that it can be handed
+        #     to the numba functions in ziptie_numba.py.
+        #     The cables of bundle i are
+        #         bundle_cable_indices[
+        #             bundle_cable_indptr[i]:bundle_cable_indptr[i + 1]]
+        # cable_bundle_indptr, cable_bundle_indices: arrays of ints
+        #     The same for cable_to_bundle_mapping. Together, the two
+        #     are the CSR and CSC forms of the bundle-cable incidence matrix.
+        #     They are rebuilt with update_incidence() whenever
+        #     the mappings change.
+        self.update_incidence()
 
         # bundle_map_cols, bundle_map_rows : array of ints
         #     To represent the sparse 2D bundle map, a pair of row and col
@@ -114,31 +168,41 @@ class Ziptie(object):
         # agglomeration_energy: 2D array of floats
         #     The accumulated agglomeration energy for each
         #     bundle-cable pair. Bundles are represented in rows,
-        #     cables are in columns.
-        self.agglomeration_energy = np.zeros((self.n_cables,
+        #     cables are in columns. There is a row for
+        #     each of the max_bundles possible bundles.
+        self.agglomeration_energy = np.zeros((self.max_bundles,
                                               self.n_cables))
-        # agglomeration_mask: 2D array of floats
+        # agglomeration_mask: 2D array of bools
         #     A binary array indicating which cable-bundle
         #     pairs are allowed to accumulate
         #     energy and which are not. Some combinations are
         #     disallowed because they result in redundant bundles.
-        self.agglomeration_mask = np.ones((self.n_cables,
-                                           self.n_cables))
+        #     Booleans take an eighth of the memory of floats.
+        self.agglomeration_mask = np.ones((self.max_bundles,
+                                           self.n_cables), dtype=bool)
         # nucleation_energy: 2D array of floats
         #     The accumualted nucleation energy associated
         #     with each cable-cable pair.
         self.nucleation_energy = np.zeros((self.n_cables,
                                            self.n_cables))
-        # nucleation_mask: 2D array of floats
+        # nucleation_mask: 2D array of bools
         #     A binary array indicating which cable-cable
         #     pairs are allowed to accumulate
         #     energy and which are not. Some combinations are
         #     disallowed because they result in redundant bundles.
         #     Make the diagonal zero to disallow cables to pair with
         #     themselves.
-        self.nucleation_mask = (
-            np.ones((self.n_cables, self.n_cables))
-            - np.eye(self.n_cables))
+        self.nucleation_mask = ~np.eye(self.n_cables, dtype=bool)
+
+        # max_nucleation_energy,
+        # max_agglomeration_energy: tuple of (float, int, int)
+        #     The largest nucleation and agglomeration energy and their
+        #     (row, column) locations, in the form returned by max_2d.
+        #     These are kept up to date as energy is gathered, rather than
+        #     found by scanning the whole arrays on each time step.
+        #     See check_max_energies().
+        self.max_nucleation_energy = (0., -1, -1)
+        self.max_agglomeration_energy = (0., -1, -1)
 
     def update_bundles(self, new_cable_activities):
         """
@@ -147,35 +211,34 @@ class Ziptie(object):
         Find bundle activities by taking the minimum input value
         in the set of cables in the bundle. The bulk of the computation
         occurs in ziptie_numba.find_bundle_activities.
+
+        Parameters
+        ----------
+        new_cable_activities: array of floats
+
+        Returns
+        -------
+        bundle_activities: array of floats
         """
+        self.timestep += 1
         self.cable_activities = new_cable_activities.copy()
-        #self.nonbundle_activities = self.cable_activities.copy()
-        #self.bundle_activities = np.zeros(self.max_num_bundles)
-        self.bundle_activities = 1e3 * np.ones(self.max_num_bundles)
-        if bundle_weights is None:
-            bundle_weights = np.ones(self.max_num_bundles)
-        if self.n_map_entries > 0:
-            #nb.find_bundle_activities(
-            #    self.bundle_map_rows[:self.n_map_entries],
-            #    self.bundle_map_cols[:self.n_map_entries],
-            #    self.nonbundle_activities,
-            #    self.bundle_activities,
-            #    bundle_weights, self.activity_threshold)
-            for i_map_entry in range(self.n_map_entries):
-                i_bundle = self.bundle_map_rows[i_map_entry]
-                i_cable = self.bundle_map_cols[i_map_entry]
-                self.bundle_activities[i_bundle] = (
-                    np.minimum(self.bundle_activities[i_bundle],
-                               self.cable_activities[i_cable]))
-        self.bundle_activities[np.where(self.bundle_activities == 1e3)] = 0.
-        self.bundle_activities *= bundle_weights
+        self.nonbundle_activities = self.cable_activities.copy()
+        self.bundle_activities = np.zeros(self.n_bundles)
+        nb.find_bundle_activities(
+            self.bundle_cable_indptr,
+            self.bundle_cable_indices,
+            self.nonbundle_activities,
+            self.bundle_activities,
+            self.activity_threshold,
+        )
+        self.bundle_last_active[np.where(self.bundle_activities > 0.)] = (
+            self.timestep)
         # The residual cable_activities after calculating
         # bundle_activities are the nonbundle_activities.
         # Sparsify them by setting all the small values to zero.
-        #self.nonbundle_activities[np.where(self.nonbundle_activities <
-        #                                   self.activity_threshold)] = 0.
-        return self.nonbundle_activities, self.bundle_activities
-
+        self.nonbundle_activities[np.where(self.nonbundle_activities <
+                                           self.activity_threshold)] = 0.
+        return self.bundle_activities
 
     def learn(self, masked_cable_activities):
         """
@@ -187,40 +250,85 @@ class Ziptie(object):
 
         Parameters
         ----------
-        new_cable_activities: array of floats
+        masked_cable_activities: array of floats
 
         Returns
         -------
         bundle_activities: array of floats
         """
-        self.cable_activities = new_cable_activities
+        self.cable_activities = masked_cable_activities
         self.bundle_activities = np.zeros(self.n_bundles)
-        for i_bundle, i_cables in enumerate(self.bundle_to_cable_mapping):
-            if len(i_cables) > 0:
-                self.bundle_activities[i_bundle] = np.min(
-                    self.cable_activities[i_cables])
+        nb.find_min_bundle_activities(
+            self.bundle_cable_indptr,
+            self.bundle_cable_indices,
+            self.cable_activities,
+            self.bundle_activities,
+        )
         return self.bundle_activities
 
+    def update_incidence(self):
+        """
+        Rebuild the compressed forms of the bundle-cable mappings.
+
+        Returns
+        -------
+        None, but updates class members
+        bundle_cable_indptr, bundle_cable_indices,
+        cable_bundle_indptr, cable_bundle_indices: arrays of ints
+        """
+        (self.bundle_cable_indptr,
+            self.bundle_cable_indices) = self._compress_mapping(
+                self.bundle_to_cable_mapping[:self.n_bundles])
+        (self.cable_bundle_indptr,
+            self.cable_bundle_indices) = self._compress_mapping(
+                self.cable_to_bundle_mapping)
+
+    def _compress_mapping(self, mapping):
+        """
+        Convert a list of lists of indices to compressed sparse form.
+
+        Parameters
+        ----------
+        mapping: list of lists of ints
+
+        Returns
+        -------
+        indptr: array of ints
+            Row i's entries are indices[indptr[i]:indptr[i + 1]].
+        indices: array of ints
+        """
+        indptr = np.zeros(len(mapping) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(row) for row in mapping])
+        indices = np.zeros(indptr[-1], dtype=np.int64)
+        for i_row, row in enumerate(mapping):
+            indices[indptr[i_row]:indptr[i_row + 1]] = row
+        return indptr, indices
+
     def create_new_bundles(self):
         """
         If the right conditions have been reached, create a new bundle.
         """
         # Incrementally accumulate nucleation energy.
-        nb.nucleation_energy_gather(self.cable_activities,
-                                    self.nucleation_energy,
-                                    self.nucleation_mask)
-        max_energy, i_cable_a, i_cable_b = nb.max_2d(self.nucleation_energy)
-
-        # Add a new bundle if appropriate
-        if max_energy > self.nucleation_threshold:
-            i_bundle = self.n_bundles
-            self.increment_n_bundles()
-
-            if len(self.bundle_to_cable_mapping) > i_bundle:
-                self.bundle_to_cable_mapping[i_bundle] =[i_cable_a, i_cable_b]
-            else:
-                self.bundle_to_cable_mapping.append(
-                    [i_cable_a, i_cable_b])
+        # Only the cable activity that isn't already explained by
+        # a bundle contributes. Few cables are active at once,
+        # so only the active ones are visited.
+        i_active_cables = nb.find_active(self.nonbundle_activities)
+        self.max_nucleation_energy = nb.nucleation_energy_gather_active(
+            i_active_cables,
+            self.nonbundle_activities,
+            self.nucleation_energy,
+            self.nucleation_mask,
+            *self.max_nucleation_energy)
+        max_energy, i_cable_a, i_cable_b = self.max_nucleation_energy
+        if not self.is_learning_step(max_energy, self.nucleation_threshold):
+            return
+
+        # Add new bundles if appropriate
+        n_created = 0
+        while (max_energy > self.nucleation_threshold and
+               n_created < self.learning_interval):
+            i_bundle = self.allocate_bundle()
+            self.bundle_to_cable_mapping[i_bundle] = [i_cable_a, i_cable_b]
             self.cable_to_bundle_mapping[i_cable_a].append(i_bundle)
             self.cable_to_bundle_mapping[i_cable_b].append(i_bundle)
 
@@ -235,18 +343,19 @@ class Ziptie(object):
 
             # Update nucleation_mask to prevent the two cables from
             # accumulating nucleation energy in the future.
-            self.nucleation_mask[i_cable_a, i_cable_b] = 0
-            self.nucleation_mask[i_cable_b, i_cable_a] = 0
+            self.nucleation_mask[i_cable_a, i_cable_b] = False
+            self.nucleation_mask[i_cable_b, i_cable_a] = False
 
             # Update agglomeration_mask to account for the new bundle.
             # The new bundle should not accumulate agglomeration energy
             # with any of the cables that any of its constituent cables
             # are blocked from nucleating with.
-            blocked_a = np.where(self.nucleation_mask[i_cable_a, :] == 0)[0]
-            blocked_b = np.where(self.nucleation_mask[i_cable_b, :] == 0)[0]
-            blocked = np.union1d(blocked_a, blocked_b)
-            self.agglomeration_mask[i_bundle, blocked] = 0
-
+            # With boolean masks, the union of the blocked sets
+            # is an elementwise or.
+            blocked = np.logical_or(~self.nucleation_mask[i_cable_a, :],
+                                    ~self.nucleation_mask[i_cable_b, :])
+            self.agglomeration_mask[i_bundle, blocked] = False
+            self.check_max_energies()
 
             if self.debug:
                 print(' '.join([
@@ -255,33 +364,51 @@ class Ziptie(object):
                     'added with cables', str(i_cable_a),
                     str(i_cable_b)
                 ]))
+            n_created += 1
+            max_energy, i_cable_a, i_cable_b = self.max_nucleation_energy
+
+        if n_created > 0:
+            self.update_incidence()
 
     def grow_bundles(self):
         """
         Update an estimate of co-activity between all cables.
         """
         # Incrementally accumulate agglomeration energy.
-        nb.agglomeration_energy_gather(self.bundle_activities,
-                                       self.cable_activities,
-                                       self.n_bundles,
-                                       self.agglomeration_energy,
-                                       self.agglomeration_mask)
-        max_energy, i_bundle, i_cable = nb.max_2d(self.agglomeration_energy)
-
-        # Add a new bundle if appropriate
-        if max_energy > self.agglomeration_threshold:
-            # Add the new bundle to the end of the list.
-            i_new_bundle = self.n_bundles
-            self.increment_n_bundles()
+        # Bundles created since the last call to update_bundles
+        # don't have an activity yet, so they are never among
+        # the active bundles.
+        i_active_bundles = nb.find_active(self.bundle_activities)
+        i_active_cables = nb.find_active(self.nonbundle_activities)
+        self.max_agglomeration_energy = (
+            nb.agglomeration_energy_gather_active(
+                i_active_bundles,
+                i_active_cables,
+                self.bundle_activities,
+                self.nonbundle_activities,
+                self.agglomeration_energy,
+                self.agglomeration_mask,
+                *self.max_agglomeration_energy))
+        max_energy, i_bundle, i_cable = self.max_agglomeration_energy
+        if not self.is_learning_step(
+                max_energy, self.agglomeration_threshold):
+            return
+
+        # Add new bundles if appropriate
+        n_created = 0
+        while (max_energy > self.agglomeration_threshold and
+               n_created < self.learning_interval):
+            # The growing bundle itself can't be evicted to make room.
+            i_new_bundle = self.allocate_bundle(i_keep=i_bundle)
 
             # Make a copy of the growing bundle.
-            self.bundle_to_cable_mapping.append(
+            self.bundle_to_cable_mapping[i_new_bundle] = list(
                 self.bundle_to_cable_mapping[i_bundle])
             # Add in the new cable.
             self.bundle_to_cable_mapping[i_new_bundle].append(i_cable)
             # Update the contributing cables.
-            for i_cable in self.bundle_to_cable_mapping[i_new_bundle]:
-                self.cable_to_bundle_mapping[i_cable].append(i_new_bundle)
+            for j_cable in self.bundle_to_cable_mapping[i_new_bundle]:
+                self.cable_to_bundle_mapping[j_cable].append(i_new_bundle)
 
             # Reset the accumulated nucleation and agglomeration energy
             # for the two cables involved.
@@ -298,18 +425,39 @@ class Ziptie(object):
             #    are blocked from nucleating with or
             # 2) the cables that its constituent bundle
             #    are blocked from agglomerating with.
-            blocked_cable = np.where(
-                self.nucleation_mask[i_cable, :] == 0.)
-            blocked_bundle = np.where(
-                self.agglomeration_mask[i_bundle, :] == 0.)
-            blocked = np.union1d(blocked_cable[0], blocked_bundle[0])
-            self.agglomeration_mask[i_new_bundle, blocked] = 0.
+            blocked = np.logical_or(~self.nucleation_mask[i_cable, :],
+                                    ~self.agglomeration_mask[i_bundle, :])
+            self.agglomeration_mask[i_new_bundle, blocked] = False
+            self.check_max_energies()
 
             if self.debug:
                 print(' '.join(['    ', self.name,
                                 'bundle', str(i_new_bundle),
                                 'added: bundle', str(i_bundle),
                                 'and cable', str(i_cable)]))
+            n_created += 1
+            max_energy, i_bundle, i_cable = self.max_agglomeration_energy
+
+        if n_created > 0:
+            self.update_incidence()
+
+    def is_learning_step(self, max_energy, threshold):
+        """
+        Decide whether to check for new bundles on this time step.
+
+        Parameters
+        ----------
+        max_energy: float
+            The largest accumulated energy.
+        threshold: float
+            The energy above which a bundle is created.
+
+        Returns
+        -------
+        is_learning_step: boolean
+        """
+        return (self.timestep % self.learning_interval == 0 or
+                max_energy > 2 * threshold)
 
     def update_inputs(self, resets):
         """
@@ -326,48 +474,119 @@ class Ziptie(object):
             The indices of the bundles to be reset.
         """
 
-        upstream_resets = []
+        # Evicted bundles were already removed. Their slots may
+        # even hold new bundles by now, but the features that
+        # depend on them still need to be reset.
+        upstream_resets = self.evicted_bundles
+        self.evicted_bundles = []
         for i_cable in resets:
-            for i_bundle in self.cable_to_bundle_mapping[i_cable]:
+            # Iterate over a copy. The bundles are removed from
+            # the mapping as they go.
+            for i_bundle in list(self.cable_to_bundle_mapping[i_cable]):
                 upstream_resets.append(i_bundle)
-                # Remove the bundle from the mappings in both directions.
-                for j_cable in self.bundle_to_cable_mapping[i_bundle]:
-                    self.cable_to_bundle_mapping[j_cable].remove(i_bundle)
-                self.bundle_to_cable_mapping[i_bundle] = []
+                self.remove_bundle(i_bundle)
 
-                self.agglomeration_mask[i_bundle, :] = 1
-                self.agglomeration_energy[i_bundle, :] = 0
-
-            self.agglomeration_mask[:, i_cable] = 1
+            self.agglomeration_mask[:, i_cable] = True
             self.agglomeration_energy[:, i_cable] = 0
 
-            self.nucleation_mask[i_cable, :] = 1
-            self.nucleation_mask[:, i_cable] = 1
-            self.nucleation_mask[i_cable, i_cable] = 0
+            self.nucleation_mask[i_cable, :] = True
+            self.nucleation_mask[:, i_cable] = True
+            self.nucleation_mask[i_cable, i_cable] = False
             self.nucleation_energy[i_cable, :] = 0
             self.nucleation_energy[:, i_cable] = 0
 
+        if len(upstream_resets) > 0:
+            self.update_incidence()
+        if len(resets) > 0:
+            self.check_max_energies()
         return upstream_resets
 
-    def increment_n_bundles(self):
+    def check_max_energies(self):
+        """
+        Make sure the maximum energies are still correct after a reset.
+
+        Energy is only ever gathered or cleared. Clearing can't raise
+        the maximum, so as long as the maximum element is untouched,
+        it is still the maximum. Only when it has been cleared
+        does the whole array need to be scanned again.
+
+        Returns
+        -------
+        None, but updates class members
+        max_nucleation_energy,
+        max_agglomeration_energy: tuple of (float, int, int)
+        """
+        max_energy, i_row, i_col = self.max_nucleation_energy
+        if i_row > -1 and self.nucleation_energy[i_row, i_col] != max_energy:
+            self.max_nucleation_energy = nb.max_2d(self.nucleation_energy)
+        max_energy, i_row, i_col = self.max_agglomeration_energy
+        if (i_row > -1 and
+                self.agglomeration_energy[i_row, i_col] != max_energy):
+            self.max_agglomeration_energy = nb.max_2d(
+                self.agglomeration_energy)
+
+    def allocate_bundle(self, i_keep=-1):
+        """
+        Find a slot for a new bundle.
+
+        The slot of a bundle that has been reset is reused first.
+        Next, if there is room, a new slot is added.
+        Otherwise, the bundle that has been inactive the longest is evicted.
+
+        Parameters
+        ----------
+        i_keep : int
+            The index of a bundle that must not be evicted.
+
+        Returns
+        -------
+        i_bundle : int
+            The index of the slot. Its cable list is empty and its
+            agglomeration energy and mask are cleared.
         """
-        Add one to n_map entries and grow the bundle map as needed.
+        for i_bundle in range(self.n_bundles):
+            if len(self.bundle_to_cable_mapping[i_bundle]) == 0:
+                break
+        else:
+            if self.n_bundles < self.max_bundles:
+                i_bundle = self.n_bundles
+                self.n_bundles += 1
+                self.bundle_to_cable_mapping.append([])
+            else:
+                last_active = self.bundle_last_active[:self.n_bundles].copy()
+                if i_keep > -1:
+                    last_active[i_keep] = np.iinfo(last_active.dtype).max
+                i_bundle = np.argmin(last_active)
+                self.remove_bundle(i_bundle)
+                self.evicted_bundles.append(i_bundle)
+
+                if self.debug:
+                    print(' '.join(['    ', self.name,
+                                    'bundle', str(i_bundle), 'evicted']))
+
+        # A new bundle counts as active, so that it isn't
+        # the next to be evicted.
+        self.bundle_last_active[i_bundle] = self.timestep
+        return i_bundle
+
+    def remove_bundle(self, i_bundle):
+        """
+        Remove a bundle from the mappings and clear its energy.
+
+        The caller is responsible for calling update_incidence()
+        and check_max_energies() afterward.
+
+        Parameters
+        ----------
+        i_bundle : int
         """
-        self.n_bundles += 1
-        n_max_bundles = self.agglomeration_energy.shape[0]
-        if self.n_bundles >= n_max_bundles:
-            new_max_bundles = n_max_bundles * 2
-            new_agglomeration_energy = np.zeros(
-                (new_max_bundles, self.n_cables))
-            new_agglomeration_energy[:new_max_bundles, :] = (
-                    self.agglomeration_energy)
-            self.agglomeration_energy = new_agglomeration_energy
+        # Remove the bundle from the mappings in both directions.
+        for j_cable in self.bundle_to_cable_mapping[i_bundle]:
+            self.cable_to_bundle_mapping[j_cable].remove(i_bundle)
+        self.bundle_to_cable_mapping[i_bundle] = []
 
-            new_agglomeration_mask = np.zeros(
-                (new_max_bundles, self.n_cables))
-            new_agglomeration_mask[:new_max_bundles, :] = (
-                    self.agglomeration_mask)
-            self.agglomeration_mask = new_agglomeration_mask
+        self.agglomeration_mask[i_bundle, :] = True
+        self.agglomeration_energy[i_bundle, :] = 0
 
     def get_index_projection(self, i_bundle):
         """
@@ -421,10 +640,12 @@ class Ziptie(object):
         cable_activities: array of floats
         """
         cable_activities = np.zeros(self.n_cables)
-        for i_cable, i_bundles in enumerate(self.cable_to_bundle_mapping):
-            if len(i_bundles) > 0:
-                cable_activities[i_cable] = np.min(
-                    self.bundle_activities[i_bundles])
+        nb.project_min_activities(
+            self.cable_bundle_indptr,
+            self.cable_bundle_indices,
+            bundle_activities,
+            cable_activities,
+        )
         return cable_activities
 
     def visualize(self):
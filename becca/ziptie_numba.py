@@ -11,11 +11,15 @@ as possible.
 The (nopython=True) call makes it so that if numba can't compile the code
 to C (very fast), but is forced to fall back to python instead (dead slow
 when doing loops), the function will fail and throw an error.
+The (nogil=True) call releases Python's global interpreter lock
+while the compiled code runs, so that the zipties of a pipelined
+Featurizer can run their kernels in parallel on separate threads.
 """
 from numba import jit
+import numpy as np
 
 
-@jit(nopython=True)
+@jit(nopython=True, nogil=True)
 def set_dense_val(array2d, i_rows, i_cols, val):
     """
     Set values in a dense 2D array using a list of indices.
@@ -38,7 +42,7 @@ def set_dense_val(array2d, i_rows, i_cols, val):
             array2d[i_rows[i], i_cols[i]] = val
 
 
-@jit(nopython=True)
+@jit(nopython=True, nogil=True)
 def max_2d(array2d):
     """
     Find the maximum value of a dense 2D array, with its row and column
@@ -71,111 +75,179 @@ def max_2d(array2d):
     return (max_val, i_row_max, i_col_max)
 
 
-'''
-@jit(nopython=True)
-def find_bundle_activities(i_rows, i_cols, cables, bundles, weights, threshold):
+@jit(nopython=True, nogil=True)
+def find_min_bundle_activities(
+    bundle_cable_indptr,
+    bundle_cable_indices,
+    cable_activities,
+    bundle_activities,
+):
+    """
+    Find the activity of each bundle, the minimum of its cables' activities.
+
+    Parameters
+    ----------
+    bundle_cable_indptr, bundle_cable_indices : arrays of ints
+        The cables in each bundle, in compressed sparse row form.
+        The cables of bundle i are
+            bundle_cable_indices[
+                bundle_cable_indptr[i]:bundle_cable_indptr[i + 1]]
+    cable_activities : array of floats
+        The activity of each cable.
+    bundle_activities : array of floats
+        The activity of each bundle.
+
+    Results
+    -------
+    Returned indirectly by modifying bundle_activities.
+    Bundles without any cables have an activity of zero.
+    """
+    n_bundles = bundle_cable_indptr.size - 1
+    for i_bundle in range(n_bundles):
+        start = bundle_cable_indptr[i_bundle]
+        stop = bundle_cable_indptr[i_bundle + 1]
+        if stop == start:
+            bundle_activities[i_bundle] = 0.
+            continue
+        min_activity = cable_activities[bundle_cable_indices[start]]
+        for i_entry in range(start + 1, stop):
+            activity = cable_activities[bundle_cable_indices[i_entry]]
+            if activity < min_activity:
+                min_activity = activity
+        bundle_activities[i_bundle] = min_activity
+
+
+@jit(nopython=True, nogil=True)
+def project_min_activities(
+    cable_bundle_indptr,
+    cable_bundle_indices,
+    bundle_activities,
+    cable_activities,
+):
+    """
+    Project bundle activities down to cables.
+
+    Each cable takes the minimum activity of the bundles it belongs to.
+
+    Parameters
+    ----------
+    cable_bundle_indptr, cable_bundle_indices : arrays of ints
+        The bundles each cable belongs to, in compressed sparse form.
+        The bundles of cable i are
+            cable_bundle_indices[
+                cable_bundle_indptr[i]:cable_bundle_indptr[i + 1]]
+    bundle_activities : array of floats
+        The activity of each bundle.
+    cable_activities : array of floats
+        The activity of each cable.
+
+    Results
+    -------
+    Returned indirectly by modifying cable_activities.
+    Cables that aren't in any bundle are left alone.
+    """
+    n_cables = cable_bundle_indptr.size - 1
+    for i_cable in range(n_cables):
+        start = cable_bundle_indptr[i_cable]
+        stop = cable_bundle_indptr[i_cable + 1]
+        if stop == start:
+            continue
+        min_activity = bundle_activities[cable_bundle_indices[start]]
+        for i_entry in range(start + 1, stop):
+            activity = bundle_activities[cable_bundle_indices[i_entry]]
+            if activity < min_activity:
+                min_activity = activity
+        cable_activities[i_cable] = min_activity
+
+
+@jit(nopython=True, nogil=True)
+def find_bundle_activities(
+    bundle_cable_indptr,
+    bundle_cable_indices,
+    cable_activities,
+    bundle_activities,
+    threshold,
+):
     """
     Use a greedy method to sparsely translate cables to bundles.
 
-    Start at the last bundle added and work backward to the first.
-    For each, calculate the bundle activity by finding the minimum
-    value of each of its constituent cables. Then subtract out
-    the bundle activity from each of its cables.
+    Repeatedly find the bundle that best explains the remaining
+    cable activities. Its activity is the minimum activity of its
+    constituent cables. Then subtract the bundle activity from each of
+    its cables, leaving the residual for the remaining bundles.
 
     Parameters
     ----------
-    bundles : 1D array of floats
-        An array of bundle activity values. Initially it is all zeros.
-    cables : 1D array of floats
-        An array of cable activity values.
-    i_rows : array of ints
-        The row indices for the non-zero sparse 2D array..
-    i_cols : array of ints
-        The column indices for the non-zero sparse 2D array elements.
-        All non-zero elements are assumed to be 1.
-        i_rows and i_cols must be the same length.
-        Each column represents a cable and each row represents a bundle.
-        The 2D array is a map from cables to bundles.
+    bundle_cable_indptr, bundle_cable_indices : arrays of ints
+        The cables in each bundle, in compressed sparse row form.
+        See find_min_bundle_activities.
+    cable_activities : array of floats
+        The activity of each cable.
+    bundle_activities : array of floats
+        The activity of each bundle.
     threshold : float
-        The amount of bundle activity below which, we just don't care.
-    weights : array of floats
-        A multiplier for how strongly the activity of each bundle should
-        be considered when greedily selecting the next one to activate.
+        The bundle vote below which, we just don't care.
 
     Results
     -------
-    Returned indirectly by modifying `cables. These are the residual
-    cable activities that are not represented by any bundle activities.
+    Returned indirectly by modifying bundle_activities and
+    cable_activities. After the call, cable_activities holds
+    the residual cable activities that are not represented by
+    any bundle activities.
     """
-    large = 1e10
-    max_vote = large
+    n_bundles = bundle_cable_indptr.size - 1
+    for i_bundle in range(n_bundles):
+        bundle_activities[i_bundle] = 0.
 
     # Repeat this process until the residual cable activities don't match
     # any bundles well.
-    while max_vote > threshold:
-        # Initialize the loop that greedily looks for the most strongly
-        # activated bundle.
+    while True:
+        # Greedily look for the most strongly activated bundle.
         max_vote = 0.
-        best_val = 0.
-        best_bundle = 0
-        # This is the index in i_row and i_col where the
-        # current bundle's cable constituents are listed. Cable indices
-        # are assumed to be contiguous and bundles are assumed to be
-        # listed in ascending order of index.
-        i_best_bundle = 0
-
-        # Iterate over each bundle, that is, over each row.
-        i = len(i_rows) - 1
-        row = i_rows[i]
-        while row > -1:
+        best_activity = 0.
+        best_bundle = -1
+        # Start at the last bundle added and work backward to the first.
+        # In a tie, the more recently added bundle wins.
+        for i_bundle in range(n_bundles - 1, -1, -1):
+            start = bundle_cable_indptr[i_bundle]
+            stop = bundle_cable_indptr[i_bundle + 1]
+            if stop == start:
+                continue
 
             # For each bundle, find the minimum cable activity that
             # contribues to it.
-            min_val = large
-            n_cables = 0.
-            i_bundle = i
-            while i_rows[i] == row and i > -1:
-                col = i_cols[i]
-                val = cables[col]
-                if val < min_val:
-                    min_val = val
-                n_cables += 1.
-                i -= 1
+            min_activity = cable_activities[bundle_cable_indices[start]]
+            for i_entry in range(start + 1, stop):
+                activity = cable_activities[bundle_cable_indices[i_entry]]
+                if activity < min_activity:
+                    min_activity = activity
 
             # The strength of the vote for the bundle is the minimum cable
             # activity multiplied by the number of cables. This weights
             # bundles with many member cables more highly than bundles
             # with few cables. It is a way to encourage sparsity and to
             # avoid creating more bundles than necessary.
-            vote = min_val * (1. + .1 * (n_cables - 1.)) * (1. + weights[row])
+            vote = min_activity * (1. + .1 * (stop - start - 1))
 
             # Update the winning bundle if appropriate.
             if vote > max_vote:
                 max_vote = vote
-                best_val = min_val
-                i_best_bundle = i_bundle
-                best_bundle = row
-
-            # Move on to the next bundle.
-            row -= 1
-
-        if best_val > 0.:
-            # Set the bundle activity.
-            bundles[best_bundle] = best_val
-
-            # Subtract the bundle activity from each of the cables.
-            # Using i_best_bundle lets us jump right to the place in
-            # the list of indices where the cables for the winning bundle
-            # are listed.
-            i = i_best_bundle
-            while i_rows[i] == best_bundle and i > -1:
-                col = i_cols[i]
-                cables[col] -= best_val
-                i -= 1
-'''
-
-
-@jit(nopython=True)
+                best_activity = min_activity
+                best_bundle = i_bundle
+
+        if best_bundle == -1 or max_vote <= threshold:
+            break
+
+        # Set the bundle activity and subtract it from each of the cables.
+        # At least one of the cables is left with no activity, so
+        # the bundle can't win again.
+        bundle_activities[best_bundle] = best_activity
+        for i_entry in range(bundle_cable_indptr[best_bundle],
+                             bundle_cable_indptr[best_bundle + 1]):
+            cable_activities[bundle_cable_indices[i_entry]] -= best_activity
+
+
+@jit(nopython=True, nogil=True)
 def nucleation_energy_gather(
     cable_activities,
     nucleation_energy,
@@ -196,7 +268,7 @@ def nucleation_energy_gather(
     nucleation_energy : 2D array of floats
         The amount of nucleation energy accumulated between each pair of
         input features.
-    nucleation_mask: 2D array of floats
+    nucleation_mask: 2D array of bools
         A mask showing which input-input pairs are allowed
         to accumulate energy.
 
@@ -214,7 +286,7 @@ def nucleation_energy_gather(
                             activity1 * activity2)
 
 
-@jit(nopython=True)
+@jit(nopython=True, nogil=True)
 def agglomeration_energy_gather(
     bundle_activities,
     cable_activities,
@@ -242,8 +314,8 @@ def agglomeration_energy_gather(
     agglomeration_energy : 2D array of floats
         The total energy that has been accumulated between each input feature
         and each bundle.
-    agglomeration_mask: 2D array of floats
-        A mask showing which input-input pairs are allowed
+    agglomeration_mask: 2D array of bools
+        A mask showing which bundle-input pairs are allowed
         to accumulate energy.
 
     Results
@@ -258,3 +330,171 @@ def agglomeration_energy_gather(
                     if agglomeration_mask[i_bundle, i_cable]:
                         coactivity = activity * bundle_activities[i_bundle]
                         agglomeration_energy[i_bundle, i_cable] += coactivity
+
+
+@jit(nopython=True, nogil=True)
+def find_active(activities):
+    """
+    Find the indices of the elements with non-zero activity.
+
+    Parameters
+    ----------
+    activities : array of floats
+
+    Returns
+    -------
+    i_active : array of ints
+        The indices of the elements greater than zero, in order.
+    """
+    n_active = 0
+    for activity in activities:
+        if activity > 0.:
+            n_active += 1
+    i_active = np.zeros(n_active, dtype=np.int64)
+    n_active = 0
+    for i, activity in enumerate(activities):
+        if activity > 0.:
+            i_active[n_active] = i
+            n_active += 1
+    return i_active
+
+
+@jit(nopython=True, nogil=True)
+def is_new_max(value, i_row, i_col, max_val, i_row_max, i_col_max):
+    """
+    Check whether an element beats the current maximum of a 2D array.
+
+    Ties go to the element that comes first in row-major order,
+    the same one that max_2d would find.
+
+    Parameters
+    ----------
+    value : float
+        The element's value.
+    i_row, i_col : ints
+        The element's row and column.
+    max_val : float
+    i_row_max, i_col_max : ints
+        The current maximum and its location.
+        A location of -1 means there isn't one yet.
+
+    Returns
+    -------
+    is_new : boolean
+    """
+    if value > max_val:
+        return True
+    if value == max_val and value > 0. and i_row_max > -1:
+        if i_row < i_row_max:
+            return True
+        if i_row == i_row_max and i_col < i_col_max:
+            return True
+    return False
+
+
+@jit(nopython=True, nogil=True)
+def nucleation_energy_gather_active(
+    i_active_cables,
+    cable_activities,
+    nucleation_energy,
+    nucleation_mask,
+    max_energy,
+    i_row_max,
+    i_col_max,
+):
+    """
+    Gather nucleation energy, visiting only pairs of active cables.
+
+    This gives the same result as nucleation_energy_gather, but
+    the work grows with the square of the number of active cables,
+    rather than with the number of active cables times
+    the number of cables.
+
+    Energy only grows here, and only for the pairs visited, so
+    the maximum energy can be kept up to date along the way.
+    That saves a scan of the whole array with max_2d.
+
+    Parameters
+    ----------
+    i_active_cables : array of ints
+        The indices of the cables with non-zero activity,
+        as returned by find_active.
+    max_energy : float
+    i_row_max, i_col_max : ints
+        The maximum nucleation energy before this call, and its location,
+        as from max_2d.
+    All others are the same as in nucleation_energy_gather.
+
+    Returns
+    -------
+    max_energy : float
+    i_row_max, i_col_max : ints
+        The maximum nucleation energy after this call, and its location.
+        nucleation_energy is also modified.
+    """
+    for i_cable1 in i_active_cables:
+        activity1 = cable_activities[i_cable1]
+        for i_cable2 in i_active_cables:
+            if nucleation_mask[i_cable1, i_cable2]:
+                nucleation_energy[i_cable1, i_cable2] += (
+                    activity1 * cable_activities[i_cable2])
+                energy = nucleation_energy[i_cable1, i_cable2]
+                if is_new_max(energy, i_cable1, i_cable2,
+                              max_energy, i_row_max, i_col_max):
+                    max_energy = energy
+                    i_row_max = i_cable1
+                    i_col_max = i_cable2
+    return (max_energy, i_row_max, i_col_max)
+
+
+@jit(nopython=True, nogil=True)
+def agglomeration_energy_gather_active(
+    i_active_bundles,
+    i_active_cables,
+    bundle_activities,
+    cable_activities,
+    agglomeration_energy,
+    agglomeration_mask,
+    max_energy,
+    i_row_max,
+    i_col_max,
+):
+    """
+    Accumulate agglomeration energy, visiting only active bundles and cables.
+
+    This gives the same result as agglomeration_energy_gather.
+    Like nucleation_energy_gather_active, it keeps the maximum energy
+    up to date.
+
+    Parameters
+    ----------
+    i_active_bundles, i_active_cables : arrays of ints
+        The indices of the bundles and cables with non-zero activity,
+        as returned by find_active.
+    max_energy : float
+    i_row_max, i_col_max : ints
+        The maximum agglomeration energy before this call,
+        and its location.
+    All others are the same as in agglomeration_energy_gather.
+
+    Returns
+    -------
+    max_energy : float
+    i_row_max, i_col_max : ints
+        The maximum agglomeration energy after this call,
+        and its location. agglomeration_energy is also modified.
+    """
+    # Bundles are in rows, so visit them in the outer loop.
+    for i_bundle in i_active_bundles:
+        bundle_activity = bundle_activities[i_bundle]
+        for i_cable in i_active_cables:
+            if agglomeration_mask[i_bundle, i_cable]:
+                agglomeration_energy[i_bundle, i_cable] += (
+                    cable_activities[i_cable] * bundle_activity)
+                energy = agglomeration_energy[i_bundle, i_cable]
+                if is_new_max(energy, i_bundle, i_cable,
+                              max_energy, i_row_max, i_col_max):
+                    max_energy = energy
+                    i_row_max = i_bundle
+                    i_col_max = i_cable
+    return (max_energy, i_row_max, i_col_max)
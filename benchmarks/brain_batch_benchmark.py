@@ -0,0 +1,110 @@
+"""
+Compare stepping many small Brains one at a time and as a BrainBatch.
+
+Run from the root of the repository:
+
+    python -m benchmarks.brain_batch_benchmark
+
+The Brains are given the same random sensors and rewards either way.
+The two are stepped in alternation, one time step each, so that
+both see the same load on the machine, and the median time per step
+is reported for each. The share of the BrainBatch's time that is
+spent in the batched model step is reported too. Everything else,
+from the preprocessor through the featurizer, the actor and the
+postprocessor, is still done one Brain at a time.
+"""
+
+from __future__ import print_function
+import time
+
+import numpy as np
+
+from becca.brain import Brain
+from becca.brain_batch import BrainBatch
+
+
+def benchmark(
+    brain_counts=(1, 16, 128),
+    n_actions=2,
+    n_features=16,
+    n_sensors=4,
+    n_steps=50,
+):
+    """
+    Time stepping Brains one at a time and as a batch, and print a table.
+
+    Parameters
+    ----------
+    brain_counts: tuple of ints
+    n_actions, n_features, n_sensors: int
+        The size of each Brain. See Brain.
+    n_steps: int
+        How many time steps to time. A few more are run first,
+        so that numba compilation isn't timed.
+    """
+    print(' '.join([
+        '{0:>10}'.format('brains'),
+        '{0:>14}'.format('one by one ms'),
+        '{0:>14}'.format('batch ms'),
+        '{0:>14}'.format('model share'),
+    ]))
+    n_warmup = 5
+    for n_brains in brain_counts:
+        kwargs = dict(
+            backup_interval=int(1e9),
+            log_directory='/tmp/becca_brain_batch_benchmark',
+            n_actions=n_actions,
+            n_features=n_features,
+            n_sensors=n_sensors,
+        )
+        brains = [
+            Brain(brain_name='single_{0}'.format(i_brain), **kwargs)
+            for i_brain in range(n_brains)]
+        batch = BrainBatch(n_brains, brain_name='batch', **kwargs)
+
+        # Time the batched model step separately, to find its share.
+        model_time = [0.]
+        model_step = batch.model_batch.step
+
+        def timed_model_step(*args):
+            start = time.time()
+            result = model_step(*args)
+            model_time[0] += time.time() - start
+            return result
+        batch.model_batch.step = timed_model_step
+
+        rng = np.random.RandomState(0)
+        single_times = []
+        batch_times = []
+        total_model_time = 0.
+        for i_step in range(n_warmup + n_steps):
+            sensors = rng.random_sample((n_brains, n_sensors)) * (
+                rng.random_sample((n_brains, n_sensors)) < .5)
+            rewards = (rng.random_sample(n_brains) < .1).astype(float)
+
+            start = time.time()
+            for brain, brain_sensors, reward in zip(
+                    brains, sensors, rewards):
+                brain.sense_act_learn(brain_sensors, reward)
+            single_time = time.time() - start
+
+            model_time[0] = 0.
+            start = time.time()
+            batch.sense_act_learn(sensors, rewards)
+            batch_time = time.time() - start
+
+            if i_step >= n_warmup:
+                single_times.append(single_time)
+                batch_times.append(batch_time)
+                total_model_time += model_time[0]
+
+        print(' '.join([
+            '{0:>10}'.format(n_brains),
+            '{0:>14.3f}'.format(np.median(single_times) * 1e3),
+            '{0:>14.3f}'.format(np.median(batch_times) * 1e3),
+            '{0:>14.1%}'.format(total_model_time / np.sum(batch_times)),
+        ]))
+
+
+if __name__ == '__main__':
+    benchmark()
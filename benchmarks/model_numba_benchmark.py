@@ -0,0 +1,515 @@
+"""
+Compare alternative versions of the model kernels.
+
+Run from the root of the repository:
+
+    python -m benchmarks.model_numba_benchmark
+
+benchmark() compares the active-set kernels against the full-scan kernels.
+For each combination of feature count and activity level, it times
+model_numba.update_sequences against update_sequences_active and
+model_numba.predict_features against predict_features_active,
+and checks that both versions give the same sequence counts.
+The time to gather the active indices is included in the active-set times.
+
+benchmark_fused_kernels() times the prefix updates and the reward and
+curiosity predictions, made by the separate kernels and by the fused
+update_and_predict kernel, and checks that both give identical results.
+benchmark_fused() does the same for the whole of Model.step.
+Measured on a single core, the fused kernel is no faster up to
+256 features. From 512 to 2048 features, where the prefix arrays
+no longer stay in cache between passes, it is 5 to 30% faster.
+Feature prediction and sequence updates take most of each step,
+though, so Model.step takes about as long either way, within
+the noise, at every size tried.
+
+benchmark_batch() compares stepping many small models one at a time
+against stepping them together as a ModelBatch.
+"""
+
+from __future__ import print_function
+import time
+
+import numpy as np
+
+import becca.model_numba as nb
+from becca.model import Model
+from becca.model_batch import ModelBatch
+
+
+def make_state(n_features, activity_fraction, seed=0):
+    """
+    Create a random set of model arrays with a given fraction of activity.
+
+    Parameters
+    ----------
+    n_features: int
+    activity_fraction: float
+        The fraction of features and prefixes that are active.
+    seed: int
+
+    Returns
+    -------
+    feature_activities: array of floats
+    prefix_activities,
+    prefix_occurrences: 2D array of floats
+    sequence_occurrences: 3D array of floats
+    """
+    rng = np.random.RandomState(seed)
+    feature_activities = rng.random_sample(n_features) * (
+        rng.random_sample(n_features) < activity_fraction)
+    prefix_activities = rng.random_sample((n_features, n_features)) * (
+        rng.random_sample((n_features, n_features)) < activity_fraction)
+    prefix_occurrences = 1 + 10 * rng.random_sample((n_features, n_features))
+    sequence_occurrences = np.ones((n_features, n_features, n_features))
+    return (feature_activities, prefix_activities,
+            prefix_occurrences, sequence_occurrences)
+
+
+def time_call(function, args, n_repeats):
+    """
+    Find the average time it takes to call function(*args), in seconds.
+    """
+    # Call once first so that numba compilation isn't timed.
+    function(*args)
+    start = time.time()
+    for _ in range(n_repeats):
+        function(*args)
+    return (time.time() - start) / n_repeats
+
+
+def benchmark(
+    feature_counts=(64, 128, 256),
+    activity_fractions=(.01, .05, .2, 1.),
+    n_repeats=5,
+):
+    """
+    Time the full-scan and active-set kernels and print a table.
+
+    Parameters
+    ----------
+    feature_counts: tuple of ints
+    activity_fractions: tuple of floats
+    n_repeats: int
+        How many times to call each kernel when timing it.
+    """
+    print(' '.join([
+        '{0:>10}'.format('features'),
+        '{0:>10}'.format('activity'),
+        '{0:>14}'.format('sequences ms'),
+        '{0:>14}'.format('active ms'),
+        '{0:>14}'.format('predict ms'),
+        '{0:>14}'.format('active ms'),
+    ]))
+    for n_features in feature_counts:
+        for activity_fraction in activity_fractions:
+            (feature_activities,
+             prefix_activities,
+             prefix_occurrences,
+             sequence_occurrences) = make_state(
+                 n_features, activity_fraction)
+            sequence_occurrences_active = sequence_occurrences.copy()
+            conditional_predictions = np.zeros((n_features, n_features))
+
+            i_active_features = nb.find_active_features(feature_activities)
+            i_prefix_features, i_prefix_goals = nb.find_active_prefixes(
+                prefix_activities)
+            # Gathering the active indices is part of the cost
+            # of the active-set kernels.
+            gather = (
+                time_call(
+                    nb.find_active_features, (feature_activities,), n_repeats)
+                + time_call(
+                    nb.find_active_prefixes, (prefix_activities,), n_repeats))
+
+            full_sequences = time_call(
+                nb.update_sequences,
+                (feature_activities,
+                 prefix_activities,
+                 sequence_occurrences),
+                n_repeats)
+            active_sequences = time_call(
+                nb.update_sequences_active,
+                (i_active_features,
+                 i_prefix_features,
+                 i_prefix_goals,
+                 feature_activities,
+                 prefix_activities,
+                 sequence_occurrences_active),
+                n_repeats) + gather
+            if not np.allclose(
+                    sequence_occurrences, sequence_occurrences_active):
+                print('Sequence counts do not match.')
+
+            full_predict = time_call(
+                nb.predict_features,
+                (feature_activities,
+                 prefix_occurrences,
+                 sequence_occurrences,
+                 conditional_predictions),
+                n_repeats)
+            active_predict = time_call(
+                nb.predict_features_active,
+                (i_active_features,
+                 feature_activities,
+                 prefix_occurrences,
+                 sequence_occurrences,
+                 conditional_predictions),
+                n_repeats) + gather
+
+            print(' '.join([
+                '{0:>10}'.format(n_features),
+                '{0:>10.2f}'.format(activity_fraction),
+                '{0:>14.3f}'.format(full_sequences * 1e3),
+                '{0:>14.3f}'.format(active_sequences * 1e3),
+                '{0:>14.3f}'.format(full_predict * 1e3),
+                '{0:>14.3f}'.format(active_predict * 1e3),
+            ]))
+
+
+def separate_passes(
+    prefix_decay_rate,
+    reward_update_rate,
+    reward,
+    curiosity_update_rate,
+    previous_feature_activities,
+    feature_activities,
+    goal_activities,
+    prefix_activities,
+    prefix_occurrences,
+    prefix_uncertainties,
+    prefix_credit,
+    prefix_rewards,
+    prefix_curiosities,
+    sequence_occurrences,
+    conditional_predictions,
+    conditional_rewards,
+    conditional_curiosities,
+):
+    """
+    Make the same updates as update_and_predict, one kernel at a time.
+
+    The arguments are the same as update_and_predict's, so that
+    the two can be timed the same way. sequence_occurrences and
+    conditional_predictions are ignored.
+    """
+    nb.update_prefixes(
+        prefix_decay_rate,
+        previous_feature_activities,
+        goal_activities,
+        prefix_activities,
+        prefix_occurrences,
+        prefix_uncertainties,
+    )
+    nb.update_rewards(
+        reward_update_rate,
+        reward,
+        prefix_credit,
+        prefix_rewards,
+    )
+    nb.update_curiosities(
+        curiosity_update_rate,
+        prefix_occurrences,
+        prefix_curiosities,
+        previous_feature_activities,
+        feature_activities,
+        goal_activities,
+        prefix_uncertainties,
+    )
+    nb.predict_rewards(
+        feature_activities,
+        prefix_rewards,
+        conditional_rewards,
+    )
+    nb.predict_curiosities(
+        feature_activities,
+        prefix_curiosities,
+        conditional_curiosities,
+    )
+
+
+def make_prefix_args(n_features, activity_fraction, seed=0):
+    """
+    Create random arguments for update_and_predict, without sequences.
+
+    Parameters
+    ----------
+    n_features: int
+    activity_fraction: float
+        The fraction of features and prefixes that are active.
+    seed: int
+
+    Returns
+    -------
+    args: list
+        The arguments to update_and_predict, in order.
+    """
+    rng = np.random.RandomState(seed)
+    shape = (n_features, n_features)
+    goal_activities = np.zeros(n_features)
+    goal_activities[rng.randint(n_features)] = 1.
+    return [
+        .5,
+        .3,
+        rng.random_sample() - .5,
+        .1,
+        rng.random_sample(n_features) * (
+            rng.random_sample(n_features) < activity_fraction),
+        rng.random_sample(n_features) * (
+            rng.random_sample(n_features) < activity_fraction),
+        goal_activities,
+        rng.random_sample(shape) * (
+            rng.random_sample(shape) < activity_fraction),
+        1 + 10 * rng.random_sample(shape),
+        rng.random_sample(shape),
+        rng.random_sample(shape) * (
+            rng.random_sample(shape) < activity_fraction),
+        rng.random_sample(shape) - .5,
+        rng.random_sample(shape),
+        None,
+        np.zeros(shape),
+        np.zeros(n_features),
+        np.zeros(n_features),
+    ]
+
+
+def benchmark_fused_kernels(
+    feature_counts=(64, 128, 256, 512, 1024, 2048),
+    activity_fraction=.05,
+):
+    """
+    Time the prefix kernels, separate and fused, and print a table.
+
+    Feature predictions are left out of both. When sequences are
+    sparse, they are made by the same kernel either way.
+
+    Parameters
+    ----------
+    feature_counts: tuple of ints
+    activity_fraction: float
+        The fraction of features and prefixes that are active.
+    """
+    print(' '.join([
+        '{0:>10}'.format('features'),
+        '{0:>14}'.format('separate ms'),
+        '{0:>14}'.format('fused ms'),
+        '{0:>10}'.format('match'),
+    ]))
+    for n_features in feature_counts:
+        n_repeats = max(3, int(2e7 / n_features ** 2))
+        results = []
+        call_times = []
+        for function in (separate_passes, nb.update_and_predict):
+            args = make_prefix_args(n_features, activity_fraction)
+            call_times.append(time_call(function, args, n_repeats))
+            results.append(args)
+        # Both have been called the same number of times,
+        # so they should have arrived at the same arrays.
+        match = all(
+            np.array_equal(separate, fused)
+            for separate, fused in zip(*results)
+            if isinstance(separate, np.ndarray))
+        print(' '.join([
+            '{0:>10}'.format(n_features),
+            '{0:>14.3f}'.format(call_times[0] * 1e3),
+            '{0:>14.3f}'.format(call_times[1] * 1e3),
+            '{0:>10}'.format(str(match)),
+        ]))
+
+
+def run_model(
+    n_features,
+    activity_fraction=.05,
+    dtype=np.float64,
+    fused=False,
+    n_steps=20,
+    storage='dense',
+):
+    """
+    Step a Model with random activities, rewards and goals.
+
+    Parameters
+    ----------
+    See benchmark_fused.
+
+    Returns
+    -------
+    model: Model
+    step_time: float
+        The average time Model.step took, in seconds.
+    """
+    model = Model(
+        dtype=dtype,
+        fused=fused,
+        n_features=n_features,
+        storage=storage,
+    )
+    # Route every candidate straight to a model input.
+    model.filter.input_mapping[:n_features] = np.arange(n_features)
+
+    rng = np.random.RandomState(0)
+    total_time = 0.
+    for _ in range(n_steps):
+        activities = rng.random_sample(n_features) * (
+            rng.random_sample(n_features) < activity_fraction)
+        reward = rng.random_sample() - .5
+        i_goal = rng.randint(model.n_features)
+        goals = np.zeros(model.n_features)
+        goals[i_goal] = 1.
+
+        start = time.time()
+        model.step(activities, reward)
+        total_time += time.time() - start
+        model.update_goals(goals, i_goal)
+    return model, total_time / n_steps
+
+
+def benchmark_fused(
+    feature_counts=(64, 128, 256),
+    activity_fraction=.05,
+    dtype=np.float64,
+    n_steps=20,
+    storage='dense',
+):
+    """
+    Time Model.step with separate and fused kernels and print a table.
+
+    Parameters
+    ----------
+    feature_counts: tuple of ints
+    activity_fraction: float
+        The fraction of features that are active at each time step.
+    dtype: numpy dtype
+    n_steps: int
+        How many time steps to run each model for.
+    storage: string
+        The Model's sequence storage, 'dense' or 'sparse'.
+        Dense sequences take n_features**3 floats, so sparse ones are
+        needed to try the larger feature counts.
+    """
+    print(' '.join([
+        '{0:>10}'.format('features'),
+        '{0:>14}'.format('separate ms'),
+        '{0:>14}'.format('fused ms'),
+        '{0:>10}'.format('match'),
+    ]))
+    for n_features in feature_counts:
+        models = []
+        step_times = []
+        for fused in (False, True):
+            # The first run is a warm-up. It includes numba compilation,
+            # which can happen part way through, when a sparse table grows.
+            for _ in range(2):
+                model, step_time = run_model(
+                    n_features,
+                    activity_fraction=activity_fraction,
+                    dtype=dtype,
+                    fused=fused,
+                    n_steps=n_steps,
+                    storage=storage,
+                )
+            models.append(model)
+            step_times.append(step_time)
+
+        match = all(
+            np.array_equal(getattr(models[0], name), getattr(models[1], name))
+            for name in (
+                'prefix_activities',
+                'prefix_occurrences',
+                'prefix_rewards',
+                'prefix_curiosities',
+                'conditional_predictions',
+                'conditional_rewards',
+                'conditional_curiosities',
+            ))
+        print(' '.join([
+            '{0:>10}'.format(n_features),
+            '{0:>14.3f}'.format(step_times[0] * 1e3),
+            '{0:>14.3f}'.format(step_times[1] * 1e3),
+            '{0:>10}'.format(str(match)),
+        ]))
+
+
+def benchmark_batch(
+    model_counts=(1, 16, 128),
+    n_features=16,
+    activity_fraction=.2,
+    n_steps=50,
+):
+    """
+    Time stepping many small models, one at a time and as a ModelBatch.
+
+    Parameters
+    ----------
+    model_counts: tuple of ints
+    n_features: int
+    activity_fraction: float
+        The fraction of features that are active at each time step.
+    n_steps: int
+        How many time steps to run the models for.
+    """
+    print(' '.join([
+        '{0:>10}'.format('models'),
+        '{0:>14}'.format('one by one ms'),
+        '{0:>14}'.format('batch ms'),
+        '{0:>10}'.format('match'),
+    ]))
+    for n_models in model_counts:
+        step_times = []
+        all_models = []
+        for batched in (False, True):
+            models = []
+            for _ in range(n_models):
+                model = Model(n_features=n_features)
+                model.filter.input_mapping[:n_features] = np.arange(
+                    n_features)
+                models.append(model)
+            if batched:
+                batch = ModelBatch(models)
+
+            rng = np.random.RandomState(0)
+            total_time = 0.
+            for i_step in range(n_steps + 1):
+                activities = rng.random_sample((n_models, n_features)) * (
+                    rng.random_sample((n_models, n_features)) <
+                    activity_fraction)
+                rewards = rng.random_sample(n_models) - .5
+                i_goals = rng.randint(n_features + 2, size=n_models)
+
+                start = time.time()
+                if batched:
+                    batch.step(activities, rewards)
+                    batch.calculate_fitness()
+                else:
+                    for model, model_activities, reward in zip(
+                            models, activities, rewards):
+                        model.step(model_activities, reward)
+                        model.calculate_fitness()
+                # Don't time the first step. It includes numba compilation.
+                if i_step > 0:
+                    total_time += time.time() - start
+                for model, i_goal in zip(models, i_goals):
+                    goals = np.zeros(n_features + 2)
+                    goals[i_goal] = 1.
+                    model.update_goals(goals, i_goal)
+            all_models.append(models)
+            step_times.append(total_time / n_steps)
+
+        match = all(
+            np.array_equal(one.conditional_predictions,
+                           other.conditional_predictions) and
+            np.array_equal(one.prefix_rewards, other.prefix_rewards)
+            for one, other in zip(*all_models))
+        print(' '.join([
+            '{0:>10}'.format(n_models),
+            '{0:>14.3f}'.format(step_times[0] * 1e3),
+            '{0:>14.3f}'.format(step_times[1] * 1e3),
+            '{0:>10}'.format(str(match)),
+        ]))
+
+
+if __name__ == '__main__':
+    benchmark()
+    benchmark_fused_kernels()
+    benchmark_fused()
+    benchmark_batch()
@@ -0,0 +1,149 @@
+"""
+Check that the Planner keeps to its time budget.
+
+Run from the root of the repository:
+
+    python -m benchmarks.planner_benchmark
+
+A Model is trained on random activities, goals and rewards,
+and the Planner is called after every step, the way Brain calls it.
+The time each call to Planner.plan takes is recorded, including
+the first ones, which build the first transition graph.
+The typical, 99th percentile and longest calls, and the number of
+calls that went over the budget, are printed. If more than a small
+fraction of the calls take longer than tolerance times the budget,
+the script exits with a non-zero status, so that it can be used
+as a regression check. A few calls are allowed to, because the
+operating system can pause any process for a millisecond or more.
+"""
+
+from __future__ import print_function
+import sys
+import time
+
+import numpy as np
+
+from becca.model import Model
+from becca.planner import Planner
+
+
+def run(
+    n_features,
+    storage,
+    activity_fraction=.05,
+    n_steps=300,
+    seed=0,
+    time_budget=1e-3,
+):
+    """
+    Train a model and time each call to the planner.
+
+    Parameters
+    ----------
+    n_features: int
+    storage: string
+        The Model's sequence storage, 'dense' or 'sparse'.
+    activity_fraction: float
+        The fraction of features that are active at each time step.
+    n_steps: int
+    seed: int
+    time_budget: float
+        The Planner's time budget, in seconds.
+
+    Returns
+    -------
+    plan_times: array of floats
+        How long each call to Planner.plan took, in seconds.
+    planner: Planner
+    """
+    model = Model(n_features=n_features, storage=storage)
+    # Route every candidate straight to a model input.
+    model.filter.input_mapping[:n_features] = np.arange(n_features)
+    planner = Planner(model, time_budget=time_budget)
+
+    rng = np.random.RandomState(seed)
+    plan_times = np.zeros(n_steps)
+    for i_step in range(n_steps):
+        activities = rng.random_sample(n_features) * (
+            rng.random_sample(n_features) < activity_fraction)
+        reward = rng.random_sample() - .5
+        model.step(activities, reward)
+
+        start = time.time()
+        conditional_rewards = planner.plan(model.feature_activities)
+        plan_times[i_step] = time.time() - start
+
+        i_goal = int(np.argmax(conditional_rewards))
+        goals = np.zeros(model.n_features)
+        goals[i_goal] = 1.
+        model.update_goals(goals, i_goal)
+    return plan_times, planner
+
+
+def check_time_budget(
+    max_overrun_fraction=.01,
+    runs=((500, 'sparse'), (150, 'dense')),
+    time_budget=1e-3,
+    tolerance=2.,
+    **kwargs
+):
+    """
+    Time the planner and report whether it kept to its budget.
+
+    Parameters
+    ----------
+    max_overrun_fraction: float
+        The fraction of calls that may take longer than
+        tolerance * time_budget.
+    runs: tuple of (int, string) tuples
+        The feature count and sequence storage of each Model to try.
+    time_budget: float
+    tolerance: float
+        How many times longer than the budget a call may take.
+        Every call does at least a little work, and the work
+        is only estimated, so a call can go over the budget
+        by a small amount.
+    kwargs
+        Passed on to run().
+
+    Returns
+    -------
+    passed: boolean
+        True if few enough calls took longer than
+        tolerance * time_budget.
+    """
+    print(' '.join([
+        '{0:>10}'.format('features'),
+        '{0:>8}'.format('storage'),
+        '{0:>10}'.format('median ms'),
+        '{0:>10}'.format('99% ms'),
+        '{0:>10}'.format('max ms'),
+        '{0:>10}'.format('over'),
+        '{0:>10}'.format('planned'),
+    ]))
+    passed = True
+    for n_features, storage in runs:
+        plan_times, planner = run(
+            n_features, storage, time_budget=time_budget, **kwargs)
+        print(' '.join([
+            '{0:>10}'.format(n_features),
+            '{0:>8}'.format(storage),
+            '{0:>10.3f}'.format(np.median(plan_times) * 1e3),
+            '{0:>10.3f}'.format(np.percentile(plan_times, 99) * 1e3),
+            '{0:>10.3f}'.format(np.max(plan_times) * 1e3),
+            '{0:>10}'.format(np.sum(plan_times > time_budget)),
+            '{0:>10}'.format(str(planner.is_planned)),
+        ]))
+        overrun_fraction = np.mean(plan_times > tolerance * time_budget)
+        if overrun_fraction > max_overrun_fraction:
+            print('FAILED: {0:.1%} of calls to plan() took'.format(
+                overrun_fraction),
+                'more than {0} times the {1:.3f} ms budget.'.format(
+                    tolerance, time_budget * 1e3))
+            passed = False
+    return passed
+
+
+if __name__ == '__main__':
+    if not check_time_budget():
+        sys.exit(1)
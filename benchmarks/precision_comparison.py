@@ -0,0 +1,175 @@
+"""
+Check that a single precision Model learns as well as a double precision one.
+
+Run from the root of the repository:
+
+    python -m benchmarks.precision_comparison
+
+Two Models, one with dtype=np.float64 and one with dtype=np.float32,
+are trained side by side in the same small world.
+The world has n_states states, each represented by one feature.
+On each time step the model chooses one of the features as a goal.
+If the goal is the one that is rewarded in the current state,
+a reward of 1 is delivered on the next time step.
+The reward curves of the two models, and the largest difference
+between their learned prefix rewards, are printed.
+If either difference is larger than its tolerance, the script
+exits with a non-zero status, so that it can be used as a
+regression check.
+"""
+
+from __future__ import print_function
+import sys
+import time
+
+import numpy as np
+
+from becca.model import Model
+
+
+def make_model(n_states, dtype):
+    """
+    Create a Model that sees the world's states directly.
+
+    Parameters
+    ----------
+    n_states: int
+    dtype: numpy dtype
+
+    Returns
+    -------
+    model: Model
+    """
+    model = Model(dtype=dtype, n_features=n_states)
+    # Route each state straight through to a model feature,
+    # rather than waiting for the input filter to select them.
+    model.filter.input_mapping[:n_states] = np.arange(n_states)
+    return model
+
+
+def run(
+    dtype,
+    exploration=.1,
+    n_states=12,
+    n_steps=4000,
+    seed=0,
+):
+    """
+    Train a model in the world and record the reward it collects.
+
+    Parameters
+    ----------
+    dtype: numpy dtype
+    exploration: float
+        The fraction of time steps on which a random goal is chosen.
+    n_states: int
+    n_steps: int
+    seed: int
+        Both precisions are run with the same seed, so that they
+        see the same world and make the same random choices.
+
+    Returns
+    -------
+    rewards: array of floats
+        The reward received on each time step.
+    model: Model
+    """
+    rng = np.random.RandomState(seed)
+    target = rng.randint(n_states, size=n_states)
+    model = make_model(n_states, dtype)
+    rewards = np.zeros(n_steps)
+    reward = 0.
+    state = 0
+    for i_step in range(n_steps):
+        activities = np.zeros(n_states)
+        activities[state] = 1.
+        (_, conditional_rewards, conditional_curiosities) = model.step(
+            activities, reward)
+
+        # Choose a goal greedily from among the state features.
+        # The first two model features are internal and are skipped.
+        votes = (conditional_rewards + conditional_curiosities)[2:]
+        if rng.random_sample() < exploration:
+            i_goal = rng.randint(n_states)
+        else:
+            i_goal = np.argmax(votes)
+        goals = np.zeros(n_states + 2)
+        goals[i_goal + 2] = 1.
+        model.update_goals(goals, i_goal + 2)
+        model.calculate_fitness()
+
+        reward = 1. if i_goal == target[state] else 0.
+        rewards[i_step] = reward
+        state = rng.randint(n_states)
+    return rewards, model
+
+
+def compare(
+    n_blocks=10,
+    prefix_reward_tolerance=1e-4,
+    reward_tolerance=.02,
+    **kwargs
+):
+    """
+    Run both precisions and report how closely they agree.
+
+    Parameters
+    ----------
+    n_blocks: int
+        The number of blocks to average the reward curves over.
+    prefix_reward_tolerance: float
+        The largest acceptable difference in any learned prefix reward.
+    reward_tolerance: float
+        The largest acceptable difference in average reward per block.
+    kwargs
+        Passed on to run().
+
+    Returns
+    -------
+    passed: boolean
+        True if both differences are within their tolerances.
+    """
+    results = {}
+    for dtype in (np.float64, np.float32):
+        start = time.time()
+        rewards, model = run(dtype, **kwargs)
+        results[dtype] = (rewards, model, time.time() - start)
+
+    rewards_64, model_64, time_64 = results[np.float64]
+    rewards_32, model_32, time_32 = results[np.float32]
+    curve_64 = np.mean(np.array_split(rewards_64, n_blocks), axis=1)
+    curve_32 = np.mean(np.array_split(rewards_32, n_blocks), axis=1)
+
+    print('{0:>8} {1:>14} {2:>14}'.format('block', 'float64', 'float32'))
+    for i_block in range(n_blocks):
+        print('{0:>8} {1:>14.3f} {2:>14.3f}'.format(
+            i_block, curve_64[i_block], curve_32[i_block]))
+    print('total run time: float64 {0:.2f} s, float32 {1:.2f} s'.format(
+        time_64, time_32))
+    reward_difference = np.max(np.abs(curve_64 - curve_32))
+    prefix_reward_difference = np.max(np.abs(
+        model_64.prefix_rewards -
+        model_32.prefix_rewards.astype(np.float64)))
+    print('largest difference in average reward per block: {0:.4f}'.format(
+        reward_difference))
+    print('largest difference in prefix rewards: {0:.2e}'.format(
+        prefix_reward_difference))
+    print('sequence bytes: float64 {0}, float32 {1}'.format(
+        model_64.sequence_occurrences.nbytes,
+        model_32.sequence_occurrences.nbytes))
+
+    passed = True
+    if reward_difference > reward_tolerance:
+        print('FAILED: reward curves differ by more than {0}'.format(
+            reward_tolerance))
+        passed = False
+    if prefix_reward_difference > prefix_reward_tolerance:
+        print('FAILED: prefix rewards differ by more than {0}'.format(
+            prefix_reward_tolerance))
+        passed = False
+    return passed
+
+
+if __name__ == '__main__':
+    if not compare():
+        sys.exit(1)
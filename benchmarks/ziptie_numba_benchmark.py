@@ -0,0 +1,147 @@
+"""
+Compare alternative versions of the ziptie kernels.
+
+Run from the root of the repository:
+
+    python -m benchmarks.ziptie_numba_benchmark
+
+For each cable count, it times ziptie_numba.nucleation_energy_gather
+against nucleation_energy_gather_active and
+agglomeration_energy_gather against agglomeration_energy_gather_active,
+and checks that both versions accumulate the same energy.
+The full-scan times include finding the maximum energy with max_2d.
+The active-index times include finding the active indices and keeping
+the running maximum.
+"""
+
+from __future__ import print_function
+import time
+
+import numpy as np
+
+import becca.ziptie_numba as nb
+
+
+def sparse_activities(n_elements, activity_fraction, rng):
+    """
+    Create activities with a given fraction of non-zero elements.
+
+    Parameters
+    ----------
+    n_elements: int
+    activity_fraction: float
+    rng: numpy RandomState
+
+    Returns
+    -------
+    activities: array of floats
+    """
+    return rng.random_sample(n_elements) * (
+        rng.random_sample(n_elements) < activity_fraction)
+
+
+def time_steps(function, n_steps):
+    """
+    Find the average time of a function over several time steps.
+
+    Parameters
+    ----------
+    function: callable
+        Called with the time step index.
+    n_steps: int
+
+    Returns
+    -------
+    step_time: float
+        The average time per step, in seconds.
+    """
+    # Call it once beforehand, so that numba compilation isn't timed.
+    function(0)
+    start = time.time()
+    for i_step in range(n_steps):
+        function(i_step)
+    return (time.time() - start) / n_steps
+
+
+def benchmark(
+    cable_counts=(64, 512, 4096),
+    activity_fraction=.02,
+    n_steps=20,
+):
+    """
+    Time the energy gathering kernels and print a table.
+
+    Parameters
+    ----------
+    cable_counts: tuple of ints
+        The number of cables. The number of bundles is the same.
+    activity_fraction: float
+        The fraction of cables and bundles that are active.
+    n_steps: int
+        The number of time steps to average over.
+    """
+    print(' '.join([
+        '{0:>8}'.format('cables'),
+        '{0:>18}'.format('nucleation ms'),
+        '{0:>18}'.format('nuc. active ms'),
+        '{0:>18}'.format('agglomeration ms'),
+        '{0:>18}'.format('agg. active ms'),
+        '{0:>8}'.format('match'),
+    ]))
+    for n_cables in cable_counts:
+        rng = np.random.RandomState(0)
+        cable_steps = [
+            sparse_activities(n_cables, activity_fraction, rng)
+            for _ in range(n_steps)]
+        bundle_steps = [
+            sparse_activities(n_cables, activity_fraction, rng)
+            for _ in range(n_steps)]
+        mask = rng.random_sample((n_cables, n_cables)) < .9
+
+        full_nucleation = np.zeros((n_cables, n_cables))
+        active_nucleation = np.zeros((n_cables, n_cables))
+        full_agglomeration = np.zeros((n_cables, n_cables))
+        active_agglomeration = np.zeros((n_cables, n_cables))
+        # The maximum energies, in the order full nucleation,
+        # active nucleation, full agglomeration, active agglomeration.
+        max_energies = [(0., -1, -1)] * 4
+
+        def nucleate(i_step):
+            nb.nucleation_energy_gather(
+                cable_steps[i_step], full_nucleation, mask)
+            max_energies[0] = nb.max_2d(full_nucleation)
+
+        def nucleate_active(i_step):
+            cables = cable_steps[i_step]
+            max_energies[1] = nb.nucleation_energy_gather_active(
+                nb.find_active(cables), cables, active_nucleation, mask,
+                *max_energies[1])
+
+        def agglomerate(i_step):
+            nb.agglomeration_energy_gather(
+                bundle_steps[i_step], cable_steps[i_step], n_cables,
+                full_agglomeration, mask)
+            max_energies[2] = nb.max_2d(full_agglomeration)
+
+        def agglomerate_active(i_step):
+            bundles = bundle_steps[i_step]
+            cables = cable_steps[i_step]
+            max_energies[3] = nb.agglomeration_energy_gather_active(
+                nb.find_active(bundles), nb.find_active(cables),
+                bundles, cables, active_agglomeration, mask,
+                *max_energies[3])
+
+        times = [time_steps(function, n_steps) for function in (
+            nucleate, nucleate_active, agglomerate, agglomerate_active)]
+        match = (np.array_equal(full_nucleation, active_nucleation) and
+                 np.array_equal(full_agglomeration, active_agglomeration) and
+                 tuple(max_energies[0]) == tuple(max_energies[1]) and
+                 tuple(max_energies[2]) == tuple(max_energies[3]))
+        print(' '.join(
+            ['{0:>8}'.format(n_cables)] +
+            ['{0:>18.4f}'.format(step_time * 1e3) for step_time in times] +
+            ['{0:>8}'.format(str(match))]))
+
+
+if __name__ == '__main__':
+    benchmark()